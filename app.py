@@ -21,10 +21,22 @@ st.set_page_config(
 try:
     from utils.auth import init_session_state
     from utils.db import init_database
+    from utils.warmup import start_warmup
+    from utils.outbox import start_outbox_worker
+    from utils.chatbot import init_tracing
+    
+    # Span exporters for per-stage latency (before anything is traced)
+    init_tracing()
     
     # Initialize database tables
     init_database()
     
+    # Load the embedding model and index in the background
+    start_warmup()
+    
+    # Deliver queued emails in the background
+    start_outbox_worker()
+    
     # Initialize session state
     init_session_state()
     
@@ -3,7 +3,7 @@ Complete User Profile Page
 """
 import streamlit as st
 from datetime import date
-from utils.db import get_session, User, UserProfile, UserClinicalInfo, get_karachi_time
+from utils.db import get_session, UserProfile, UserClinicalInfo, invalidate_user_profile
 
 # Styling
 st.markdown("""
@@ -222,6 +222,7 @@ def save_complete_profile(user_id: int, personal_info: dict, clinical_info: dict
             session.add(clinical)
         
         session.commit()
+        invalidate_user_profile(user_id)
         return {"success": True, "message": "Profile saved successfully"}
         
     except Exception as e:
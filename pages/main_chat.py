@@ -4,9 +4,18 @@ Main Chat Interface with RAG Chatbot - FIXED VERSION
 import streamlit as st
 from datetime import datetime
 import html
-from utils.db import get_session, ChatSession, ChatMessage, get_karachi_time, get_user_profile_dict
+from utils.db import get_session, ChatSession, ChatMessage, Appointment, get_karachi_time
 from utils.auth import logout
-from utils.chatbot import handle_chat_message
+from utils.chatbot import handle_chat_message_stream
+from utils.warmup import is_chatbot_ready
+from utils.availability import cancel_appointment
+from sqlalchemy import or_, and_
+
+# Keyset page sizes; older pages load on demand
+SESSIONS_PAGE_SIZE = 20
+MESSAGES_PAGE_SIZE = 30
+# Renders to wait for a generated session title before keeping the heuristic one
+TITLE_REFRESH_ATTEMPTS = 3
 
 # Styling
 st.markdown("""
@@ -156,10 +165,21 @@ def show():
         st.session_state.current_session_id = None
     if 'chat_sessions' not in st.session_state:
         st.session_state.chat_sessions = []
+    if 'chat_sessions_loaded' not in st.session_state:
+        st.session_state.chat_sessions_loaded = False
+        st.session_state.chat_sessions_cursor = None
+        st.session_state.chat_sessions_has_more = False
+        st.session_state.pending_titles = {}
     if 'current_messages' not in st.session_state:
         st.session_state.current_messages = []
+        st.session_state.current_messages_cursor = None
+        st.session_state.current_messages_has_more = False
     if 'waiting_for_response' not in st.session_state:
         st.session_state.waiting_for_response = False
+    if 'upcoming_appointments' not in st.session_state:
+        # None means "load on next render"
+        st.session_state.upcoming_appointments = None
+        st.session_state.confirm_cancel_id = None
     
     # Render sidebar
     render_sidebar()
@@ -178,9 +198,13 @@ def render_sidebar():
         
         st.markdown("---")
         
-        # Load sessions if not already loaded
-        if not st.session_state.chat_sessions:
+        render_appointments()
+        
+        # Load the first page once; later changes are applied incrementally
+        if not st.session_state.chat_sessions_loaded:
             load_chat_sessions()
+        elif st.session_state.pending_titles:
+            refresh_pending_titles()
         
         if st.session_state.chat_sessions:
             st.markdown("#### 💬 Chat History")
@@ -199,9 +223,48 @@ def render_sidebar():
                     type=button_type
                 ):
                     load_session_messages(session['id'])
+            
+            if st.session_state.chat_sessions_has_more:
+                if st.button("Show older chats", use_container_width=True, key="older_sessions_btn"):
+                    load_chat_sessions(older=True)
+                    st.rerun()
         else:
             st.info("No chat history yet")
 
+def render_appointments():
+    """Upcoming appointments with a two-step cancel; cancelling frees the slot for other patients"""
+    if st.session_state.upcoming_appointments is None:
+        load_upcoming_appointments()
+    if not st.session_state.upcoming_appointments:
+        return
+    
+    st.markdown("#### 📅 Upcoming Appointments")
+    for appt in st.session_state.upcoming_appointments:
+        st.caption(f"{appt['when']}\n\n{appt['treatment']} with {appt['dentist']}, {appt['branch']}")
+        if st.session_state.confirm_cancel_id != appt['id']:
+            if st.button("Cancel appointment", key=f"cancel_appt_{appt['id']}", use_container_width=True):
+                st.session_state.confirm_cancel_id = appt['id']
+                st.rerun()
+            continue
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("Confirm", key=f"confirm_cancel_{appt['id']}", use_container_width=True, type="primary"):
+                result = cancel_appointment(st.session_state.user_id, appt['id'])
+                st.session_state.confirm_cancel_id = None
+                st.session_state.upcoming_appointments = None
+                if result['success']:
+                    st.toast("Appointment cancelled")
+                else:
+                    st.toast(f"Could not cancel: {result.get('error')}")
+                st.rerun()
+        with col2:
+            if st.button("Keep", key=f"keep_appt_{appt['id']}", use_container_width=True):
+                st.session_state.confirm_cancel_id = None
+                st.rerun()
+    
+    st.markdown("---")
+
 def render_chat_area():
     """Render main chat area"""
     col1, col2 = st.columns([6, 1])
@@ -226,14 +289,17 @@ def render_chat_area():
     
     st.markdown("---")
     
+    if not is_chatbot_ready():
+        st.caption("⏳ Assistant is warming up, answers may be less precise for a moment.")
+    
     # Display messages
-    render_messages()
+    pending_slot = render_messages()
     
     # Chat input
-    render_chat_input()
+    render_chat_input(pending_slot)
 
 def render_messages():
-    """Render chat messages with improved styling"""
+    """Render chat messages with improved styling; returns the slot for a pending reply"""
     chat_container = st.container()
     
     with chat_container:
@@ -246,6 +312,11 @@ def render_messages():
             </div>
             """, unsafe_allow_html=True)
         else:
+            if st.session_state.current_messages_has_more:
+                if st.button("Load older messages", key="older_messages_btn"):
+                    load_older_messages()
+                    st.rerun()
+            
             for msg in st.session_state.current_messages:
                 is_user = msg['role'] == 'user'
                 time_str = format_timestamp(msg.get('timestamp', ''))
@@ -272,8 +343,9 @@ def render_messages():
                     </div>
                     """, unsafe_allow_html=True)
         
+        pending_slot = st.empty()
         if st.session_state.waiting_for_response:
-            st.markdown("""
+            pending_slot.markdown("""
             <div style='display: flex; justify-content: flex-start; margin-bottom: 24px;'>
                 <div style='display: flex; align-items: center; gap: 6px; padding: 12px 20px; background: #2d2d2d; border: 1px solid #3d3d3d; border-radius: 18px; max-width: 80px; border-bottom-left-radius: 4px;'>
                     <div class='typing-dot'></div>
@@ -282,8 +354,10 @@ def render_messages():
                 </div>
             </div>
             """, unsafe_allow_html=True)
+    
+    return pending_slot
 
-def render_chat_input():
+def render_chat_input(pending_slot):
     """Render chat input form"""
     with st.form(key="chat_form", clear_on_submit=True):
         col1, col2 = st.columns([5, 1])
@@ -310,7 +384,7 @@ def render_chat_input():
     
     # Handle bot response
     if st.session_state.waiting_for_response:
-        get_bot_response()
+        get_bot_response(pending_slot)
         st.rerun()
 
 def format_timestamp(timestamp_str: str) -> str:
@@ -321,50 +395,157 @@ def format_timestamp(timestamp_str: str) -> str:
     except:
         return ""
 
-def load_chat_sessions():
-    """Load chat history from database"""
+def _session_dict(s: ChatSession) -> dict:
+    return {
+        "id": s.id,
+        "title": s.title,
+        "created_at": s.created_at.isoformat(),
+        "updated_at": s.updated_at.isoformat() if hasattr(s, 'updated_at') else s.created_at.isoformat()
+    }
+
+def load_chat_sessions(older: bool = False):
+    """Load the newest page of chat sessions, or the page after the last one shown"""
     session = get_session()
     try:
-        sessions = session.query(ChatSession).filter(
+        query = session.query(ChatSession).filter(
             ChatSession.user_id == st.session_state.user_id
-        ).order_by(ChatSession.created_at.desc()).all()
+        )
+        cursor = st.session_state.chat_sessions_cursor if older else None
+        if cursor:
+            created_at, session_id = cursor
+            query = query.filter(or_(
+                ChatSession.created_at < created_at,
+                and_(ChatSession.created_at == created_at, ChatSession.id < session_id)
+            ))
+        sessions = query.order_by(
+            ChatSession.created_at.desc(), ChatSession.id.desc()
+        ).limit(SESSIONS_PAGE_SIZE + 1).all()
         
-        st.session_state.chat_sessions = [
-            {
-                "id": s.id,
-                "title": s.title,
-                "created_at": s.created_at.isoformat(),
-                "updated_at": s.updated_at.isoformat() if hasattr(s, 'updated_at') else s.created_at.isoformat()
-            }
-            for s in sessions
-        ]
+        has_more = len(sessions) > SESSIONS_PAGE_SIZE
+        sessions = sessions[:SESSIONS_PAGE_SIZE]
+        page = [_session_dict(s) for s in sessions]
+        
+        st.session_state.chat_sessions = (st.session_state.chat_sessions + page) if older else page
+        if sessions:
+            st.session_state.chat_sessions_cursor = (sessions[-1].created_at, sessions[-1].id)
+        elif not older:
+            st.session_state.chat_sessions_cursor = None
+        st.session_state.chat_sessions_has_more = has_more
+        st.session_state.chat_sessions_loaded = True
     finally:
         session.close()
 
-def load_session_messages(session_id: int):
-    """Load messages for a specific session"""
+def load_upcoming_appointments():
+    """Scheduled appointments from today on, soonest first"""
     session = get_session()
     try:
-        messages = session.query(ChatMessage).filter(
-            ChatMessage.session_id == session_id
-        ).order_by(ChatMessage.timestamp.asc()).all()
-        
-        st.session_state.current_messages = [
+        appointments = session.query(Appointment).filter(
+            Appointment.user_id == st.session_state.user_id,
+            Appointment.appointment_date >= get_karachi_time().date(),
+            Appointment.status == 'scheduled'
+        ).order_by(Appointment.appointment_date, Appointment.appointment_time).all()
+        st.session_state.upcoming_appointments = [
             {
-                'role': msg.role,
-                'message': msg.message,
-                'timestamp': msg.timestamp.isoformat()
+                "id": appt.id,
+                "when": f"{appt.appointment_date.strftime('%a, %b %d')} at {appt.appointment_time.strftime('%I:%M %p')}",
+                "branch": appt.branch,
+                "dentist": appt.dentist,
+                "treatment": appt.treatment_type
             }
-            for msg in messages
+            for appt in appointments
         ]
-        st.session_state.current_session_id = session_id
     finally:
         session.close()
 
+def touch_chat_session(session_id: int, title: str, timestamp: str):
+    """Apply a reply to the sidebar without reloading it: prepend a new session or update its entry"""
+    for entry in st.session_state.chat_sessions:
+        if entry['id'] == session_id:
+            entry['title'] = title
+            if timestamp:
+                entry['updated_at'] = timestamp
+            return
+    # Sessions are listed by creation time, so a new one always goes first
+    st.session_state.chat_sessions.insert(0, {
+        "id": session_id,
+        "title": title,
+        "created_at": timestamp,
+        "updated_at": timestamp
+    })
+
+def refresh_pending_titles():
+    """Pick up generated titles for new sessions still showing their heuristic title"""
+    pending = st.session_state.pending_titles
+    session = get_session()
+    try:
+        rows = session.query(ChatSession.id, ChatSession.title).filter(
+            ChatSession.id.in_(list(pending))
+        ).all()
+    finally:
+        session.close()
+    
+    titles = dict(rows)
+    for session_id in list(pending):
+        entry = pending[session_id]
+        entry['checks'] += 1
+        title = titles.get(session_id)
+        if title and title != entry['title']:
+            touch_chat_session(session_id, title, None)
+            del pending[session_id]
+        elif title is None or entry['checks'] >= TITLE_REFRESH_ATTEMPTS:
+            del pending[session_id]
+
+def _fetch_messages(session_id: int, before=None) -> list:
+    """One page of messages, newest first, strictly older than the (timestamp, id) cursor"""
+    session = get_session()
+    try:
+        query = session.query(ChatMessage).filter(ChatMessage.session_id == session_id)
+        if before:
+            timestamp, message_id = before
+            query = query.filter(or_(
+                ChatMessage.timestamp < timestamp,
+                and_(ChatMessage.timestamp == timestamp, ChatMessage.id < message_id)
+            ))
+        return query.order_by(
+            ChatMessage.timestamp.desc(), ChatMessage.id.desc()
+        ).limit(MESSAGES_PAGE_SIZE + 1).all()
+    finally:
+        session.close()
+
+def _apply_message_page(messages: list, prepend: bool):
+    has_more = len(messages) > MESSAGES_PAGE_SIZE
+    messages = messages[:MESSAGES_PAGE_SIZE]
+    page = [
+        {
+            'role': msg.role,
+            'message': msg.message,
+            'timestamp': msg.timestamp.isoformat()
+        }
+        for msg in reversed(messages)
+    ]
+    st.session_state.current_messages = (page + st.session_state.current_messages) if prepend else page
+    if messages:
+        st.session_state.current_messages_cursor = (messages[-1].timestamp, messages[-1].id)
+    st.session_state.current_messages_has_more = has_more
+
+def load_session_messages(session_id: int):
+    """Load the most recent page of messages for a session"""
+    st.session_state.current_messages_cursor = None
+    _apply_message_page(_fetch_messages(session_id), prepend=False)
+    st.session_state.current_session_id = session_id
+
+def load_older_messages():
+    """Prepend the page of messages before the oldest one shown"""
+    if st.session_state.current_session_id and st.session_state.current_messages_cursor:
+        messages = _fetch_messages(st.session_state.current_session_id, st.session_state.current_messages_cursor)
+        _apply_message_page(messages, prepend=True)
+
 def start_new_chat():
     """Start a new chat session"""
     st.session_state.current_session_id = None
     st.session_state.current_messages = []
+    st.session_state.current_messages_cursor = None
+    st.session_state.current_messages_has_more = False
 
 def send_message(message: str):
     """Add user message to chat"""
@@ -379,13 +560,13 @@ def send_message(message: str):
     st.session_state.current_messages.append(user_msg)
     st.session_state.waiting_for_response = True
 
-def get_bot_response():
-    """Get bot response and save to database"""
+def get_bot_response(pending_slot):
+    """Stream bot response into the pending slot; the reply is saved to the database once complete"""
     if st.session_state.waiting_for_response and st.session_state.current_messages:
         last_msg = st.session_state.current_messages[-1]
         if last_msg['role'] == 'user':
             # Handle chat message
-            result = handle_chat_message(
+            result = handle_chat_message_stream(
                 st.session_state.user_id,
                 last_msg['message'],
                 st.session_state.current_session_id
@@ -393,14 +574,23 @@ def get_bot_response():
             
             if result['success']:
                 st.session_state.current_session_id = result['session_id']
+                with pending_slot.container():
+                    bot_response = st.write_stream(result['stream'])
                 bot_msg = {
                     'role': 'bot',
-                    'message': result['bot_response'],
+                    'message': bot_response.strip() if isinstance(bot_response, str) else str(bot_response),
                     'timestamp': result['timestamp']
                 }
                 st.session_state.current_messages.append(bot_msg)
-                load_chat_sessions()
+                # The reply may have booked an appointment
+                st.session_state.upcoming_appointments = None
+                touch_chat_session(result['session_id'], result['session_title'], result['timestamp'])
+                if result.get('title_pending'):
+                    st.session_state.pending_titles[result['session_id']] = {
+                        'title': result['session_title'],
+                        'checks': 0
+                    }
             else:
                 st.error(f"Error: {result.get('error')}")
             
-            st.session_state.waiting_for_response = False
\ No newline at end of file
+            st.session_state.waiting_for_response = False
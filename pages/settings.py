@@ -2,8 +2,8 @@
 User Settings Page - Profile & Password Management
 """
 import streamlit as st
-from datetime import datetime, date
-from utils.db import get_session, User, UserProfile, UserClinicalInfo
+from datetime import datetime
+from utils.db import get_session, get_pool_stats, User, UserProfile, UserClinicalInfo, invalidate_user_profile
 from utils.auth import change_password
 
 st.markdown("""
@@ -219,9 +219,78 @@ def show():
                         st.error(result.get('error'))
         st.markdown('</div>', unsafe_allow_html=True)
         
+        if is_admin(user.email):
+            show_performance()
+        
     finally:
         session.close()
 
+def is_admin(email: str) -> bool:
+    """ADMIN_EMAILS secret: a list or a comma-separated string"""
+    admins = st.secrets.get('ADMIN_EMAILS', [])
+    if isinstance(admins, str):
+        admins = admins.split(',')
+    return (email or '').strip().lower() in {a.strip().lower() for a in admins if a.strip()}
+
+def show_performance():
+    """Admin-only latency per traced stage and database pool usage for this server process"""
+    import os
+    from rag.tracing import get_tracer
+    
+    st.markdown(
+        f'<div class="settings-section"><div class="section-title">📈 Performance (this process, pid {os.getpid()})</div>',
+        unsafe_allow_html=True
+    )
+    st.caption("Stats are kept in memory per server process; other workers and replicas keep their own.")
+    memory = get_tracer().memory()
+    stats = memory.stage_stats() if memory else {}
+    if not stats:
+        st.info("No traced requests yet")
+    else:
+        st.dataframe(
+            [
+                {
+                    "Stage": name,
+                    "Count": row['count'],
+                    "Mean (ms)": round(row['mean_ms'], 1),
+                    "p50 (ms)": round(row['p50_ms'], 1),
+                    "p95 (ms)": round(row['p95_ms'], 1),
+                    "p99 (ms)": round(row['p99_ms'], 1),
+                    "Errors": row['errors']
+                }
+                for name, row in stats.items()
+            ],
+            hide_index=True,
+            use_container_width=True
+        )
+        st.caption(
+            f"Count and mean cover every request since the process started or stats were reset; "
+            f"p50/p95/p99 are exact over each stage's last {memory.window} requests."
+        )
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("🔄 Refresh", use_container_width=True):
+                st.rerun()
+        with col2:
+            if st.button("🧹 Reset Stats", use_container_width=True):
+                memory.clear()
+                st.rerun()
+    
+    # Connection pool usage, for sizing POOL_SIZE/MAX_OVERFLOW
+    try:
+        pool = get_pool_stats()
+    except Exception as e:
+        st.warning(f"Pool stats unavailable: {e}")
+    else:
+        st.markdown("**Database pool**")
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Checked out", f"{pool['checked_out']} / {pool['size']}")
+        col2.metric("Overflow", pool['overflow'])
+        col3.metric("Checkout wait (mean / max)", f"{pool.get('mean_wait_ms', 0.0):.1f} / {pool.get('max_wait_ms', 0.0):.1f} ms")
+        col4.metric("Timeouts", pool.get('timeouts', 0))
+    st.markdown('</div>', unsafe_allow_html=True)
+
 def update_personal_info(user_id, phone, dob, gender, address):
     """Update personal information"""
     session = get_session()
@@ -243,6 +312,7 @@ def update_personal_info(user_id, phone, dob, gender, address):
             session.add(profile)
         
         session.commit()
+        invalidate_user_profile(user_id)
         return {"success": True}
     except Exception as e:
         session.rollback()
@@ -273,6 +343,7 @@ def update_clinical_info(user_id, allergies, medications, procedures, issues, la
             session.add(clinical)
         
         session.commit()
+        invalidate_user_profile(user_id)
         return {"success": True}
     except Exception as e:
         session.rollback()
@@ -0,0 +1,42 @@
+"""
+Shared helpers for the benchmark scripts
+Timing calls, summarizing their latencies and parsing comma-separated options,
+so every script reports percentiles the same way
+"""
+import time
+from typing import Callable, Dict, Iterable, List, Tuple
+
+
+def timed(fn: Callable, *args, **kwargs) -> Tuple[object, float]:
+    """(result, elapsed ms) of one call"""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def time_calls(fn: Callable, inputs: Iterable) -> Tuple[List, List[float]]:
+    """(results, latencies ms) of fn called once per input, in order"""
+    results, latencies = [], []
+    for item in inputs:
+        result, elapsed_ms = timed(fn, item)
+        results.append(result)
+        latencies.append(elapsed_ms)
+    return results, latencies
+
+
+def latency_summary(latencies_ms: List[float]) -> Dict[str, float]:
+    """Mean and nearest-rank p50/p95 of a list of latencies"""
+    ordered = sorted(latencies_ms)
+    if not ordered:
+        return {"count": 0, "mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0}
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered),
+        "p50_ms": ordered[len(ordered) // 2],
+        "p95_ms": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+    }
+
+
+def comma_list(value: str) -> List[str]:
+    """'a, b,,c' -> ['a', 'b', 'c'], for list-valued command line options"""
+    return [item.strip() for item in value.split(",") if item.strip()]
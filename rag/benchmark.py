@@ -0,0 +1,125 @@
+"""
+Retrieval benchmark
+Measures recall@k of RAGChatbot retrieval against a labelled question set
+
+Usage: python -m rag.benchmark [--k 2] [--pool 10] [--lexical-only]
+"""
+import os
+import argparse
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+from rag.bench_harness import latency_summary, time_calls
+
+KNOWLEDGE_BASE_PATH = Path(__file__).parent / "data.json"
+
+# (question, substring that identifies a relevant chunk, or a tuple of alternatives)
+LABELLED_QUESTIONS: List[Tuple[str, Union[str, Tuple[str, ...]]]] = [
+    ("Clifton phone", "Branch: NeoImplant - Clifton"),
+    ("What is the phone number of the DHA branch?", "Branch: NeoImplant - DHA"),
+    ("What are your timings on Saturday in Clifton?", "Branch: NeoImplant - Clifton"),
+    ("Where is the DHA clinic located?", "Branch: NeoImplant - DHA"),
+    ("Why are my teeth sensitive to cold?", "Q: What causes tooth sensitivity?"),
+    ("How often do I need a cleaning?", "Q: How often should I get a dental cleaning?"),
+    ("Does getting a crown hurt?", "Q: Is a dental crown painful?"),
+    ("How many years will an implant last?", "Q: How long does a dental implant last?"),
+    ("Same day crown possible?", "Q: Can a crown be done in one visit?"),
+    ("My crown came off, what now?", "Q: What should I do if my crown falls off?"),
+    ("Is an x-ray radiation dangerous?", "Q: Are dental X-rays safe?"),
+    ("What is peri-implantitis?", "Q: What is peri-implantitis?"),
+    ("Does insurance pay for implants?", "Q: Will my insurance cover implants or crowns?"),
+    ("I am pregnant, can I see a dentist?", "Q: Can I get dental treatment during pregnancy?"),
+    ("What happens during scaling and polishing?", "Treatment: Scaling and Polishing"),
+    ("What is a dental filling?", "Treatment: Dental Fillings"),
+    ("Who needs a dental implant?", "Treatment: Dental Implants"),
+    ("What should I eat after getting a crown?",
+     ("Dental Crowns (Tooth Crowning) - Aftercare", "Dental Crowns (Tooth Crowning) - Post-treatment care")),
+    ("Aftercare after implant surgery",
+     ("Dental Implants (Tooth Replacement with Implants) - Aftercare",
+      "Dental Implants (Tooth Replacement with Implants) - Post-treatment care")),
+    ("How to look after a new filling",
+     ("Dental Fillings (Restorations) - Aftercare", "Dental Fillings (Restorations) - Post-treatment care")),
+    # Sections outside treatments/FAQs/branches
+    ("Can I pay by card?", "Payments and insurance"),
+    ("What if I have a dental emergency at night?", "Emergency"),
+    ("Do you offer video consultations?", "Teleconsultation"),
+    ("How do you sterilize your instruments?", "Sterilization and safety"),
+    ("What is your cancellation policy?", "Appointments"),
+    ("Who is your periodontist?", "Team: Dr. Ahmed Raza"),
+    ("Warning signs after getting a crown", "Dental Crowns (Tooth Crowning) - Post-treatment care"),
+    ("How is my personal data stored?", "Privacy and consent"),
+]
+
+# (question, metadata filters, expected substring): filters must bring the right passage first
+FILTERED_QUESTIONS: List[Tuple[str, Dict, str]] = [
+    ("opening hours", {'branch': 'Clifton'}, "Branch: NeoImplant - Clifton"),
+    ("opening hours", {'branch': 'DHA'}, "Branch: NeoImplant - DHA"),
+    ("implants", {'type': 'aftercare'}, "Dental Implants (Tooth Replacement with Implants) -"),
+    ("crown", {'type': 'risks'}, "Dental Crowns (Tooth Crowning) - Risks and Alternatives"),
+]
+
+
+def _is_hit(chatbot, indices: List[int], expected) -> bool:
+    alternatives = expected if isinstance(expected, tuple) else (expected,)
+    return any(alt in chatbot.chunks[idx]['text'] for idx in indices for alt in alternatives)
+
+
+def recall_at_k(chatbot, k: int) -> Tuple[float, float, List[str]]:
+    """Return (recall, mean latency ms, missed questions)"""
+    rankings, latencies = time_calls(
+        lambda question: chatbot._rank_chunks(question, top_k=k),
+        [question for question, _ in LABELLED_QUESTIONS]
+    )
+    missed = [
+        question for (question, expected), indices in zip(LABELLED_QUESTIONS, rankings)
+        if not _is_hit(chatbot, indices, expected)
+    ]
+    recall = 1 - len(missed) / len(LABELLED_QUESTIONS)
+    return recall, latency_summary(latencies)['mean_ms'], missed
+
+
+def filtered_top1(chatbot) -> List[str]:
+    """Filtered questions whose expected passage is not ranked first"""
+    return [
+        f"{question} {filters}"
+        for question, filters, expected in FILTERED_QUESTIONS
+        if not _is_hit(chatbot, chatbot._rank_chunks(question, top_k=1, filters=filters), expected)
+    ]
+
+
+def main():
+    from rag.rag_chatbot import RAGChatbot
+
+    parser = argparse.ArgumentParser(description="Benchmark RAG retrieval recall@k")
+    parser.add_argument("--k", type=int, default=2)
+    parser.add_argument("--pool", type=int, default=10, help="Candidate pool per retriever")
+    parser.add_argument("--lexical-only", action="store_true", help="Skip loading the dense index")
+    args = parser.parse_args()
+
+    chatbot = RAGChatbot(
+        str(KNOWLEDGE_BASE_PATH),
+        os.environ.get("GROQ_API_KEY", "benchmark"),
+        load_dense=not args.lexical_only,
+        candidate_pool=args.pool
+    )
+
+    recall, latency, missed = recall_at_k(chatbot, args.k)
+    mode = "bm25" if args.lexical_only else "hybrid"
+    print(f"{mode} recall@{args.k}: {recall:.2%} ({len(LABELLED_QUESTIONS) - len(missed)}/{len(LABELLED_QUESTIONS)}), "
+          f"mean latency {latency:.2f} ms")
+    for question in missed:
+        print(f"  missed: {question}")
+
+    if chatbot.query_table is not None:
+        stats = chatbot.query_table.stats()
+        print(f"query table: {stats['hit_rate']:.1%} of {stats['lookups']} lookups skipped the encoder "
+              f"(exact {stats['exact_hits']}, near-exact {stats['near_hits']})")
+
+    filtered_missed = filtered_top1(chatbot)
+    print(f"filtered top-1: {len(FILTERED_QUESTIONS) - len(filtered_missed)}/{len(FILTERED_QUESTIONS)}")
+    for question in filtered_missed:
+        print(f"  missed: {question}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Knowledge base chunker
+Walks every section of data.json according to CHUNK_SCHEMA and produces
+chunks with metadata; long chunks are split into overlapping word windows
+"""
+from typing import Dict, List, Optional
+
+# Sections whose chunks never reach patients unless asked for by type
+INTERNAL_TYPES = {'admin'}
+
+# Per-treatment fields, grouped into one chunk per purpose.
+# Treatments name the same thing differently (procedure_steps vs
+# treatment_steps_overview), so each group lists every spelling.
+TREATMENT_GROUPS = [
+    ('treatment', None, ['description', 'indications', 'materials', 'procedure_steps',
+                         'treatment_steps_overview', 'anesthesia', 'anesthesia_and_sedation',
+                         'typical_duration', 'notes_for_chatbot_response']),
+    ('aftercare', 'Aftercare', ['aftercare_and_home_instructions', 'recovery_and_expected_symptoms',
+                                'follow_up']),
+    ('risks', 'Risks and Alternatives', ['risks_and_complications', 'contraindications',
+                                         'contraindications_and_cautions', 'alternatives']),
+]
+
+# clinic_info keys that get their own topic chunk, and the chunk type to use
+CLINIC_TOPICS = {
+    'appointments': 'policy',
+    'emergency': 'emergency',
+    'payments_and_insurance': 'payment',
+    'sterilization_and_safety': 'policy',
+    'teleconsultation': 'service',
+    'privacy_and_consent': 'policy',
+    'address': 'clinic',
+}
+
+
+def humanize(key: str) -> str:
+    return key.replace('_', ' ').strip().capitalize()
+
+
+def render_value(value, indent: str = "") -> str:
+    """Plain-text rendering of nested dicts and lists"""
+    if isinstance(value, dict):
+        lines = []
+        for key, item in value.items():
+            if isinstance(item, (dict, list)):
+                lines.append(f"{indent}{humanize(key)}:")
+                lines.append(render_value(item, indent + "  "))
+            else:
+                lines.append(f"{indent}{humanize(key)}: {_scalar(item)}")
+        return "\n".join(lines)
+    if isinstance(value, list):
+        return "\n".join(
+            render_value(item, indent + "  ") if isinstance(item, (dict, list)) else f"{indent}- {_scalar(item)}"
+            for item in value
+        )
+    return f"{indent}{_scalar(value)}"
+
+
+def _scalar(value) -> str:
+    if isinstance(value, bool):
+        return "Yes" if value else "No"
+    return str(value)
+
+
+class KnowledgeBaseChunker:
+    """
+    max_words controls granularity: a chunk longer than that is split into
+    windows of max_words with overlap_words shared between neighbours. Every
+    window repeats the chunk heading so it still says what it is about.
+    """
+
+    def __init__(self, max_words: int = 200, overlap_words: int = 30):
+        if overlap_words >= max_words:
+            raise ValueError("overlap_words must be smaller than max_words")
+        self.max_words = max_words
+        self.overlap_words = overlap_words
+
+    def chunk(self, knowledge_base: dict) -> List[Dict]:
+        chunks = []
+        handlers = {
+            'treatments': self._treatments,
+            'faqs': self._faqs,
+            'post_treatment': self._post_treatment,
+            'clinic_info': self._clinic_info,
+            'admin_notes': self._admin_notes,
+            'meta': lambda value, kb: [],
+        }
+        for section, value in knowledge_base.items():
+            handler = handlers.get(section, self._generic)
+            if handler is self._generic:
+                pieces = self._generic(section, value)
+            else:
+                pieces = handler(value, knowledge_base)
+            for heading, body, metadata in pieces:
+                metadata.setdefault('section', section)
+                chunks.extend(self._split(heading, body, metadata))
+        return chunks
+
+    def _split(self, heading: str, body: str, metadata: dict) -> List[Dict]:
+        words = body.split()
+        if len(words) <= self.max_words:
+            return [{'text': f"{heading}\n{body}".strip(), 'metadata': metadata}]
+
+        # Split on words but keep line breaks inside each window readable
+        tokens = body.replace("\n", " \n ").split(" ")
+        tokens = [t for t in tokens if t != ""]
+        word_positions = [i for i, t in enumerate(tokens) if t != "\n"]
+        step = self.max_words - self.overlap_words
+        chunks = []
+        for part, start in enumerate(range(0, len(word_positions), step)):
+            end = min(start + self.max_words, len(word_positions))
+            window = tokens[word_positions[start]:word_positions[end - 1] + 1]
+            text = " ".join(window).replace(" \n ", "\n").strip()
+            chunks.append({'text': f"{heading} (part {part + 1})\n{text}", 'metadata': dict(metadata, part=part + 1)})
+            if end == len(word_positions):
+                break
+        return chunks
+
+    # ---------- sections ----------
+
+    def _treatments(self, treatments: dict, kb: dict):
+        for key, treatment in treatments.items():
+            title = treatment.get('title', humanize(key))
+            for chunk_type, suffix, fields in TREATMENT_GROUPS:
+                present = {field: treatment[field] for field in fields if field in treatment}
+                if not present:
+                    continue
+                heading = f"Treatment: {title}" if suffix is None else f"{title} - {suffix}"
+                yield heading, render_value(present), {'type': chunk_type, 'treatment': key, 'title': title}
+
+    def _faqs(self, faqs: list, kb: dict):
+        for faq in faqs:
+            yield f"Q: {faq['question']}", f"A: {faq['answer']}", {'type': 'faq'}
+
+    def _post_treatment(self, post_treatment: dict, kb: dict):
+        titles = {key: t.get('title', humanize(key)) for key, t in kb.get('treatments', {}).items()}
+        for key, value in post_treatment.items():
+            if isinstance(value, dict):
+                title = titles.get(key, humanize(key))
+                yield (f"{title} - Post-treatment care", render_value(value),
+                       {'type': 'aftercare', 'treatment': key, 'title': title})
+            else:
+                yield f"Post-treatment care: {humanize(key)}", render_value(value), {'type': 'aftercare'}
+
+    def _clinic_info(self, clinic_info: dict, kb: dict):
+        name = clinic_info.get('name', 'Clinic')
+        overview = {k: v for k, v in clinic_info.items() if not isinstance(v, (dict, list))}
+        if overview:
+            yield f"Clinic: {name}", render_value(overview), {'type': 'clinic'}
+
+        for branch in clinic_info.get('branches', []):
+            details = {k: v for k, v in branch.items() if k not in ('name', 'hours')}
+            hours = {day.capitalize(): value for day, value in branch.get('hours', {}).items()}
+            body = render_value(details) + "\nHours:\n" + render_value(hours, "  ")
+            yield f"Branch: {branch['name']}", body, {'type': 'branch', 'branch': branch['name']}
+
+        for member in clinic_info.get('team', []):
+            details = {k: v for k, v in member.items() if k != 'name'}
+            yield f"Team: {member['name']}", render_value(details), {'type': 'team', 'dentist': member['name']}
+
+        for key, value in clinic_info.items():
+            if key in ('branches', 'team') or key in overview:
+                continue
+            chunk_type = CLINIC_TOPICS.get(key, 'clinic')
+            yield f"{name} - {humanize(key)}", render_value(value), {'type': chunk_type, 'topic': key}
+
+    def _admin_notes(self, notes: dict, kb: dict):
+        yield "Admin notes", render_value(notes), {'type': 'admin'}
+
+    def _generic(self, section: str, value):
+        """Sections the schema does not know yet are still indexed, one chunk per entry"""
+        if isinstance(value, dict):
+            return [(f"{humanize(section)}: {humanize(key)}", render_value(item), {'type': section, 'topic': key})
+                    for key, item in value.items()]
+        if isinstance(value, list):
+            return [(humanize(section), render_value(item), {'type': section}) for item in value]
+        return [(humanize(section), render_value(value), {'type': section})]
+
+
+def matches_filters(metadata: dict, filters: Optional[Dict], strict: bool = True) -> bool:
+    """
+    A filter value may be a string or a list of strings (any of them), matched
+    case-insensitively as a substring, so branch='Clifton' matches
+    'NeoImplant - Clifton'. Strict filters require the key; lenient ones let
+    chunks without it through, so an inferred branch keeps general FAQs but
+    drops the other branch. Internal types are dropped unless asked for by type.
+    """
+    filters = filters or {}
+    if metadata.get('type') in INTERNAL_TYPES and 'type' not in filters:
+        return False
+    for key, wanted in filters.items():
+        value = metadata.get(key)
+        if value is None:
+            if strict:
+                return False
+            continue
+        wanted_values = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+        if not any(str(w).lower() in str(value).lower() for w in wanted_values):
+            return False
+    return True
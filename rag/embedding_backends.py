@@ -0,0 +1,151 @@
+"""
+Embedding backends
+Interchangeable encoders for all-MiniLM-L6-v2: the PyTorch SentenceTransformer
+and ONNX Runtime with the fp32 or int8-quantized export. The ONNX backends
+need only onnxruntime and tokenizers, so torch never gets imported.
+"""
+from pathlib import Path
+from typing import List, Optional
+import numpy as np
+
+DEFAULT_MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# ONNX exports published alongside the model on the Hugging Face hub
+ONNX_FILES = {
+    'onnx': 'onnx/model.onnx',
+    # Dynamic int8 quantization; the avx2 build runs on any x86-64 server
+    'onnx-int8': 'onnx/model_quint8_avx2.onnx',
+}
+
+BACKEND_NAMES = ('torch',) + tuple(ONNX_FILES)
+
+
+class EmbeddingBackend:
+    """
+    encode(texts) returns a (len(texts), dimension) float32 matrix of
+    L2-normalized sentence embeddings. load() does the expensive work and is
+    called lazily on first encode, so constructing a backend is cheap.
+    """
+
+    name = "base"
+    dimension = 384
+
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME):
+        self.model_name = model_name
+        self._loaded = False
+
+    def load(self):
+        if not self._loaded:
+            self._load()
+            self._loaded = True
+        return self
+
+    def _load(self):
+        raise NotImplementedError
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        self.load()
+        if not texts:
+            return np.zeros((0, self.dimension), dtype='float32')
+        return np.vstack([
+            self._encode_batch(texts[start:start + batch_size])
+            for start in range(0, len(texts), batch_size)
+        ]).astype('float32')
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class TorchBackend(EmbeddingBackend):
+    """The reference sentence-transformers model on PyTorch"""
+
+    name = "torch"
+
+    def _load(self):
+        # Imported here so torch is only pulled in when this backend is chosen
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(self.model_name)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+
+
+class OnnxBackend(EmbeddingBackend):
+    """
+    ONNX Runtime session plus the model's fast tokenizer, with the same mean
+    pooling and normalization the sentence-transformers pipeline applies.
+    model_dir may point at a local copy; otherwise the files are fetched from
+    the hub once and cached there.
+    """
+
+    max_length = 256
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL_NAME,
+        quantized: bool = False,
+        model_dir: Optional[str] = None,
+        onnx_file: Optional[str] = None,
+        intra_op_threads: int = 0
+    ):
+        super().__init__(model_name)
+        self.name = 'onnx-int8' if quantized else 'onnx'
+        self.model_dir = model_dir
+        self.onnx_file = onnx_file or ONNX_FILES[self.name]
+        self.intra_op_threads = intra_op_threads
+
+    def _resolve(self, filename: str) -> str:
+        if self.model_dir:
+            return str(Path(self.model_dir) / filename)
+        from huggingface_hub import hf_hub_download
+        repo_id = self.model_name if '/' in self.model_name else f"sentence-transformers/{self.model_name}"
+        return hf_hub_download(repo_id, filename)
+
+    def _load(self):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.tokenizer = Tokenizer.from_file(self._resolve('tokenizer.json'))
+        self.tokenizer.enable_truncation(max_length=self.max_length)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # 0 lets onnxruntime use every core; set it lower when several replicas share a host
+        options.intra_op_num_threads = self.intra_op_threads
+        self.session = ort.InferenceSession(
+            self._resolve(self.onnx_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {node.name for node in self.session.get_inputs()}
+        output_dim = self.session.get_outputs()[0].shape[-1]
+        if isinstance(output_dim, int):
+            self.dimension = output_dim
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        if 'token_type_ids' in self.input_names:
+            feeds['token_type_ids'] = np.zeros_like(input_ids)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+
+def create_embedding_backend(
+    name: str = 'torch',
+    model_name: str = DEFAULT_MODEL_NAME,
+    model_dir: Optional[str] = None,
+    **kwargs
+) -> EmbeddingBackend:
+    """Backend by config name: torch, onnx or onnx-int8"""
+    if name == 'torch':
+        # SentenceTransformer accepts a local directory in place of the model name
+        return TorchBackend(model_dir or model_name)
+    if name in ONNX_FILES:
+        return OnnxBackend(model_name, quantized=(name == 'onnx-int8'), model_dir=model_dir, **kwargs)
+    raise ValueError(f"Unknown embedding backend '{name}', expected one of {', '.join(BACKEND_NAMES)}")
@@ -0,0 +1,145 @@
+"""
+Embedding backend benchmark
+Parity of each backend with the torch reference on the knowledge base chunks
+(per-chunk cosine and top-k retrieval agreement), plus query latency and the
+memory each backend adds. Every backend runs in its own process so its
+imports and RSS are measured in isolation.
+
+Usage: python -m rag.embedding_benchmark [--backends torch,onnx,onnx-int8]
+                                         [--queries 200] [--min-cosine 0.99]
+Exits non-zero if a backend falls below --min-cosine against torch
+"""
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+import numpy as np
+
+from rag.bench_harness import comma_list, latency_summary, time_calls, timed
+from rag.embedding_backends import BACKEND_NAMES
+
+KNOWLEDGE_BASE_PATH = Path(__file__).parent / "data.json"
+
+
+def rss_mb() -> float:
+    """Resident set size of this process (Linux /proc; peak RSS elsewhere)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def chunk_texts() -> list:
+    from rag.chunker import KnowledgeBaseChunker
+    with open(KNOWLEDGE_BASE_PATH, 'r', encoding='utf-8') as f:
+        return [chunk['text'] for chunk in KnowledgeBaseChunker().chunk(json.load(f))]
+
+
+def query_texts() -> list:
+    from rag.benchmark import LABELLED_QUESTIONS
+    return [question for question, _ in LABELLED_QUESTIONS]
+
+
+def run_worker(backend_name: str, out_dir: str, queries: int):
+    """Runs inside the child process: load, encode chunks, time single-query encodes"""
+    baseline_rss = rss_mb()
+    from rag.embedding_backends import create_embedding_backend
+
+    backend, load_ms = timed(lambda: create_embedding_backend(backend_name).load())
+
+    texts, questions = chunk_texts(), query_texts()
+    np.save(Path(out_dir) / f"{backend_name}-chunks.npy", backend.encode(texts))
+    np.save(Path(out_dir) / f"{backend_name}-queries.npy", backend.encode(questions))
+
+    _, latencies = time_calls(lambda i: backend.encode([questions[i % len(questions)]]), range(queries))
+    summary = latency_summary(latencies)
+    _, batch_ms = timed(backend.encode, texts)
+
+    print(json.dumps({
+        "backend": backend_name,
+        "load_seconds": load_ms / 1000,
+        "rss_added_mb": rss_mb() - baseline_rss,
+        "p50_ms": summary["p50_ms"],
+        "p95_ms": summary["p95_ms"],
+        "chunks_ms": batch_ms,
+        "chunks": len(texts),
+    }))
+
+
+def parity(reference_dir: Path, backend_name: str, k: int = 3) -> dict:
+    """Cosine between matching chunk vectors, and how often query top-k sets agree"""
+    ref_chunks = np.load(reference_dir / "torch-chunks.npy")
+    ref_queries = np.load(reference_dir / "torch-queries.npy")
+    chunks = np.load(reference_dir / f"{backend_name}-chunks.npy")
+    queries = np.load(reference_dir / f"{backend_name}-queries.npy")
+
+    # All backends return normalized vectors, so the row-wise dot is the cosine
+    cosines = (ref_chunks * chunks).sum(axis=1)
+    ref_top = np.argsort(-ref_queries @ ref_chunks.T, axis=1)[:, :k]
+    top = np.argsort(-queries @ chunks.T, axis=1)[:, :k]
+    overlap = [len(set(a) & set(b)) / k for a, b in zip(ref_top, top)]
+    top1 = float(np.mean(ref_top[:, 0] == top[:, 0]))
+    return {"min_cosine": float(cosines.min()), "mean_cosine": float(cosines.mean()),
+            f"top{k}_overlap": float(np.mean(overlap)), "top1_agreement": top1}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding backends for parity, latency and memory")
+    parser.add_argument("--backends", default=",".join(BACKEND_NAMES))
+    parser.add_argument("--queries", type=int, default=200, help="Single-query encodes timed per backend")
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--out-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.out_dir, args.queries)
+        return
+
+    backends = comma_list(args.backends)
+    if "torch" not in backends:
+        # Parity is always measured against the torch reference
+        backends.insert(0, "torch")
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as out_dir:
+        results = {}
+        for name in backends:
+            proc = subprocess.run(
+                [sys.executable, "-m", "rag.embedding_benchmark", "--worker", name,
+                 "--out-dir", out_dir, "--queries", str(args.queries)],
+                capture_output=True, text=True
+            )
+            if proc.returncode != 0:
+                error = proc.stderr.strip().splitlines()
+                print(f"{name}: failed - {error[-1] if error else 'no output'}")
+                failures += 1
+                continue
+            results[name] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+        for name, result in results.items():
+            print(f"{name:10s} load {result['load_seconds']:.1f} s, +{result['rss_added_mb']:.0f} MB RSS, "
+                  f"query p50 {result['p50_ms']:.1f} ms p95 {result['p95_ms']:.1f} ms, "
+                  f"{result['chunks']} chunks in {result['chunks_ms']:.0f} ms")
+            if name == "torch" or "torch" not in results:
+                continue
+            agreement = parity(Path(out_dir), name)
+            ok = agreement["min_cosine"] >= args.min_cosine
+            failures += not ok
+            print(f"{'':10s} parity vs torch: cosine min {agreement['min_cosine']:.4f} "
+                  f"mean {agreement['mean_cosine']:.4f}, top-3 overlap {agreement['top3_overlap']:.2%}, "
+                  f"top-1 agreement {agreement['top1_agreement']:.2%} {'ok' if ok else 'FAIL'}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
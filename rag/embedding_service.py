@@ -0,0 +1,81 @@
+"""
+Micro-batching embedding service
+Collects concurrent query encodes for a few milliseconds and runs one batched forward pass
+"""
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import List
+import numpy as np
+
+
+class BatchEmbeddingService:
+    """Shared query encoder; callers get a Future per query"""
+
+    def __init__(self, model, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.queries = 0
+        self.max_batch_seen = 0
+        self.total_queue_wait_ms = 0.0
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        """Queue a query for encoding; the future resolves to a (dim,) float32 vector"""
+        future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def encode(self, texts: List[str], timeout: float = 10.0) -> np.ndarray:
+        """Blocking helper that returns a (len(texts), dim) float32 matrix"""
+        futures = [self.submit(text) for text in texts]
+        return np.stack([future.result(timeout=timeout) for future in futures])
+
+    def _collect_batch(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            started = time.perf_counter()
+            texts = [text for text, _, _ in batch]
+            try:
+                vectors = self.model.encode(texts).astype('float32')
+                for (_, future, _), vector in zip(batch, vectors):
+                    future.set_result(vector)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+
+            with self._stats_lock:
+                self.batches += 1
+                self.queries += len(batch)
+                self.max_batch_seen = max(self.max_batch_seen, len(batch))
+                self.total_queue_wait_ms += sum((started - enqueued) * 1000 for _, _, enqueued in batch)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "batches": self.batches,
+                "queries": self.queries,
+                "mean_batch_size": self.queries / self.batches if self.batches else 0.0,
+                "max_batch_size": self.max_batch_seen,
+                "mean_queue_wait_ms": self.total_queue_wait_ms / self.queries if self.queries else 0.0,
+                "queue_depth": self._queue.qsize(),
+            }
@@ -0,0 +1,80 @@
+"""
+Vector index benchmark
+Recall@k against exact search, query latency, build time and index size for
+flat, HNSW and IVF-PQ indexes at several corpus sizes. Vectors are synthetic
+(clustered, normalized, 384-d like MiniLM) so large corpora can be tested
+without encoding them; queries are perturbed corpus vectors.
+
+Usage: python -m rag.index_benchmark [--sizes 10000,50000] [--queries 200] [--k 5]
+"""
+import argparse
+import faiss
+import numpy as np
+
+from rag.bench_harness import comma_list, latency_summary, time_calls, timed
+from rag.vector_index import build_vector_index, choose_index_kind, normalize, search
+
+
+def synthetic_corpus(count: int, dimension: int = 384, clusters: int = 200, latent: int = 48,
+                     seed: int = 0) -> np.ndarray:
+    """
+    Vectors around topic centroids, the way chunks of related documents
+    cluster, lying near a low-dimensional subspace as sentence embeddings do
+    """
+    rng = np.random.default_rng(seed)
+    projection = rng.standard_normal((latent, dimension)).astype('float32')
+    centroids = rng.standard_normal((clusters, latent)).astype('float32')
+    points = centroids[rng.integers(0, clusters, count)] + 0.6 * rng.standard_normal((count, latent)).astype('float32')
+    return normalize(points @ projection + 0.5 * rng.standard_normal((count, dimension)).astype('float32'))
+
+
+def queries_for(corpus: np.ndarray, count: int, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    picks = corpus[rng.integers(0, len(corpus), count)]
+    # Noise with about a third of the vector's norm: a paraphrase, not a copy
+    noise = rng.standard_normal(picks.shape).astype('float32') * (0.35 / np.sqrt(picks.shape[1]))
+    return normalize(picks + noise)
+
+
+def index_size_mb(index) -> float:
+    return faiss.serialize_index(index).nbytes / (1024 * 1024)
+
+
+def evaluate(index, queries: np.ndarray, truth: np.ndarray, k: int, vectors=None) -> dict:
+    rescore = (lambda ids, q: vectors[ids] @ q) if vectors is not None else None
+    results, latencies = time_calls(lambda query: search(index, query[None, :], k, rescore=rescore), queries)
+    recalls = [len(set(ids.tolist()) & set(expected.tolist())) / k for (_, ids), expected in zip(results, truth)]
+    return {"recall": float(np.mean(recalls)), **latency_summary(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare flat, HNSW and IVF-PQ recall and latency")
+    parser.add_argument("--sizes", default="10000,50000")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--kinds", default="flat,hnsw,ivfpq")
+    args = parser.parse_args()
+
+    # Single-threaded search matches one query per request in the app
+    faiss.omp_set_num_threads(1)
+    kinds = comma_list(args.kinds)
+
+    for size in (int(s) for s in comma_list(args.sizes)):
+        corpus = synthetic_corpus(size)
+        queries = queries_for(corpus, args.queries)
+        _, truth = build_vector_index(corpus, 'flat').search(queries, args.k)
+        print(f"{size} vectors (auto picks {choose_index_kind(size)}):")
+        for kind in kinds:
+            index, build_ms = timed(build_vector_index, corpus, kind)
+            variants = [(kind, None)]
+            if kind == 'ivfpq':
+                # As RAGChatbot searches it: re-scored on the stored (memory-mapped) embeddings
+                variants.append(('ivfpq+rerank', corpus))
+            for label, vectors in variants:
+                result = evaluate(index, queries, truth, args.k, vectors)
+                print(f"  {label:12s} recall@{args.k} {result['recall']:.3f}, p50 {result['p50_ms']:.2f} ms, "
+                      f"p95 {result['p95_ms']:.2f} ms, build {build_ms / 1000:.1f} s, {index_size_mb(index):.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Persistent on-disk store for the RAG embeddings and FAISS index
+Entries are content-addressed by the knowledge base and the embedding model,
+so a restart with unchanged data skips encoding entirely
+"""
+import os
+import re
+import json
+import hashlib
+import shutil
+import tempfile
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+import faiss
+import numpy as np
+
+DEFAULT_CACHE_DIR = Path(__file__).parent / ".index_cache"
+
+# Bump when the chunking or index layout changes so stale entries are ignored
+STORE_VERSION = 4
+
+INDEX_FILE = "index.faiss"
+CHUNKS_FILE = "chunks.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+
+# Entry dirs are named by compute_cache_key; anything else in the cache dir is left alone
+_KEY_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+def compute_cache_key(knowledge_base: dict, model_name: str, chunking: str = "") -> str:
+    """Hash the knowledge base content together with the model name and chunking settings"""
+    payload = json.dumps(knowledge_base, sort_keys=True, ensure_ascii=False)
+    digest = hashlib.sha256()
+    digest.update(f"v{STORE_VERSION}\0{model_name}\0{chunking}\0".encode('utf-8'))
+    digest.update(payload.encode('utf-8'))
+    return digest.hexdigest()[:32]
+
+
+class IndexStore:
+    """Reads and writes index entries under a cache directory"""
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = Path(cache_dir or os.environ.get("RAG_INDEX_CACHE_DIR", DEFAULT_CACHE_DIR))
+
+    def _entry_dir(self, key: str) -> Path:
+        return self.cache_dir / key
+
+    def load(self, key: str) -> Optional[Tuple[object, List[Dict], np.ndarray]]:
+        """Memory-map a stored entry; returns None on miss or a corrupt entry"""
+        entry = self._entry_dir(key)
+        if not (entry / INDEX_FILE).exists():
+            return None
+        try:
+            with open(entry / CHUNKS_FILE, 'r', encoding='utf-8') as f:
+                chunks = json.load(f)
+            embeddings = np.load(entry / EMBEDDINGS_FILE, mmap_mode='r')
+            try:
+                index = faiss.read_index(str(entry / INDEX_FILE), faiss.IO_FLAG_MMAP)
+            except Exception:
+                # Not every index type supports mmap; fall back to a normal read
+                index = faiss.read_index(str(entry / INDEX_FILE))
+            if index.ntotal != len(chunks):
+                return None
+            return index, chunks, embeddings
+        except Exception as e:
+            print(f"[INDEX STORE] Failed to load {key}: {e}")
+            return None
+
+    def save(self, key: str, index, chunks: List[Dict], embeddings: np.ndarray) -> bool:
+        """Write an entry atomically so concurrent replicas never see a partial one"""
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_dir = Path(tempfile.mkdtemp(prefix=f".{key}-", dir=self.cache_dir))
+            faiss.write_index(index, str(tmp_dir / INDEX_FILE))
+            with open(tmp_dir / CHUNKS_FILE, 'w', encoding='utf-8') as f:
+                json.dump(chunks, f, ensure_ascii=False)
+            np.save(tmp_dir / EMBEDDINGS_FILE, np.ascontiguousarray(embeddings, dtype='float32'))
+
+            entry = self._entry_dir(key)
+            try:
+                os.replace(tmp_dir, entry)
+            except OSError:
+                # Another process already published this key
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            return True
+        except Exception as e:
+            print(f"[INDEX STORE] Failed to save {key}: {e}")
+            return False
+
+    def prune(self, keep_key: str):
+        """Remove entries other than the current one"""
+        if not self.cache_dir.exists():
+            return
+        for entry in self.cache_dir.iterdir():
+            # Only key-named dirs: dot-prefixed ones are in-flight writes from other processes
+            if entry.is_dir() and entry.name != keep_key and _KEY_PATTERN.fullmatch(entry.name):
+                shutil.rmtree(entry, ignore_errors=True)
@@ -0,0 +1,133 @@
+"""
+Knowledge base hot reload
+Immutable retrieval snapshots keyed by chunk hash, and a watchdog observer
+that reloads data.json when it changes. Requests keep whichever snapshot
+they started with; a reload builds the next one and swaps it in one step.
+"""
+import json
+import hashlib
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import numpy as np
+
+# Editors write in bursts (truncate, write, rename); wait for the file to settle
+DEBOUNCE_SECONDS = 1.0
+
+
+def chunk_ids(chunks: List[Dict]) -> np.ndarray:
+    """
+    Stable int64 id per chunk from a hash of its text and metadata, so an
+    unchanged chunk keeps its id and its embedding across reloads. Repeats
+    of an identical chunk are told apart by occurrence number.
+    """
+    seen = {}
+    ids = []
+    for chunk in chunks:
+        payload = json.dumps([chunk['text'], chunk['metadata']], sort_keys=True, ensure_ascii=False)
+        occurrence = seen.get(payload, 0)
+        seen[payload] = occurrence + 1
+        digest = hashlib.sha256(f"{occurrence}\0{payload}".encode('utf-8')).digest()
+        # Positive 63-bit ids; -1 is FAISS's "no result"
+        ids.append(int.from_bytes(digest[:8], 'big') & 0x7FFFFFFFFFFFFFFF)
+    return np.array(ids, dtype='int64')
+
+
+class KnowledgeSnapshot:
+    """
+    Everything retrieval reads for one knowledge base version. Never mutated
+    after construction; embeddings and index are filled in by with_dense()
+    """
+
+    def __init__(self, knowledge_base: dict, kb_version: str, chunks: List[Dict], bm25, matcher,
+                 embeddings: Optional[np.ndarray] = None, index=None):
+        self.knowledge_base = knowledge_base
+        self.kb_version = kb_version
+        self.chunks = chunks
+        self.ids = chunk_ids(chunks)
+        self.rows = {int(chunk_id): row for row, chunk_id in enumerate(self.ids)}
+        self.bm25 = bm25
+        self.matcher = matcher
+        self.embeddings = embeddings
+        self.index = index
+
+    def with_dense(self, embeddings: np.ndarray, index) -> 'KnowledgeSnapshot':
+        return KnowledgeSnapshot(self.knowledge_base, self.kb_version, self.chunks, self.bm25,
+                                 self.matcher, embeddings, index)
+
+    def diff(self, other: 'KnowledgeSnapshot') -> dict:
+        """Chunk ids added, removed and kept going from this snapshot to other"""
+        added = [int(i) for i in other.ids if int(i) not in self.rows]
+        removed = [int(i) for i in self.ids if int(i) not in other.rows]
+        return {"added": added, "removed": removed, "unchanged": len(other.ids) - len(added)}
+
+
+class KnowledgeBaseWatcher:
+    """
+    Watches the knowledge base file and calls chatbot.reload_knowledge_base()
+    after it changes; listeners get the new knowledge base after a successful
+    reload (e.g. to refresh branch hours elsewhere)
+    """
+
+    def __init__(self, chatbot, path: str, listeners: Optional[List[Callable[[dict], None]]] = None,
+                 debounce_seconds: float = DEBOUNCE_SECONDS):
+        self.chatbot = chatbot
+        self.path = Path(path).resolve()
+        self.listeners = list(listeners or [])
+        self.debounce_seconds = debounce_seconds
+        self._timer = None
+        self._timer_lock = threading.Lock()
+        self._observer = None
+        self.reloads = 0
+        self.last_result = None
+
+    def start(self):
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                # Saves arrive as modify, or as create/move when editors write a temp file and rename it
+                paths = [getattr(event, 'src_path', None), getattr(event, 'dest_path', None)]
+                if any(p and Path(p).resolve() == watcher.path for p in paths):
+                    watcher.schedule_reload()
+
+        self._observer = Observer()
+        self._observer.schedule(Handler(), str(self.path.parent), recursive=False)
+        self._observer.daemon = True
+        self._observer.start()
+        return self
+
+    def stop(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout=5)
+        with self._timer_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+
+    def schedule_reload(self):
+        with self._timer_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.debounce_seconds, self.reload)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def reload(self) -> dict:
+        result = self.chatbot.reload_knowledge_base(str(self.path))
+        self.last_result = result
+        if result.get('success') and result.get('changed'):
+            self.reloads += 1
+            print(f"[KB RELOAD] {len(result['added'])} added, {len(result['removed'])} removed, "
+                  f"{result['unchanged']} unchanged, {result['encoded']} encoded")
+            for listener in self.listeners:
+                try:
+                    listener(self.chatbot.knowledge_base)
+                except Exception as e:
+                    print(f"[KB RELOAD ERROR] listener failed: {e}")
+        elif not result.get('success'):
+            print(f"[KB RELOAD ERROR] {result.get('error')}")
+        return result
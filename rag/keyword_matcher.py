@@ -0,0 +1,184 @@
+"""
+Keyword matcher for intent and entity detection
+All vocabularies are compiled into one regex so a message is scanned once;
+branch, dentist and treatment names are generated from the knowledge base.
+Keywords match as whole words with an optional plural ending ("gums",
+"appointments")
+"""
+import re
+import json
+import threading
+from pathlib import Path
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_KNOWLEDGE_BASE_PATH = Path(__file__).parent / "data.json"
+
+# Intent vocabularies (keyword -> value); values are just the keyword
+INTENT_KEYWORDS = {
+    # RAGChatbot.extract_booking_intent
+    'booking_intent': ['book', 'booking', 'appointment', 'appointments', 'schedule', 'reserve',
+                       'visit', 'consultation'],
+    # Words that move a booking forward in handle_chat_message
+    'booking_confirm': ['book', 'booking', 'confirm', 'schedule', 'appointment', 'yes', 'correct', 'all correct',
+                        'proceed', 'go ahead', 'thats right', "that's right", 'perfect'],
+    # Phrases that mean "make a new booking" rather than "show my bookings"
+    'booking_verb': ['book', 'schedule', 'reserve', 'make appointment', 'want appointment'],
+    'appointment_query': ['my appointment', 'my appointments', 'show my appointment',
+                          'when is my appointment', 'check my appointment',
+                          'view my appointment', 'do i have appointment',
+                          'any upcoming appointment', 'what appointment do i have'],
+    # Short replies that are never a free-text treatment description
+    'treatment_skip': ['yes', 'no', 'ok', 'okay', 'sure', 'confirm', 'correct', 'book',
+                       'tomorrow', 'today', 'am', 'pm'],
+}
+
+# Services offered that have no entry under "treatments" in the knowledge base
+EXTRA_TREATMENTS = {
+    'root canal': 'Root Canal Treatment',
+    'extraction': 'Tooth Extraction',
+    'consultation': 'Consultation',
+    'checkup': 'General Checkup',
+    'check-up': 'General Checkup',
+    'discussion': 'Discussion and Diagnosis',
+    'diagnosis': 'Discussion and Diagnosis',
+    'exam': 'Dental Examination',
+    'bleeding gums': 'Gum Treatment',
+    'gum': 'Gum Treatment',
+}
+
+# Optional plural ending allowed after any keyword
+PLURAL_SUFFIX = r'(?:e?s)?'
+
+# Single words that are never a patient's name
+IGNORE_NAME_WORDS = frozenset([
+    'hi', 'hello', 'hey', 'yes', 'no', 'okay', 'ok', 'sure', 'thanks', 'thank',
+    'please', 'good', 'fine', 'great', 'nice', 'morning', 'evening', 'afternoon',
+    'book', 'appointment', 'help', 'need', 'want', 'can', 'could', 'would', 'my'
+])
+
+
+class MatchResult:
+    """Hits from one scan: category -> [(value, position), ...] in message order"""
+
+    def __init__(self):
+        self.hits: Dict[str, List[Tuple[str, int]]] = defaultdict(list)
+
+    def has(self, category: str) -> bool:
+        return bool(self.hits.get(category))
+
+    def first(self, category: str) -> Optional[str]:
+        hits = self.hits.get(category)
+        return hits[0][0] if hits else None
+
+    def last(self, category: str) -> Optional[str]:
+        hits = self.hits.get(category)
+        return hits[-1][0] if hits else None
+
+
+class KeywordMatcher:
+    """One compiled alternation over every keyword of every category"""
+
+    def __init__(self, vocabulary: Dict[str, Dict[str, str]]):
+        self.tags: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
+        for category, keywords in vocabulary.items():
+            for keyword, value in keywords.items():
+                self.tags[keyword.lower()].append((category, value))
+
+        # A phrase also carries the tags of every keyword it contains as whole words
+        # (plurals included, so "appointments" also means "appointment"), since the
+        # regex consumes the longest phrase at each position
+        for phrase in list(self.tags):
+            for keyword in list(self.tags):
+                if keyword != phrase and re.search(
+                    rf'(?<![a-z0-9]){re.escape(keyword)}{PLURAL_SUFFIX}(?![a-z0-9])', phrase
+                ):
+                    for tag in self.tags[keyword]:
+                        if tag not in self.tags[phrase]:
+                            self.tags[phrase].append(tag)
+
+        alternation = '|'.join(re.escape(k) for k in sorted(self.tags, key=len, reverse=True))
+        self.pattern = re.compile(rf'(?<![a-z0-9])(?P<keyword>{alternation}){PLURAL_SUFFIX}(?![a-z0-9])')
+
+    def match(self, text: str) -> MatchResult:
+        result = MatchResult()
+        for match in self.pattern.finditer(text.lower()):
+            for category, value in self.tags[match.group('keyword')]:
+                result.hits[category].append((value, match.start()))
+        return result
+
+
+def _singular_title(title: str) -> str:
+    """'Dental Crowns (Tooth Crowning)' -> 'Dental Crown'"""
+    base = re.sub(r'\s*\(.*?\)', '', title).strip()
+    words = base.split()
+    if words and words[-1].endswith('s') and not words[-1].endswith('ss'):
+        words[-1] = words[-1][:-1]
+    return ' '.join(words)
+
+
+def build_vocabulary(knowledge_base: dict) -> Dict[str, Dict[str, str]]:
+    """Intent keywords plus branch, dentist and treatment names from the knowledge base"""
+    vocabulary = {category: {k: k for k in keywords} for category, keywords in INTENT_KEYWORDS.items()}
+    clinic_info = knowledge_base.get('clinic_info', {})
+
+    branches = {}
+    for branch in clinic_info.get('branches', []):
+        # "NeoImplant - DHA" is referred to as "dha"
+        short_name = branch['name'].split(' - ')[-1].strip().lower()
+        branches[short_name] = branch['name']
+
+    dentists = {}
+    for member in clinic_info.get('team', []):
+        full_name = member['name'] if member['name'].startswith('Dr.') else f"Dr. {member['name']}"
+        for part in full_name.replace('Dr.', '').split():
+            dentists[part.lower()] = full_name
+
+    treatments = {}
+    for key, treatment in knowledge_base.get('treatments', {}).items():
+        value = _singular_title(treatment.get('title', key))
+        treatments[key.lower()] = value
+        treatments[key.lower().rstrip('s')] = value
+        aside = re.search(r'\((.*?)\)', treatment.get('title', ''))
+        if aside:
+            # "(Tooth Crowning)" -> "crowning", "(Professional Dental Cleaning)" -> "cleaning"
+            treatments[aside.group(1).split()[-1].lower()] = value
+    for keyword, value in EXTRA_TREATMENTS.items():
+        treatments.setdefault(keyword, value)
+
+    vocabulary['branch'] = branches
+    vocabulary['dentist'] = dentists
+    vocabulary['treatment'] = treatments
+    # Branch and dentist names are booking details, not treatment descriptions
+    vocabulary['treatment_skip'].update({k: k for k in list(branches) + list(dentists)})
+    return vocabulary
+
+
+def build_matcher(knowledge_base: dict) -> KeywordMatcher:
+    return KeywordMatcher(build_vocabulary(knowledge_base))
+
+
+_matcher_lock = threading.Lock()
+_matcher: Optional[KeywordMatcher] = None
+
+
+def get_matcher() -> KeywordMatcher:
+    """Process-wide matcher built from rag/data.json on first use"""
+    global _matcher
+    if _matcher is None:
+        with _matcher_lock:
+            if _matcher is None:
+                try:
+                    with open(DEFAULT_KNOWLEDGE_BASE_PATH, 'r', encoding='utf-8') as f:
+                        knowledge_base = json.load(f)
+                except Exception:
+                    knowledge_base = {}
+                _matcher = build_matcher(knowledge_base)
+    return _matcher
+
+
+def set_matcher(matcher: KeywordMatcher):
+    """Swap in a matcher built from a newer knowledge base"""
+    global _matcher
+    with _matcher_lock:
+        _matcher = matcher
@@ -0,0 +1,153 @@
+"""
+LLM gateway benchmark
+Runs LLMGateway against a local fake OpenAI-compatible server with a slow
+tail and injected errors, with and without hedging
+
+Usage: python -m rag.llm_benchmark [--requests 200] [--concurrency 8]
+                                   [--tail-rate 0.05] [--error-rate 0.02]
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from rag.llm_gateway import LLMGateway
+
+
+class FakeCompletionsServer:
+    """
+    Minimal /chat/completions endpoint: lognormal latency around median_ms, a
+    tail_rate of requests taking tail_ms, and an error_rate of HTTP 500s.
+    Supports stream=true as server-sent events.
+    """
+
+    def __init__(self, median_ms: float = 80, tail_ms: float = 1500,
+                 tail_rate: float = 0.05, error_rate: float = 0.02, seed: int = 0):
+        self.median_ms = median_ms
+        self.tail_ms = tail_ms
+        self.tail_rate = tail_rate
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *_):
+                pass
+
+            def do_POST(self):
+                try:
+                    self._respond()
+                except (BrokenPipeError, ConnectionResetError):
+                    # The gateway cancelled this request (hedge loser or deadline)
+                    pass
+
+            def _respond(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b"{}")
+                with server.rng_lock:
+                    server.requests += 1
+                    fail = server.rng.random() < server.error_rate
+                    slow = server.rng.random() < server.tail_rate
+                    delay_ms = server.tail_ms if slow else server.median_ms * server.rng.lognormvariate(0, 0.3)
+                time.sleep(delay_ms / 1000)
+
+                if fail:
+                    self.send_response(500)
+                    self.send_header('Content-Type', 'application/json')
+                    self.end_headers()
+                    self.wfile.write(b'{"error": {"message": "injected failure"}}')
+                    return
+
+                text = "Implants are titanium posts that replace missing tooth roots."
+                if body.get('stream'):
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/event-stream')
+                    self.end_headers()
+                    for word in text.split(' '):
+                        chunk = {"id": "fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                                 "model": body.get('model'),
+                                 "choices": [{"index": 0, "delta": {"content": word + ' '}, "finish_reason": None}]}
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                        self.wfile.flush()
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    return
+
+                payload = json.dumps({
+                    "id": "fake", "object": "chat.completion", "created": int(time.time()),
+                    "model": body.get('model'),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                                 "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20}
+                }).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def run(gateway: LLMGateway, requests: int, concurrency: int) -> int:
+    messages = [{"role": "user", "content": "Tell me about implants"}]
+
+    def one(_):
+        try:
+            gateway.complete(messages, max_tokens=50)
+            return True
+        except Exception:
+            return False
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return sum(pool.map(one, range(requests)))
+
+
+def report(label: str, gateway: LLMGateway, ok: int, requests: int):
+    stats = gateway.stats()
+    latency = stats['call_latency']
+    print(f"{label}: {ok}/{requests} ok, p50 {latency['p50_ms']:.0f} ms, p95 {latency['p95_ms']:.0f} ms, "
+          f"p99 {latency['p99_ms']:.0f} ms | retries {stats['retries']}, hedges {stats['hedges']} "
+          f"(won {stats['hedge_wins']}), breaker {stats['breaker_state']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the LLM gateway against a fake server")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--tail-rate", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    args = parser.parse_args()
+
+    for hedge in (False, True):
+        with FakeCompletionsServer(tail_rate=args.tail_rate, error_rate=args.error_rate) as server:
+            gateway = LLMGateway(api_key="fake", base_url=server.base_url, deadline_seconds=5.0,
+                                 hedge=hedge, min_hedge_delay_seconds=0.2)
+            ok = run(gateway, args.requests, args.concurrency)
+            report("hedged  " if hedge else "unhedged", gateway, ok, args.requests)
+
+    with FakeCompletionsServer(tail_rate=0, error_rate=0) as server:
+        gateway = LLMGateway(api_key="fake", base_url=server.base_url)
+        tokens = list(gateway.stream([{"role": "user", "content": "hi"}], max_tokens=50))
+        print(f"stream: {len(tokens)} tokens, first token "
+              f"{gateway.stats()['first_token_latency']['p50_ms']:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
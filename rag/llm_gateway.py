@@ -0,0 +1,380 @@
+"""
+LLM gateway
+AsyncGroq calls with per-call deadlines, jittered retries, hedged requests,
+a circuit breaker and latency histograms. Runs its own event loop thread so
+the synchronous Streamlit code can call it directly.
+"""
+import time
+import queue
+import random
+import asyncio
+import bisect
+import threading
+from collections import deque
+from typing import Dict, Iterator, List, Optional
+
+import groq
+from groq import AsyncGroq
+
+DEFAULT_MODEL = "llama-3.3-70b-versatile"
+
+# Errors worth another attempt; 4xx other than rate limits will fail again
+RETRYABLE_ERRORS = (
+    groq.APIConnectionError,
+    groq.APITimeoutError,
+    groq.RateLimitError,
+    groq.InternalServerError,
+    asyncio.TimeoutError,
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the provider while the breaker is open"""
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram plus a window of recent samples for quantiles"""
+
+    BUCKETS_MS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+    def __init__(self, window: int = 512):
+        self._lock = threading.Lock()
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, ms: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.BUCKETS_MS, ms)] += 1
+            self.total += 1
+            self.sum_ms += ms
+            self.recent.append(ms)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self.recent:
+                return None
+            ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            buckets = {f"le_{bound}ms": count for bound, count in zip(self.BUCKETS_MS, self.counts)}
+            buckets["le_inf"] = self.counts[-1]
+            total, sum_ms = self.total, self.sum_ms
+        return {
+            "count": total,
+            "mean_ms": sum_ms / total if total else 0.0,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "buckets": buckets,
+        }
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures; lets one probe through after the cool-down"""
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                return True
+            return self.state == "closed"
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """A call ended without a verdict (cancelled); a pending probe goes to the next caller"""
+        with self._lock:
+            if self.state == "half_open":
+                # opened_at is already past the cool-down, so the next allow() probes again
+                self.state = "open"
+
+
+async def _next_chunk(chunks):
+    """Next chunk of a stream, or None at its end"""
+    try:
+        return await chunks.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+class LLMGateway:
+    """Resilient chat-completion calls; complete() and stream() are safe to call from any thread"""
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: Optional[str] = None,
+        model: str = DEFAULT_MODEL,
+        deadline_seconds: float = 20.0,
+        max_retries: int = 2,
+        backoff_base_seconds: float = 0.25,
+        hedge: bool = True,
+        hedge_quantile: float = 0.95,
+        min_hedge_delay_seconds: float = 1.0,
+        min_hedge_samples: int = 20,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.deadline_seconds = deadline_seconds
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.min_hedge_delay_seconds = min_hedge_delay_seconds
+        self.min_hedge_samples = min_hedge_samples
+        self.breaker = breaker or CircuitBreaker()
+
+        self.call_latency = LatencyHistogram()
+        self.attempt_latency = LatencyHistogram()
+        self.first_token_latency = LatencyHistogram()
+        self._counters_lock = threading.Lock()
+        self.counters = {"calls": 0, "failures": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "rejected": 0}
+
+        self._client = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-gateway", daemon=True)
+        self._thread.start()
+
+    def _count(self, name: str):
+        with self._counters_lock:
+            self.counters[name] += 1
+
+    def _get_client(self) -> AsyncGroq:
+        # Created on the gateway loop so its httpx pool is bound to that loop
+        if self._client is None:
+            self._client = AsyncGroq(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                max_retries=0,
+                timeout=self.deadline_seconds
+            )
+        return self._client
+
+    # ---------- synchronous entry points ----------
+
+    def complete(self, messages: List[Dict[str, str]], deadline: Optional[float] = None,
+                 hedge: Optional[bool] = None, **params) -> str:
+        """Return the completion text or raise once the deadline, retries or breaker give up"""
+        future = asyncio.run_coroutine_threadsafe(
+            self.acomplete(messages, deadline=deadline, hedge=hedge, **params), self._loop
+        )
+        return future.result()
+
+    def stream(self, messages: List[Dict[str, str]], deadline: Optional[float] = None, **params) -> Iterator[str]:
+        """Yield tokens as they arrive; errors are raised from the iterator"""
+        tokens = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for token in self.astream(messages, deadline=deadline, **params):
+                    tokens.put(token)
+            except BaseException as e:
+                tokens.put(e)
+            finally:
+                tokens.put(done)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self._loop)
+        try:
+            while True:
+                item = tokens.get()
+                if item is done:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # Reader went away (e.g. the user left the page); stop the request
+            future.cancel()
+
+    # ---------- async implementation ----------
+
+    def _backoff(self, attempt: int) -> float:
+        """Full jitter: uniform in [0, base * 2^attempt]"""
+        return random.uniform(0, self.backoff_base_seconds * (2 ** attempt))
+
+    @staticmethod
+    def _remaining(deadline_at: float) -> float:
+        """Seconds left before deadline_at on the loop clock; raises once it has passed"""
+        remaining = deadline_at - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+        return remaining
+
+    def _hedge_delay(self) -> Optional[float]:
+        if self.attempt_latency.total < self.min_hedge_samples:
+            return None
+        threshold_ms = self.attempt_latency.quantile(self.hedge_quantile)
+        return max(self.min_hedge_delay_seconds, threshold_ms / 1000)
+
+    async def _attempt(self, messages, params) -> str:
+        start = time.perf_counter()
+        response = await self._get_client().chat.completions.create(
+            model=self.model, messages=messages, **params
+        )
+        self.attempt_latency.observe((time.perf_counter() - start) * 1000)
+        return response.choices[0].message.content.strip()
+
+    async def _hedged_attempt(self, messages, params, hedge: bool) -> str:
+        """Send a second identical request if the first is slower than the hedge threshold"""
+        primary = asyncio.ensure_future(self._attempt(messages, params))
+        tasks = [primary]
+        try:
+            delay = self._hedge_delay() if hedge else None
+            if delay is None:
+                return await primary
+
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if not done:
+                self._count("hedges")
+                tasks.append(asyncio.ensure_future(self._attempt(messages, params)))
+
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # The loser, or both on deadline/cancel, must not keep running
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _complete_with_retries(self, messages, params, hedge: bool) -> str:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self._hedged_attempt(messages, params, hedge)
+            except RETRYABLE_ERRORS:
+                if attempt == self.max_retries:
+                    raise
+                self._count("retries")
+                await asyncio.sleep(self._backoff(attempt))
+
+    async def acomplete(self, messages: List[Dict[str, str]], deadline: Optional[float] = None,
+                        hedge: Optional[bool] = None, **params) -> str:
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise CircuitOpenError("LLM circuit breaker is open")
+
+        self._count("calls")
+        hedge = self.hedge if hedge is None else hedge
+        start = time.perf_counter()
+        try:
+            # wait_for rather than asyncio.timeout, which needs Python 3.11
+            result = await asyncio.wait_for(
+                self._complete_with_retries(messages, params, hedge), deadline or self.deadline_seconds
+            )
+        except RETRYABLE_ERRORS:
+            # Outages, rate limits and the deadline count against the provider
+            self._count("failures")
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            # Bad requests and auth errors say nothing about provider health
+            self._count("failures")
+            self.breaker.release_probe()
+            raise
+        except BaseException:
+            # Cancelled: no verdict on the provider, but a half-open probe must not stay claimed
+            self.breaker.release_probe()
+            raise
+        finally:
+            self.call_latency.observe((time.perf_counter() - start) * 1000)
+
+        self.breaker.record_success()
+        return result
+
+    async def _open_stream(self, messages, params):
+        """(chunk iterator, first chunk or None); retries cover the request up to its first chunk"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                stream = await self._get_client().chat.completions.create(
+                    model=self.model, messages=messages, stream=True, **params
+                )
+                chunks = stream.__aiter__()
+                return chunks, await _next_chunk(chunks)
+            except RETRYABLE_ERRORS:
+                if attempt == self.max_retries:
+                    raise
+                self._count("retries")
+                await asyncio.sleep(self._backoff(attempt))
+
+    async def astream(self, messages: List[Dict[str, str]], deadline: Optional[float] = None, **params):
+        """
+        Streamed completion. Retries cover the request up to its first token;
+        once tokens have been yielded a failure is raised to the caller.
+        """
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise CircuitOpenError("LLM circuit breaker is open")
+
+        self._count("calls")
+        start = time.perf_counter()
+        # One deadline for the whole stream, applied to each wait (asyncio.timeout needs Python 3.11)
+        deadline_at = asyncio.get_running_loop().time() + (deadline or self.deadline_seconds)
+        try:
+            chunks, chunk = await asyncio.wait_for(self._open_stream(messages, params), self._remaining(deadline_at))
+            if chunk is not None:
+                self.first_token_latency.observe((time.perf_counter() - start) * 1000)
+            while chunk is not None:
+                token = chunk.choices[0].delta.content if chunk.choices else None
+                if token:
+                    yield token
+                chunk = await asyncio.wait_for(_next_chunk(chunks), self._remaining(deadline_at))
+        except RETRYABLE_ERRORS:
+            self._count("failures")
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            self._count("failures")
+            self.breaker.release_probe()
+            raise
+        except BaseException:
+            # Cancelled or closed by the reader: release a half-open probe, as in acomplete
+            self.breaker.release_probe()
+            raise
+        finally:
+            self.call_latency.observe((time.perf_counter() - start) * 1000)
+
+        self.breaker.record_success()
+
+    def stats(self) -> dict:
+        """Counters, breaker state and latency histograms for export"""
+        with self._counters_lock:
+            counters = dict(self.counters)
+        return {
+            **counters,
+            "breaker_state": self.breaker.state,
+            "call_latency": self.call_latency.snapshot(),
+            "attempt_latency": self.attempt_latency.snapshot(),
+            "first_token_latency": self.first_token_latency.snapshot(),
+        }
@@ -0,0 +1,95 @@
+"""
+Prompt token budgeting
+Counts tokens locally and decides how much history and knowledge base context
+fits in a prompt; turns that no longer fit are left for the rolling summary
+"""
+import re
+from typing import Callable, Dict, List, Tuple
+
+try:
+    import tiktoken
+    # Llama 3 uses a tiktoken BPE; cl100k_base counts within a few percent of it.
+    # The encoding is downloaded once and cached (TIKTOKEN_CACHE_DIR on offline hosts)
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception as e:
+    print(f"[PROMPT] tiktoken unavailable, estimating token counts: {e}")
+    _encoding = None
+
+_WORD_PATTERN = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+
+
+def _estimate_tokens(text: str) -> int:
+    # Without tiktoken: words, digit groups and symbols, with long words split
+    # the way BPE usually splits them
+    return sum(1 + len(piece) // 8 for piece in _WORD_PATTERN.findall(text))
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return _estimate_tokens(text)
+
+
+class PromptBudget:
+    """Token limits for each part of the prompt"""
+
+    def __init__(
+        self,
+        total: int = 3000,
+        history: int = 700,
+        knowledge: int = 900,
+        summary: int = 250,
+        max_history_messages: int = 10,
+        counter: Callable[[str], int] = count_tokens
+    ):
+        self.total = total
+        self.history = history
+        self.knowledge = knowledge
+        self.summary = summary
+        self.max_history_messages = max_history_messages
+        self.count = counter
+
+    def split_history(self, messages: List[Dict[str, str]], limit: int = None,
+                      max_messages: int = None) -> Tuple[List[Dict], List[Dict]]:
+        """
+        (kept, evicted) for messages ordered oldest first: the newest messages that
+        fit the history budget are kept verbatim, everything older is evicted
+        """
+        limit = self.history if limit is None else limit
+        max_messages = self.max_history_messages if max_messages is None else max_messages
+        kept, used = [], 0
+        for msg in reversed(messages):
+            cost = self.count(msg['message']) + 4
+            if len(kept) >= max_messages or used + cost > limit:
+                break
+            kept.append(msg)
+            used += cost
+        kept.reverse()
+        return kept, messages[:len(messages) - len(kept)]
+
+    def fit_texts(self, texts: List[str], limit: int) -> List[str]:
+        """Leading texts (best first) that fit within limit tokens"""
+        fitted, used = [], 0
+        for text in texts:
+            cost = self.count(text)
+            if used + cost > limit:
+                break
+            fitted.append(text)
+            used += cost
+        return fitted
+
+    def truncate(self, text: str, limit: int) -> str:
+        """Cut text to roughly limit tokens at a word boundary"""
+        if self.count(text) <= limit:
+            return text
+        words = text.split()
+        low, high = 0, len(words)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.count(' '.join(words[:mid])) <= limit:
+                low = mid
+            else:
+                high = mid - 1
+        return ' '.join(words[:low])
@@ -0,0 +1,214 @@
+"""
+Precomputed query embeddings
+A normalized-text -> embedding table for greetings, canned phrases, FAQ
+questions and the most frequent logged queries. It is built offline and
+memory-mapped at load, so exact and near-exact matches skip the encoder.
+
+Build:  python -m rag.query_table build [--backend torch] [--log queries.txt]
+                                        [--db-url URL] [--top 500]
+Report: python -m rag.query_table report --log queries.txt [--db-url URL]
+"""
+import re
+import json
+import shutil
+import argparse
+import tempfile
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, List, Optional
+import numpy as np
+
+# Outside the index cache, whose entries are pruned whenever the knowledge base changes
+DEFAULT_TABLE_DIR = Path(__file__).parent / ".query_table"
+KNOWLEDGE_BASE_PATH = Path(__file__).parent / "data.json"
+
+KEYS_FILE = "keys.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+
+# Messages patients send verbatim all the time
+CANNED_QUERIES = [
+    "hi", "hello", "hey", "salam", "assalam o alaikum", "good morning", "good evening",
+    "thanks", "thank you", "ok", "okay", "yes", "no", "bye",
+    "book appointment", "book an appointment", "i want to book an appointment",
+    "my appointments", "show my appointments", "cancel appointment", "reschedule appointment",
+    "what are your timings", "where are you located", "contact number",
+    "what treatments do you offer", "how much does an implant cost",
+]
+
+# Politeness that does not change what is being asked; dropped for near-exact matching
+FILLER_WORDS = {'please', 'pls', 'plz', 'kindly', 'can', 'could', 'you', 'u', 'tell', 'me', 'the', 'a', 'an'}
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_query(text: str) -> str:
+    """Lowercase, punctuation removed, whitespace collapsed"""
+    return _NON_WORD.sub(' ', text.lower()).strip()
+
+
+def near_exact_key(normalized: str) -> Optional[str]:
+    """normalized without filler words, or None if nothing would be left"""
+    words = [word for word in normalized.split() if word not in FILLER_WORDS]
+    return ' '.join(words) if words else None
+
+
+def table_dir(backend_name: str, model_name: str, root: Optional[Path] = None) -> Path:
+    """One table per model and backend, since their vectors are not interchangeable"""
+    safe_model = _NON_WORD.sub('-', model_name.lower()).strip('-')
+    return Path(root or DEFAULT_TABLE_DIR) / f"{safe_model}-{backend_name}"
+
+
+class QueryEmbeddingTable:
+    """Read-only lookup over a built table; counts exact, near-exact and missed lookups"""
+
+    def __init__(self, keys: List[str], embeddings: np.ndarray):
+        self.embeddings = embeddings
+        self.exact = {key: row for row, key in enumerate(keys)}
+        self.near = {}
+        for row, key in enumerate(keys):
+            near = near_exact_key(key)
+            if near is not None:
+                # First (most frequent) phrasing wins when two collapse to the same key
+                self.near.setdefault(near, row)
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, path: Path) -> Optional['QueryEmbeddingTable']:
+        """Memory-map a built table; None if it is missing or unreadable"""
+        path = Path(path)
+        if not (path / EMBEDDINGS_FILE).exists():
+            return None
+        try:
+            with open(path / KEYS_FILE, 'r', encoding='utf-8') as f:
+                keys = json.load(f)['keys']
+            embeddings = np.load(path / EMBEDDINGS_FILE, mmap_mode='r')
+            if len(keys) != embeddings.shape[0]:
+                return None
+            return cls(keys, embeddings)
+        except Exception as e:
+            print(f"[QUERY TABLE ERROR] {e}")
+            return None
+
+    def __len__(self) -> int:
+        return len(self.exact)
+
+    def lookup(self, query: str) -> Optional[np.ndarray]:
+        """(1, dim) float32 embedding for a known query, else None"""
+        normalized = normalize_query(query)
+        row = self.exact.get(normalized)
+        counter = 'exact_hits'
+        if row is None:
+            near = near_exact_key(normalized)
+            row = self.near.get(near) if near is not None else None
+            counter = 'near_hits'
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            setattr(self, counter, getattr(self, counter) + 1)
+        return np.array(self.embeddings[row:row + 1], dtype='float32')
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.exact_hits + self.near_hits + self.misses
+            return {
+                "entries": len(self),
+                "lookups": lookups,
+                "exact_hits": self.exact_hits,
+                "near_hits": self.near_hits,
+                "hit_rate": (self.exact_hits + self.near_hits) / lookups if lookups else 0.0,
+            }
+
+
+def build_table(backend, queries: Iterable[str], path: Path) -> int:
+    """Encode the unique normalized queries and write the table atomically; returns its size"""
+    keys = list(dict.fromkeys(key for key in (normalize_query(q) for q in queries) if key))
+    embeddings = backend.encode(keys)
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(dir=path.parent, prefix=".staging-"))
+    try:
+        np.save(staging / EMBEDDINGS_FILE, embeddings)
+        with open(staging / KEYS_FILE, 'w', encoding='utf-8') as f:
+            json.dump({"model": backend.model_name, "backend": backend.name, "keys": keys}, f, ensure_ascii=False)
+        if path.exists():
+            shutil.rmtree(path)
+        staging.rename(path)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return len(keys)
+
+
+def faq_questions(knowledge_base: dict) -> List[str]:
+    return [faq['question'] for faq in knowledge_base.get('faqs', []) if faq.get('question')]
+
+
+def read_log(path: Optional[str]) -> List[str]:
+    """One query per line"""
+    if not path:
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def logged_user_messages(db_url: Optional[str]) -> List[str]:
+    """Every user message in chat_messages, for offline frequency counting"""
+    if not db_url:
+        return []
+    from sqlalchemy import create_engine, text
+    engine = create_engine(db_url)
+    try:
+        with engine.connect() as connection:
+            rows = connection.execute(text("SELECT message FROM chat_messages WHERE role = 'user'"))
+            return [row[0] for row in rows]
+    finally:
+        engine.dispose()
+
+
+def most_frequent(queries: List[str], top: int, min_count: int = 2) -> List[str]:
+    """Normalized queries seen at least min_count times, most frequent first"""
+    counts = Counter(key for key in (normalize_query(q) for q in queries) if key)
+    return [key for key, count in counts.most_common(top) if count >= min_count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or evaluate the precomputed query embedding table")
+    parser.add_argument("command", choices=["build", "report"])
+    parser.add_argument("--backend", default="torch", help="Embedding backend the table is built for")
+    parser.add_argument("--model-dir", help="Local copy of the model files")
+    parser.add_argument("--log", help="Query log, one message per line")
+    parser.add_argument("--db-url", help="Read logged user messages from this database")
+    parser.add_argument("--top", type=int, default=500, help="Most frequent logged queries to include")
+    parser.add_argument("--out", help="Table directory (default: under the index cache)")
+    args = parser.parse_args()
+
+    from rag.embedding_backends import create_embedding_backend
+    backend = create_embedding_backend(args.backend, model_dir=args.model_dir)
+    path = Path(args.out) if args.out else table_dir(backend.name, backend.model_name)
+    logged = read_log(args.log) + logged_user_messages(args.db_url)
+
+    if args.command == "build":
+        with open(KNOWLEDGE_BASE_PATH, 'r', encoding='utf-8') as f:
+            knowledge_base = json.load(f)
+        queries = CANNED_QUERIES + faq_questions(knowledge_base) + most_frequent(logged, args.top)
+        size = build_table(backend, queries, path)
+        print(f"built {size} entries for {backend.name} at {path}")
+        return
+
+    table = QueryEmbeddingTable.load(path)
+    if table is None:
+        raise SystemExit(f"No query table at {path}; run the build command first")
+    for query in logged:
+        table.lookup(query)
+    stats = table.stats()
+    print(f"{stats['lookups']} logged queries: hit rate {stats['hit_rate']:.1%} "
+          f"(exact {stats['exact_hits']}, near-exact {stats['near_hits']}) over {stats['entries']} entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,112 @@
 """
 Enhanced RAG Chatbot with Smart Booking & Name Recognition
 """
-import os
 import json
-from typing import List, Dict, Optional
-from datetime import datetime, date, time, timedelta
-from sentence_transformers import SentenceTransformer
-import faiss
+from typing import List, Dict, Optional, Iterator, Tuple
+from datetime import datetime, date
+import threading
 import numpy as np
-from groq import Groq
-import re
+from rag.index_store import IndexStore, compute_cache_key
+from rag.response_cache import SemanticResponseCache
+from rag.embedding_service import BatchEmbeddingService
+from rag.embedding_backends import EmbeddingBackend, create_embedding_backend
+from rag.query_table import QueryEmbeddingTable, table_dir
+from rag.retrieval import BM25Index, reciprocal_rank_fusion, tokenize
+from rag.keyword_matcher import build_matcher
+from rag.llm_gateway import LLMGateway
+from rag.prompt_budget import PromptBudget
+from rag.chunker import KnowledgeBaseChunker, matches_filters
+from rag.vector_index import (
+    build_vector_index, choose_index_kind, index_kind_of, normalize, updated_index, search as search_vectors
+)
+from rag.kb_reload import KnowledgeSnapshot
+from rag.tracing import get_tracer
+
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# Chunks whose cosine similarity to the query is below this never reach the prompt
+MIN_RELEVANCE = 0.2
+
+TECHNICAL_ISSUE_MESSAGE = "Sorry, I'm having a technical issue. Please call us at +92 300 1234567 for immediate assistance."
+
+# Words that tie a question to the patient or to earlier turns; such questions
+# are never answered from the shared response cache
+PERSONAL_OR_FOLLOWUP_WORDS = {
+    'i', 'im', 'me', 'my', 'mine', 'myself', 'we', 'our', 'us',
+    'it', 'its', 'that', 'this', 'those', 'these', 'they', 'them', 'he', 'she'
+}
 
 class RAGChatbot:
-    def __init__(self, knowledge_base_path: str, groq_api_key: str):
-        self.groq_client = Groq(api_key=groq_api_key)
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.knowledge_base = self._load_knowledge_base(knowledge_base_path)
-        self.chunks = self._create_chunks()
-        self.index = self._build_faiss_index()
+    def __init__(
+        self,
+        knowledge_base_path: str,
+        groq_api_key: str,
+        index_cache_dir: Optional[str] = None,
+        load_dense: bool = True,
+        response_cache: Optional[SemanticResponseCache] = None,
+        candidate_pool: int = 10,
+        llm: Optional[LLMGateway] = None,
+        prompt_budget: Optional[PromptBudget] = None,
+        chunker: Optional[KnowledgeBaseChunker] = None,
+        embedding_backend: Optional[EmbeddingBackend] = None,
+        query_table: Optional[QueryEmbeddingTable] = None,
+        index_kind: str = 'auto',
+        min_relevance: float = MIN_RELEVANCE
+    ):
+        self.llm = llm or LLMGateway(api_key=groq_api_key)
+        self.prompt_budget = prompt_budget or PromptBudget()
+        self.knowledge_base_path = knowledge_base_path
+        self.chunker = chunker or KnowledgeBaseChunker()
+        # Backends produce slightly different vectors, so each gets its own index cache entry
+        self.embedding_backend = embedding_backend or create_embedding_backend('torch', EMBEDDING_MODEL_NAME)
+        # 'auto' picks flat, HNSW or IVF-PQ from the chunk count (see rag.vector_index)
+        self.index_kind = index_kind
+        self.min_relevance = min_relevance
+        self.index_store = IndexStore(index_cache_dir)
+        # Everything derived from the knowledge base lives in one snapshot that
+        # reload_knowledge_base() replaces as a whole (see rag.kb_reload)
+        self.snapshot = self._make_snapshot(self._load_knowledge_base(knowledge_base_path))
+        self.response_cache = response_cache or SemanticResponseCache()
+        self.response_cache.set_version(self.kb_version)
+        self.candidate_pool = candidate_pool
         self.system_prompt = self._create_system_prompt()
+        
+        # Dense retrieval is filled in by load_dense_index(); until then
+        # _retrieve_context uses BM25 only
+        self.embedding_service = None
+        self.query_table = query_table
+        self.dense_ready = threading.Event()
+        # Serializes dense loading and reloads, which both replace the snapshot
+        self._dense_lock = threading.Lock()
+        
+        if load_dense:
+            self.load_dense_index()
+    
+    def load_dense_index(self):
+        """Load the embedding model and FAISS index (safe to call from a background thread)"""
+        with self._dense_lock:
+            if self.dense_ready.is_set():
+                return
+            self.embedding_backend.load()
+            if self.query_table is None:
+                # Built offline with python -m rag.query_table build; optional
+                self.query_table = QueryEmbeddingTable.load(
+                    table_dir(self.embedding_backend.name, self.embedding_backend.model_name)
+                )
+            embeddings, index = self._load_or_build_index(self.snapshot)
+            self.snapshot = self.snapshot.with_dense(embeddings, index)
+            # Query encodes from concurrent sessions share batched forward passes
+            self.embedding_service = BatchEmbeddingService(self.embedding_backend)
+            self.dense_ready.set()
+    
+    # Read-only views of the current snapshot
+    knowledge_base = property(lambda self: self.snapshot.knowledge_base)
+    kb_version = property(lambda self: self.snapshot.kb_version)
+    chunks = property(lambda self: self.snapshot.chunks)
+    bm25 = property(lambda self: self.snapshot.bm25)
+    matcher = property(lambda self: self.snapshot.matcher)
+    embeddings = property(lambda self: self.snapshot.embeddings)
+    index = property(lambda self: self.snapshot.index)
     
     def _load_knowledge_base(self, path: str) -> dict:
         try:
@@ -27,43 +115,103 @@ class RAGChatbot:
         except:
             return {"treatments": {}, "faqs": [], "clinic_info": {}}
     
-    def _create_chunks(self) -> List[Dict[str, str]]:
-        chunks = []
-        
-        # Treatment chunks
-        for treatment_key, treatment in self.knowledge_base.get('treatments', {}).items():
-            chunk_text = f"Treatment: {treatment['title']}\n"
-            chunk_text += f"Description: {treatment['description']}\n"
-            chunk_text += f"Indications: {', '.join(treatment.get('indications', []))}\n"
-            chunk_text += f"Procedure: {' '.join(treatment.get('procedure_steps', []))}"
-            chunks.append({'text': chunk_text, 'metadata': {'type': 'treatment', 'name': treatment_key}})
-            
-            if 'aftercare_and_home_instructions' in treatment:
-                aftercare_text = f"{treatment['title']} - Aftercare:\n" + '\n'.join(treatment['aftercare_and_home_instructions'])
-                chunks.append({'text': aftercare_text, 'metadata': {'type': 'treatment', 'name': treatment_key}})
+    def _make_snapshot(self, knowledge_base: dict) -> KnowledgeSnapshot:
+        """Chunks (see rag.chunker), BM25 and keyword matcher for a knowledge base; no dense index yet"""
+        kb_version = compute_cache_key(
+            knowledge_base,
+            f"{self.embedding_backend.model_name}/{self.embedding_backend.name}/{self.index_kind}",
+            f"{self.chunker.max_words}/{self.chunker.overlap_words}"
+        )
+        chunks = self.chunker.chunk(knowledge_base)
+        bm25 = BM25Index([chunk['text'] for chunk in chunks])
+        # Intent/entity keywords (branches, dentists, treatments) come from this knowledge base
+        return KnowledgeSnapshot(knowledge_base, kb_version, chunks, bm25, build_matcher(knowledge_base))
+    
+    def _load_or_build_index(self, snapshot: KnowledgeSnapshot) -> tuple:
+        """(embeddings, index), reusing the on-disk entry when the knowledge base and model are unchanged"""
+        cache_key = snapshot.kb_version
+        cached = self.index_store.load(cache_key)
+        if cached is not None:
+            index, _, embeddings = cached
+            return embeddings, index
         
-        # FAQ chunks
-        for faq in self.knowledge_base.get('faqs', []):
-            faq_text = f"Q: {faq['question']}\nA: {faq['answer']}"
-            chunks.append({'text': faq_text, 'metadata': {'type': 'faq'}})
+        embeddings, index = self._build_faiss_index(snapshot)
+        if snapshot.chunks:
+            self.index_store.save(cache_key, index, snapshot.chunks, embeddings)
+            self.index_store.prune(cache_key)
+        return embeddings, index
+    
+    def _build_faiss_index(self, snapshot: KnowledgeSnapshot) -> tuple:
+        if not snapshot.chunks:
+            embeddings = np.zeros((0, self.embedding_backend.dimension), dtype='float32')
+            return embeddings, build_vector_index(embeddings, self.index_kind, self.embedding_backend.dimension,
+                                                  ids=snapshot.ids)
+        texts = [chunk['text'] for chunk in snapshot.chunks]
+        # Stored normalized so relevance scores are plain dot products
+        embeddings = normalize(self.embedding_backend.encode(texts))
+        return embeddings, build_vector_index(embeddings, self.index_kind, ids=snapshot.ids)
+    
+    def reload_knowledge_base(self, path: Optional[str] = None) -> dict:
+        """
+        Re-read the knowledge base and swap in a new snapshot. Only chunks whose
+        hash is new get encoded; the rest reuse their embeddings, and the live
+        index is copied and updated by chunk id instead of rebuilt. Requests
+        already running keep the snapshot they started with.
+        """
+        path = path or self.knowledge_base_path
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                knowledge_base = json.load(f)
+        except Exception as e:
+            # Half-written or invalid JSON: keep serving the current version
+            return {"success": False, "error": f"Could not read knowledge base: {e}"}
         
-        # Clinic info chunks
-        clinic_info = self.knowledge_base.get('clinic_info', {})
-        for branch in clinic_info.get('branches', []):
-            branch_text = f"Branch: {branch['name']}\nAddress: {branch['address']}\nPhone: {branch['phone']}\nHours: {json.dumps(branch.get('hours', {}))}"
-            chunks.append({'text': branch_text, 'metadata': {'type': 'clinic', 'branch_name': branch['name']}})
+        with self._dense_lock:
+            current = self.snapshot
+            new = self._make_snapshot(knowledge_base)
+            if new.kb_version == current.kb_version:
+                return {"success": True, "changed": False}
+            
+            diff = current.diff(new)
+            encoded = 0
+            if current.index is not None:
+                try:
+                    embeddings, index, encoded = self._update_dense(current, new, diff)
+                except Exception as e:
+                    return {"success": False, "error": f"Could not update the index: {e}"}
+                new = new.with_dense(embeddings, index)
+                self.index_store.save(new.kb_version, index, new.chunks, embeddings)
+                self.index_store.prune(new.kb_version)
+            
+            self.snapshot = new
+            self.response_cache.set_version(new.kb_version)
         
-        return chunks
+        return {"success": True, "changed": True, "version": new.kb_version, "encoded": encoded, **diff}
     
-    def _build_faiss_index(self):
-        if not self.chunks:
-            return faiss.IndexFlatL2(384)
-        texts = [chunk['text'] for chunk in self.chunks]
-        embeddings = self.embedding_model.encode(texts, convert_to_numpy=True)
-        dimension = embeddings.shape[1]
-        index = faiss.IndexFlatL2(dimension)
-        index.add(embeddings.astype('float32'))
-        return index
+    def _update_dense(self, current: KnowledgeSnapshot, new: KnowledgeSnapshot, diff: dict) -> tuple:
+        """(embeddings, index, chunks encoded) for new, reusing current's vectors by chunk id"""
+        embeddings = np.zeros((len(new.chunks), self.embedding_backend.dimension), dtype='float32')
+        added_rows = []
+        for row, chunk_id in enumerate(new.ids):
+            old_row = current.rows.get(int(chunk_id))
+            if old_row is None:
+                added_rows.append(row)
+            else:
+                embeddings[row] = current.embeddings[old_row]
+        if added_rows:
+            embeddings[added_rows] = normalize(
+                self.embedding_backend.encode([new.chunks[row]['text'] for row in added_rows])
+            )
+        
+        target_kind = self.index_kind if self.index_kind != 'auto' else choose_index_kind(len(new.chunks))
+        index = None
+        if index_kind_of(current.index) == target_kind:
+            index = updated_index(current.index, np.array(diff['removed'], dtype='int64'),
+                                  embeddings[added_rows], new.ids[added_rows])
+        if index is None:
+            # Crossed a size threshold, or HNSW (no removal): rebuild from the reused vectors
+            index = build_vector_index(embeddings, self.index_kind, self.embedding_backend.dimension, ids=new.ids)
+        return embeddings, index, len(added_rows)
     
     def _create_system_prompt(self) -> str:
         return """You are a helpful dental assistant at NeoImplant Dental Studio.
@@ -93,27 +241,150 @@ NEVER:
 
 Be natural, warm, helpful, and conversational. Think of yourself as a friendly receptionist."""
 
-    def _retrieve_context(self, query: str, top_k: int = 3) -> str:
-        if not self.chunks:
+    def _embed_query(self, query: str) -> Optional[np.ndarray]:
+        """Encode a query, or None while the dense index is still loading"""
+        if not self.dense_ready.is_set():
+            return None
+        with get_tracer().span("rag.embed") as span:
+            if self.query_table is not None:
+                # Greetings, canned phrases and FAQ questions skip the encoder
+                vector = self.query_table.lookup(query)
+                if vector is not None:
+                    span.set(source="table")
+                    return vector
+            span.set(source="model")
+            try:
+                return self.embedding_service.encode([query])
+            except Exception as e:
+                span.record_error(e)
+                print(f"[EMBEDDING ERROR] {e}")
+                return None
+    
+    def _rank_chunks(
+        self,
+        query: str,
+        top_k: int = 3,
+        query_embedding: Optional[np.ndarray] = None,
+        filters: Optional[Dict] = None,
+        strict: bool = True,
+        snapshot: Optional[KnowledgeSnapshot] = None
+    ) -> List[int]:
+        """
+        Hybrid retrieval: BM25 and dense candidates fused with reciprocal rank fusion.
+        filters restricts candidates by chunk metadata, e.g. {'type': 'aftercare'}
+        or {'branch': 'Clifton'} (see rag.chunker.matches_filters). With dense
+        retrieval available, fused chunks below min_relevance cosine are dropped.
+        Returns positions in snapshot.chunks (the current snapshot by default).
+        """
+        snapshot = snapshot or self.snapshot
+        pool = max(self.candidate_pool, top_k)
+        allowed = {
+            idx for idx, chunk in enumerate(snapshot.chunks)
+            if matches_filters(chunk['metadata'], filters, strict)
+        }
+        lexical = [idx for idx, _ in snapshot.bm25.search(query, pool, allowed=allowed)]
+        
+        if not self.dense_ready.is_set() or snapshot.index is None:
+            return lexical[:top_k]
+        
+        if query_embedding is None:
+            query_embedding = self._embed_query(query)
+            if query_embedding is None:
+                return lexical[:top_k]
+        # The index holds chunk ids; rows are positions in snapshot.chunks
+        allowed_ids = None if len(allowed) == len(snapshot.chunks) else snapshot.ids[sorted(allowed)]
+        rescore = lambda ids, query_vector: snapshot.embeddings[[snapshot.rows[int(i)] for i in ids]] @ query_vector
+        _, ids = search_vectors(snapshot.index, query_embedding, pool, allowed_ids, rescore)
+        dense = [snapshot.rows[int(i)] for i in ids if int(i) in snapshot.rows]
+        
+        fused = reciprocal_rank_fusion([dense, lexical])
+        query_vector = normalize(query_embedding)[0]
+        relevant = [
+            idx for idx, _ in fused
+            if float(np.dot(snapshot.embeddings[idx], query_vector)) >= self.min_relevance
+        ]
+        return relevant[:top_k]
+    
+    def _infer_filters(self, query: str) -> Optional[Dict]:
+        """Metadata filters implied by the query, e.g. a branch name"""
+        hits = self.matcher.match(query)
+        if hits.has('branch'):
+            return {'branch': [value for value, _ in hits.hits['branch']]}
+        return None
+    
+    def _retrieve_context(
+        self,
+        query: str,
+        top_k: int = 3,
+        query_embedding: Optional[np.ndarray] = None,
+        filters: Optional[Dict] = None
+    ) -> str:
+        snapshot = self.snapshot
+        if not snapshot.chunks:
             return "No context available."
         try:
-            query_embedding = self.embedding_model.encode([query], convert_to_numpy=True)
-            distances, indices = self.index.search(query_embedding.astype('float32'), top_k)
-            relevant_chunks = [self.chunks[idx]['text'] for idx in indices[0] if idx < len(self.chunks)]
+            indices = self._rank_chunks(query, top_k, query_embedding, filters, snapshot=snapshot)
+            if not indices:
+                return "No context available."
+            relevant_chunks = [snapshot.chunks[idx]['text'] for idx in indices]
             return "\n\n---\n\n".join(relevant_chunks)
         except:
             return "Error retrieving context."
     
-    def _format_chat_history(self, messages: List[Dict[str, str]]) -> str:
-        if not messages:
+    def _format_chat_history(self, messages: List[Dict[str, str]], summary: Optional[str] = None) -> str:
+        if not messages and not summary:
             return "This is the FIRST message from patient."
         
-        formatted = "CONVERSATION HISTORY:\n"
-        for msg in messages[-10:]:  # Last 10 messages for context
-            role = "Patient" if msg['role'] == 'user' else "You"
-            formatted += f"{role}: {msg['message']}\n"
+        formatted = ""
+        if summary:
+            formatted += f"SUMMARY OF EARLIER CONVERSATION:\n{summary}\n\n"
+        if messages:
+            formatted += "CONVERSATION HISTORY:\n"
+            for msg in messages:
+                role = "Patient" if msg['role'] == 'user' else "You"
+                formatted += f"{role}: {msg['message']}\n"
         return formatted
     
+    def plan_history(self, messages: List[Dict[str, str]]) -> tuple:
+        """
+        (kept, to_summarize): the newest messages that fit the history budget are sent
+        verbatim. Once one no longer fits, everything older than what fits in half the
+        budget is folded into the summary, so the next few turns fit without another
+        summary call and no dropped turn goes unsummarized
+        """
+        budget = self.prompt_budget
+        kept, evicted = budget.split_history(messages)
+        if not evicted:
+            return kept, []
+        _, to_summarize = budget.split_history(
+            messages, limit=budget.history // 2, max_messages=budget.max_history_messages // 2
+        )
+        return kept, to_summarize
+    
+    def summarize_history(self, previous_summary: str, messages: List[Dict[str, str]]) -> Optional[str]:
+        """Fold messages into the running conversation summary; None if the LLM is unavailable"""
+        transcript = "\n".join(
+            f"{'Patient' if msg['role'] == 'user' else 'Assistant'}: {msg['message']}" for msg in messages
+        )
+        try:
+            return self.llm.complete(
+                [
+                    {"role": "system", "content": (
+                        "You maintain a running summary of a dental clinic chat. Merge the new messages "
+                        "into the summary. Keep facts that matter later: symptoms, treatments discussed, "
+                        "booking details, preferences and open questions. At most 120 words, plain text."
+                    )},
+                    {"role": "user", "content": f"Current summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"}
+                ],
+                deadline=15.0,
+                hedge=False,
+                temperature=0.2,
+                max_tokens=self.prompt_budget.summary
+            )
+        except Exception as e:
+            print(f"[GROQ ERROR] Summary failed: {e}")
+            return None
+    
     def _create_patient_context(self, user_profile: Optional[Dict] = None) -> str:
         """Create patient context with clear instructions about name"""
         if not user_profile:
@@ -140,10 +411,18 @@ Be natural, warm, helpful, and conversational. Think of yourself as a friendly r
         
         return context
     
+    def _is_cacheable_query(self, message: str) -> bool:
+        """General knowledge questions that don't depend on the patient or the conversation"""
+        terms = tokenize(message)
+        if len(terms) < 3 or any(term.isdigit() for term in terms):
+            return False
+        if PERSONAL_OR_FOLLOWUP_WORDS.intersection(terms):
+            return False
+        return not self.extract_booking_intent(message)
+    
     def extract_booking_intent(self, message: str) -> bool:
         """Check if user wants to book appointment"""
-        booking_keywords = ['book', 'appointment', 'schedule', 'reserve', 'visit', 'consultation']
-        return any(keyword in message.lower() for keyword in booking_keywords)
+        return self.matcher.match(message).has('booking_intent')
     
     def get_available_branches(self) -> List[str]:
         """Get branch names from knowledge base"""
@@ -175,16 +454,17 @@ Be natural, warm, helpful, and conversational. Think of yourself as a friendly r
         except:
             return False, "Invalid date format. Use YYYY-MM-DD"
     
-    def validate_appointment_time(self, time_str: str, date_str: str) -> tuple:
-        """Validate if time is within working hours"""
+    def validate_appointment_time(self, time_str: str, date_str: str, branch: str) -> tuple:
+        """Validate if time is within the chosen branch's working hours"""
         try:
             appt_time = datetime.strptime(time_str, '%H:%M').time()
             appt_date = datetime.strptime(date_str, '%Y-%m-%d').date()
             weekday = appt_date.strftime('%A').lower()
             
             branches = self.knowledge_base.get('clinic_info', {}).get('branches', [])
-            if branches:
-                hours = branches[0].get('hours', {}).get(weekday, "Closed")
+            selected = next((b for b in branches if b.get('name') == branch), None)
+            if selected:
+                hours = selected.get('hours', {}).get(weekday, "Closed")
                 if hours == "Closed":
                     return False, f"Clinic is closed on {weekday.capitalize()}"
                 
@@ -202,25 +482,33 @@ Be natural, warm, helpful, and conversational. Think of yourself as a friendly r
         except:
             return False, "Invalid time format. Use HH:MM (e.g., 14:00)"
     
-    def generate_response(
-        self, 
-        user_message: str, 
+    def _build_messages(
+        self,
+        user_message: str,
         chat_history: List[Dict[str, str]] = None,
-        user_profile: Optional[Dict] = None
-    ) -> str:
-        """Generate chatbot response using RAG"""
-        
-        # Get relevant knowledge base context
-        kb_context = self._retrieve_context(user_message, top_k=2)
-        
-        # Create patient context
-        patient_context = self._create_patient_context(user_profile)
+        user_profile: Optional[Dict] = None,
+        query_embedding: Optional[np.ndarray] = None,
+        shareable: bool = False,
+        history_summary: Optional[str] = None
+    ) -> Tuple[List[Dict[str, str]], int]:
+        """
+        (messages, prompt tokens): the system and user messages sent to the LLM within
+        the prompt budget. The count is returned rather than kept on the chatbot, which
+        every session shares.
+        Fixed parts go in first; knowledge base chunks, the history summary and recent
+        turns are then added while they fit. A shareable prompt leaves out patient
+        context and history so the answer can be served to other patients from the
+        response cache.
+        """
+        budget = self.prompt_budget
         
-        # Format chat history
-        history_text = self._format_chat_history(chat_history)
+        if shareable:
+            patient_context = "General clinic question - answer it without using or asking for the patient's name.\n"
+        else:
+            patient_context = self._create_patient_context(user_profile)
         
-        # Build full prompt
-        full_prompt = f"""{patient_context}
+        def render(kb_context: str, history_text: str) -> str:
+            return f"""{patient_context}
 
 {history_text}
 
@@ -231,35 +519,135 @@ Patient's Latest Message: {user_message}
 
 Respond naturally and helpfully. Remember to check patient context before asking questions:"""
         
+        remaining = budget.total - budget.count(self.system_prompt) - budget.count(render("", ""))
+        
+        # Get relevant knowledge base context, best chunks first
+        with get_tracer().span("rag.retrieval") as span:
+            try:
+                snapshot = self.snapshot
+                # Filters inferred from the message only narrow, never exclude general chunks
+                indices = self._rank_chunks(user_message, 2, query_embedding, self._infer_filters(user_message),
+                                            strict=False, snapshot=snapshot)
+                chunk_texts = budget.fit_texts([snapshot.chunks[idx]['text'] for idx in indices],
+                                               min(budget.knowledge, max(remaining, 0)))
+                kb_context = "\n\n---\n\n".join(chunk_texts) or "No context available."
+                span.set(chunks=len(chunk_texts), dense=snapshot.index is not None)
+            except Exception as e:
+                span.record_error(e)
+                kb_context = "Error retrieving context."
+        remaining -= budget.count(kb_context)
+        
+        if shareable:
+            history_text = "Answer this question on its own."
+        else:
+            summary = budget.truncate(history_summary, budget.summary) if history_summary else None
+            remaining -= budget.count(summary or "")
+            kept, _ = budget.split_history(chat_history or [], min(budget.history, max(remaining, 0)))
+            history_text = self._format_chat_history(kept, summary)
+        
+        full_prompt = render(kb_context, history_text)
+        prompt_tokens = budget.count(self.system_prompt) + budget.count(full_prompt)
+        
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": full_prompt}
+        ], prompt_tokens
+    
+    def generate_response(
+        self, 
+        user_message: str, 
+        chat_history: List[Dict[str, str]] = None,
+        user_profile: Optional[Dict] = None,
+        history_summary: Optional[str] = None
+    ) -> str:
+        """Generate chatbot response using RAG"""
+        kb_version = self.kb_version
+        query_embedding = self._embed_query(user_message)
+        cacheable = query_embedding is not None and self._is_cacheable_query(user_message)
+        if cacheable:
+            cached = self.response_cache.get(query_embedding)
+            if cached is not None:
+                return cached
+        
+        messages, prompt_tokens = self._build_messages(
+            user_message, chat_history, user_profile, query_embedding, cacheable, history_summary
+        )
+        
+        with get_tracer().span("rag.llm", prompt_tokens=prompt_tokens, stream=False) as span:
+            try:
+                answer = self.llm.complete(messages, temperature=0.7, max_tokens=400)
+                if cacheable and answer:
+                    self.response_cache.put(query_embedding, answer, kb_version)
+                return answer
+            except Exception as e:
+                span.record_error(e)
+                print(f"[GROQ ERROR] {e}")
+                return TECHNICAL_ISSUE_MESSAGE
+    
+    def generate_response_stream(
+        self,
+        user_message: str,
+        chat_history: List[Dict[str, str]] = None,
+        user_profile: Optional[Dict] = None,
+        history_summary: Optional[str] = None
+    ) -> Iterator[str]:
+        """Generate chatbot response using RAG, yielding tokens as they arrive"""
+        kb_version = self.kb_version
+        query_embedding = self._embed_query(user_message)
+        cacheable = query_embedding is not None and self._is_cacheable_query(user_message)
+        if cacheable:
+            cached = self.response_cache.get(query_embedding)
+            if cached is not None:
+                yield cached
+                return
+        
+        messages, prompt_tokens = self._build_messages(
+            user_message, chat_history, user_profile, query_embedding, cacheable, history_summary
+        )
+        
+        parts = []
+        tracer = get_tracer()
+        # Not made current: the caller may stop iterating at any point
+        span = tracer.start_span("rag.llm", prompt_tokens=prompt_tokens, stream=True)
         try:
-            response = self.groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": full_prompt}
-                ],
-                temperature=0.7,
-                max_tokens=400
-            )
-            return response.choices[0].message.content.strip()
+            for token in self.llm.stream(messages, temperature=0.7, max_tokens=400):
+                if not parts:
+                    span.set(first_token_ms=round(span.elapsed_ms(), 1))
+                parts.append(token)
+                yield token
         except Exception as e:
+            tracer.end_span(span, e)
             print(f"[GROQ ERROR] {e}")
-            return "Sorry, I'm having a technical issue. Please call us at +92 300 1234567 for immediate assistance."
+            if not parts:
+                yield TECHNICAL_ISSUE_MESSAGE
+            return
+        finally:
+            if span.duration_ms is None:
+                tracer.end_span(span)
+        
+        answer = ''.join(parts).strip()
+        if cacheable and answer:
+            self.response_cache.put(query_embedding, answer, kb_version)
     
     def generate_session_title(self, first_message: str) -> str:
         """Generate a short title for chat session"""
         try:
-            response = self.groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[
+            # Titles are cosmetic: short deadline, no hedging
+            title = self.llm.complete(
+                [
                     {"role": "system", "content": "Generate a 3-5 word title. No quotes."},
                     {"role": "user", "content": f"Message: {first_message}"}
                 ],
+                deadline=5.0,
+                hedge=False,
                 temperature=0.5,
                 max_tokens=15
-            )
-            title = response.choices[0].message.content.strip().strip('"\'')
+            ).strip('"\'')
             return title[:50]
         except:
-            words = first_message.split()[:4]
-            return ' '.join(words).capitalize() if words else "New Chat"
\ No newline at end of file
+            return self.heuristic_session_title(first_message)
+    
+    def heuristic_session_title(self, first_message: str) -> str:
+        """Instant title from the first words, used until the generated one is ready"""
+        words = first_message.split()[:4]
+        return ' '.join(words).capitalize()[:50] if words else "New Chat"
\ No newline at end of file
@@ -0,0 +1,88 @@
+"""
+Semantic response cache
+Reuses LLM answers for near-duplicate, patient-neutral questions
+"""
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional
+import numpy as np
+
+
+class SemanticResponseCache:
+    """Cosine-similarity cache over query embeddings with TTL and LRU eviction"""
+
+    def __init__(self, threshold: float = 0.92, ttl_seconds: float = 3600, max_entries: int = 256):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.version = None
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        vector = np.asarray(embedding, dtype='float32').reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def set_version(self, version: str):
+        """Bind the cache to a knowledge base version; a new version clears it"""
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self.version = version
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _expire(self, now: float):
+        expired = [key for key, (_, _, created) in self._entries.items() if now - created > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+
+    def get(self, embedding: np.ndarray) -> Optional[str]:
+        """Return the stored answer for the most similar query above the threshold"""
+        query = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            best_key, best_score = None, self.threshold
+            for key, (vector, _, _) in self._entries.items():
+                score = float(np.dot(query, vector))
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return self._entries[best_key][1]
+
+    def put(self, embedding: np.ndarray, response: str, version: Optional[str] = None):
+        """Store an answer; one generated against an older knowledge base version is dropped"""
+        vector = self._normalize(embedding)
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._entries[self._next_id] = (vector, response, time.monotonic())
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,74 @@
+"""
+Lexical retrieval and rank fusion
+BM25 over the knowledge base chunks, fused with dense FAISS results
+"""
+import re
+import math
+from collections import Counter, defaultdict
+from typing import List, Dict, Optional, Set, Tuple
+
+# Common English words that carry no retrieval signal
+STOPWORDS = {
+    'a', 'an', 'the', 'and', 'or', 'of', 'to', 'in', 'on', 'for', 'is', 'are',
+    'do', 'does', 'can', 'what', 'how', 'i', 'my', 'me', 'you', 'your', 'be',
+    'it', 'at', 'with', 'should', 'if', 'will', 'get'
+}
+
+
+def _stem(term: str) -> str:
+    # Plural folding only, so "fillings" matches "filling" and "implants" matches "implant"
+    if len(term) > 4 and term.endswith('s') and not term.endswith(('ss', 'us', 'is')):
+        return term[:-1]
+    return term
+
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(term) for term in re.findall(r'[a-z0-9]+', text.lower())]
+
+
+class BM25Index:
+    """In-memory inverted index with Okapi BM25 scoring"""
+
+    def __init__(self, documents: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.doc_lengths = []
+        for doc_id, text in enumerate(documents):
+            terms = [term for term in tokenize(text) if term not in STOPWORDS]
+            self.doc_lengths.append(len(terms))
+            for term, freq in Counter(terms).items():
+                self.postings[term].append((doc_id, freq))
+        self.num_docs = len(documents)
+        self.avg_length = (sum(self.doc_lengths) / self.num_docs) if self.num_docs else 0.0
+        self.idf = {
+            term: math.log(1 + (self.num_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def search(self, query: str, top_k: int = 10, allowed: Optional[Set[int]] = None) -> List[Tuple[int, float]]:
+        """
+        Return (doc_id, score) pairs for documents sharing at least one query term,
+        optionally only among the allowed doc ids
+        """
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            if term in STOPWORDS or term not in self.postings:
+                continue
+            idf = self.idf[term]
+            for doc_id, freq in self.postings[term]:
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / (self.avg_length or 1))
+                scores[doc_id] += idf * freq * (self.k1 + 1) / (freq + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:top_k]
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """Fuse several ranked doc-id lists; ties keep the earlier ranking's order"""
+    scores: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: -item[1])
@@ -0,0 +1,291 @@
+"""
+Lightweight span tracing
+Context-managed spans for the stages of a chat turn (database, embedding,
+retrieval, LLM, email) written to pluggable exporters: JSONL file,
+in-memory with per-stage latency histograms, and OpenTelemetry when the SDK
+is installed. Spans nest through contextvars, so a stage deep inside the
+chatbot joins the trace of the turn that called it.
+"""
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+from rag.llm_gateway import LatencyHistogram
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed stage; attributes are small JSON-friendly values"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_time", "duration_ms",
+                 "attributes", "status", "error", "_start")
+
+    def __init__(self, name: str, parent: Optional['Span'] = None, attributes: Optional[dict] = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.start_time = time.time()
+        self.duration_ms = None
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.error = None
+        self._start = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def record_error(self, error: BaseException):
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._start) * 1000
+
+    def finish(self):
+        if self.duration_ms is None:
+            self.duration_ms = self.elapsed_ms()
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": datetime.fromtimestamp(self.start_time, timezone.utc).isoformat(),
+            "duration_ms": round(self.duration_ms or 0.0, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class InMemoryExporter:
+    """
+    Keeps recent spans and a latency histogram per span name (admin view, tests).
+    Count and mean cover every span since start or clear(); percentiles are exact
+    over each name's last `window` spans
+    """
+
+    def __init__(self, max_spans: int = 2000, window: int = 512):
+        self.window = window
+        self._lock = threading.Lock()
+        self.spans = deque(maxlen=max_spans)
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.errors: Dict[str, int] = {}
+
+    def export(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+            histogram = self.histograms.get(span.name)
+            if histogram is None:
+                histogram = self.histograms[span.name] = LatencyHistogram(self.window)
+            if span.status == "error":
+                self.errors[span.name] = self.errors.get(span.name, 0) + 1
+        histogram.observe(span.duration_ms)
+
+    def finished(self, name: Optional[str] = None) -> List[Span]:
+        with self._lock:
+            return [span for span in self.spans if name is None or span.name == name]
+
+    def stage_stats(self) -> Dict[str, dict]:
+        """{span name: count, mean, p50, p95, p99, errors}"""
+        with self._lock:
+            histograms = dict(self.histograms)
+            errors = dict(self.errors)
+        stats = {}
+        for name, histogram in sorted(histograms.items()):
+            snapshot = histogram.snapshot()
+            snapshot.pop("buckets")
+            snapshot["errors"] = errors.get(name, 0)
+            stats[name] = snapshot
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+            self.histograms.clear()
+            self.errors.clear()
+
+
+class JsonlExporter:
+    """Appends one JSON object per span to a file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8', buffering=1)
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class OpenTelemetryExporter:
+    """
+    Re-emits finished spans through the OpenTelemetry API, so whatever
+    TracerProvider the deployment configures (OTLP, console) receives them.
+    Children finish before their parents, so a trace is held until its root
+    span finishes and then emitted parents first. Requires opentelemetry-api.
+    """
+
+    MAX_TRACKED = 1000
+
+    def __init__(self, service_name: str = "dental-chatbot"):
+        from opentelemetry import trace
+        self._trace = trace
+        self._tracer = trace.get_tracer(service_name)
+        self._lock = threading.Lock()
+        self._pending: Dict[str, List[Span]] = {}
+        self._emitted = {}
+
+    def export(self, span: Span):
+        with self._lock:
+            if span.parent_id is not None and span.parent_id in self._emitted:
+                # Outlived its trace (a streamed reply): emit on its own
+                batch = [span]
+            else:
+                self._pending.setdefault(span.trace_id, []).append(span)
+                if span.parent_id is not None:
+                    return
+                batch = self._pending.pop(span.trace_id)
+            while len(self._pending) > self.MAX_TRACKED:
+                self._pending.pop(next(iter(self._pending)))
+        for item in sorted(batch, key=lambda s: s.start_time):
+            self._emit(item)
+
+    def _emit(self, span: Span):
+        start_ns = int(span.start_time * 1e9)
+        end_ns = start_ns + int((span.duration_ms or 0.0) * 1e6)
+        with self._lock:
+            parent = self._emitted.get(span.parent_id)
+        context = self._trace.set_span_in_context(parent) if parent is not None else None
+        otel_span = self._tracer.start_span(span.name, context=context, start_time=start_ns,
+                                            attributes={k: _otel_value(v) for k, v in span.attributes.items()})
+        if span.status == "error":
+            otel_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, span.error))
+        otel_span.end(end_time=end_ns)
+        with self._lock:
+            self._emitted[span.span_id] = otel_span
+            while len(self._emitted) > self.MAX_TRACKED:
+                self._emitted.pop(next(iter(self._emitted)))
+
+
+def _otel_value(value):
+    return value if isinstance(value, (str, bool, int, float)) else str(value)
+
+
+class Tracer:
+    """Creates spans and hands finished ones to every exporter; exporter failures are logged, not raised"""
+
+    def __init__(self, exporters: Optional[Iterable] = None, enabled: bool = True):
+        self.exporters = list(exporters or [])
+        self.enabled = enabled
+
+    def memory(self) -> Optional[InMemoryExporter]:
+        return next((e for e in self.exporters if isinstance(e, InMemoryExporter)), None)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        with tracer.span("rag.retrieval", top_k=2) as span: ...
+        Exceptions are recorded on the span and re-raised
+        """
+        if not self.enabled:
+            yield Span(name)
+            return
+        span = Span(name, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self._finish(span)
+
+    def start_span(self, name: str, parent: Optional[Span] = None, **attributes) -> Span:
+        """
+        A span that is not made current, for work that outlives the calling
+        frame (a streamed reply); call end_span() when it is done
+        """
+        return Span(name, parent or _current_span.get(), attributes)
+
+    @contextmanager
+    def activate(self, span: Optional[Span]):
+        """Make a started span current for a block, e.g. each step of a generator"""
+        token = _current_span.set(span)
+        try:
+            yield span
+        finally:
+            _current_span.reset(token)
+
+    def end_span(self, span: Span, error: Optional[BaseException] = None):
+        if error is not None:
+            span.record_error(error)
+        if self.enabled:
+            self._finish(span)
+
+    def _finish(self, span: Span):
+        span.finish()
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                print(f"[TRACING ERROR] {type(exporter).__name__}: {e}")
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+_tracer_lock = threading.Lock()
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    """Process-wide tracer; in-memory only until configure_tracing() runs"""
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = Tracer([InMemoryExporter()])
+    return _tracer
+
+
+def set_tracer(tracer: Tracer):
+    global _tracer
+    with _tracer_lock:
+        _tracer = tracer
+
+
+def configure_tracing(jsonl_path: Optional[str] = None, otel: bool = False, enabled: bool = True) -> Tracer:
+    """In-memory stats always; JSONL file and OpenTelemetry when asked for"""
+    exporters = [InMemoryExporter()]
+    if jsonl_path:
+        exporters.append(JsonlExporter(jsonl_path))
+    if otel:
+        try:
+            exporters.append(OpenTelemetryExporter())
+        except ImportError:
+            print("[TRACING ERROR] opentelemetry is not installed; OpenTelemetry export disabled")
+    tracer = Tracer(exporters, enabled=enabled)
+    set_tracer(tracer)
+    return tracer
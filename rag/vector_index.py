@@ -0,0 +1,167 @@
+"""
+Dense vector index factory
+Builds a cosine-similarity FAISS index (normalized vectors, inner product)
+sized to the corpus: exact search for small knowledge bases, HNSW for
+medium ones and IVF-PQ once memory matters more than the last bit of recall
+"""
+import math
+from typing import Callable, Optional
+import faiss
+import numpy as np
+
+# Corpus sizes at which the factory moves to the next index type
+HNSW_THRESHOLD = 20000
+IVFPQ_THRESHOLD = 500000
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 64
+
+IVF_NPROBE = 16
+PQ_BITS = 8
+# IVF-PQ candidates fetched per requested result, then re-scored on the stored vectors
+PQ_RERANK_FACTOR = 8
+
+INDEX_KINDS = ('auto', 'flat', 'hnsw', 'ivfpq')
+
+
+def normalize(embeddings: np.ndarray) -> np.ndarray:
+    """Row-normalized float32 copy, so inner product equals cosine similarity"""
+    vectors = np.array(embeddings, dtype='float32', copy=True).reshape(-1, np.shape(embeddings)[-1])
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def choose_index_kind(count: int) -> str:
+    if count >= IVFPQ_THRESHOLD:
+        return 'ivfpq'
+    if count >= HNSW_THRESHOLD:
+        return 'hnsw'
+    return 'flat'
+
+
+def _pq_subquantizers(dimension: int) -> int:
+    """Largest of 48/32/24/16/8 that divides the dimension (48 for MiniLM's 384)"""
+    for m in (48, 32, 24, 16, 8):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def build_vector_index(
+    embeddings: np.ndarray,
+    kind: str = 'auto',
+    dimension: Optional[int] = None,
+    ids: Optional[np.ndarray] = None
+):
+    """
+    Index over normalized embeddings, searched by inner product. kind='auto'
+    picks flat, hnsw or ivfpq from the number of vectors. With ids, search
+    returns those int64 ids instead of row numbers, and vectors can later be
+    added and removed by id (see updated_index).
+    """
+    vectors = normalize(embeddings) if len(embeddings) else np.zeros((0, dimension or 384), dtype='float32')
+    count, dimension = vectors.shape
+    if kind == 'auto':
+        kind = choose_index_kind(count)
+
+    if kind == 'flat':
+        index = faiss.IndexFlatIP(dimension)
+    elif kind == 'hnsw':
+        index = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif kind == 'ivfpq':
+        # ~4*sqrt(n) lists keeps lists short; PQ training wants >= 39 points per list
+        nlist = max(1, min(int(4 * math.sqrt(count)), count // 39))
+        quantizer = faiss.IndexFlatIP(dimension)
+        index = faiss.IndexIVFPQ(quantizer, dimension, nlist, _pq_subquantizers(dimension), PQ_BITS,
+                                 faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+        index.nprobe = min(IVF_NPROBE, nlist)
+    else:
+        raise ValueError(f"Unknown index kind '{kind}', expected one of {', '.join(INDEX_KINDS)}")
+
+    if ids is not None and kind != 'ivfpq':
+        # IVF indexes store ids themselves; the others need the id map
+        index = faiss.IndexIDMap2(index)
+    if count:
+        if ids is not None:
+            index.add_with_ids(vectors, np.asarray(ids, dtype='int64'))
+        else:
+            index.add(vectors)
+    return index
+
+
+def index_kind_of(index) -> str:
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(base, faiss.IndexHNSW):
+        return 'hnsw'
+    if isinstance(base, faiss.IndexIVF):
+        return 'ivfpq'
+    return 'flat'
+
+
+def updated_index(index, remove_ids: np.ndarray, add_vectors: np.ndarray, add_ids: np.ndarray):
+    """
+    Copy of an id-mapped index with vectors removed and added by id, leaving
+    the original untouched for searches still running against it. Returns
+    None when the index type cannot remove vectors (HNSW); rebuild instead.
+    """
+    if index_kind_of(index) == 'hnsw' and len(remove_ids):
+        return None
+    updated = faiss.clone_index(index)
+    if len(remove_ids):
+        updated.remove_ids(faiss.IDSelectorBatch(np.asarray(remove_ids, dtype='int64')))
+    if len(add_ids):
+        updated.add_with_ids(normalize(add_vectors), np.asarray(add_ids, dtype='int64'))
+    return updated
+
+
+def _search_params(index, allowed_ids: np.ndarray):
+    """Restrict a search to allowed_ids while keeping the index's own search settings"""
+    selector = faiss.IDSelectorBatch(allowed_ids)
+    if isinstance(index, faiss.IndexIDMap):
+        # The id map translates the selector to row numbers for the wrapped index
+        base = faiss.downcast_index(index.index)
+        if isinstance(base, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=base.hnsw.efSearch)
+        return faiss.SearchParameters(sel=selector)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+
+def search(
+    index,
+    query_embedding: np.ndarray,
+    k: int,
+    allowed_ids: Optional[np.ndarray] = None,
+    rescore: Optional[Callable[[np.ndarray, np.ndarray], np.ndarray]] = None
+):
+    """
+    (scores, ids) for one query; scores are cosine similarities and missing
+    results have id -1. allowed_ids limits the search to those vectors.
+    rescore(ids, query) returns exact scores from the stored normalized
+    vectors; IVF-PQ then re-scores an over-fetched candidate set, which
+    recovers most of the recall PQ gives up.
+    """
+    k = min(k, index.ntotal)
+    if k <= 0:
+        return np.zeros(0, dtype='float32'), np.zeros(0, dtype='int64')
+    params = None
+    if allowed_ids is not None:
+        params = _search_params(index, np.asarray(allowed_ids, dtype='int64'))
+    query = normalize(query_embedding)
+    rerank = rescore is not None and isinstance(index, faiss.IndexIVFPQ)
+    fetch = min(k * PQ_RERANK_FACTOR, index.ntotal) if rerank else k
+    scores, ids = index.search(query, fetch, params=params)
+    scores, ids = scores[0], ids[0]
+    if rerank:
+        ids = ids[ids >= 0]
+        scores = np.asarray(rescore(ids, query[0]), dtype='float32')
+        order = np.argsort(-scores)[:k]
+        scores, ids = scores[order], ids[order]
+    return scores, ids
@@ -0,0 +1,67 @@
+import faiss
+import numpy as np
+
+from rag.index_store import IndexStore, compute_cache_key
+
+
+def _entry(count=4, dimension=8):
+    embeddings = np.random.default_rng(0).random((count, dimension), dtype='float32')
+    index = faiss.IndexFlatIP(dimension)
+    index.add(embeddings)
+    chunks = [{"text": f"chunk {i}", "metadata": {"type": "faq"}} for i in range(count)]
+    return index, chunks, embeddings
+
+
+def test_cache_key_depends_on_content_model_and_chunking():
+    kb = {"faqs": [{"q": "Open on Sunday?", "a": "No"}]}
+    key = compute_cache_key(kb, "model-a", "v1")
+    assert key == compute_cache_key(dict(kb), "model-a", "v1")
+    assert key != compute_cache_key({"faqs": []}, "model-a", "v1")
+    assert key != compute_cache_key(kb, "model-b", "v1")
+    assert key != compute_cache_key(kb, "model-a", "v2")
+
+
+def test_save_then_load_round_trips(tmp_path):
+    store = IndexStore(str(tmp_path))
+    index, chunks, embeddings = _entry()
+    key = compute_cache_key({}, "model")
+
+    assert store.save(key, index, chunks, embeddings)
+    loaded = store.load(key)
+
+    assert loaded is not None
+    loaded_index, loaded_chunks, loaded_embeddings = loaded
+    assert loaded_index.ntotal == len(chunks)
+    assert loaded_chunks == chunks
+    np.testing.assert_array_equal(loaded_embeddings, embeddings)
+
+
+def test_load_misses_unknown_and_corrupt_entries(tmp_path):
+    store = IndexStore(str(tmp_path))
+    index, chunks, embeddings = _entry()
+    key = compute_cache_key({}, "model")
+    assert store.load(key) is None
+
+    store.save(key, index, chunks[:-1], embeddings)
+    # Index and chunk list disagree on the entry count
+    assert store.load(key) is None
+
+
+def test_prune_removes_only_stale_entries(tmp_path):
+    store = IndexStore(str(tmp_path))
+    index, chunks, embeddings = _entry()
+    current = compute_cache_key({"v": 2}, "model")
+    stale = compute_cache_key({"v": 1}, "model")
+    store.save(current, index, chunks, embeddings)
+    store.save(stale, index, chunks, embeddings)
+    in_flight = tmp_path / f".{current}-tmp"
+    in_flight.mkdir()
+    other = tmp_path / "query_table"
+    other.mkdir()
+
+    store.prune(current)
+
+    assert store.load(current) is not None
+    assert not (tmp_path / stale).exists()
+    assert in_flight.exists()
+    assert other.exists()
@@ -0,0 +1,47 @@
+import numpy as np
+
+from rag.kb_reload import KnowledgeSnapshot, chunk_ids
+from rag.vector_index import build_vector_index, search, updated_index
+
+
+def _chunks(*texts):
+    return [{"text": text, "metadata": {"type": "faq"}} for text in texts]
+
+
+def _snapshot(chunks):
+    return KnowledgeSnapshot({}, "v", chunks, bm25=None, matcher=None)
+
+
+def test_chunk_ids_are_stable_and_tell_repeats_apart():
+    ids = chunk_ids(_chunks("a", "b", "a"))
+    assert len(set(ids.tolist())) == 3
+    assert (ids >= 0).all()
+    # Same text and metadata keeps its id wherever it moves to
+    assert chunk_ids(_chunks("b", "a"))[1] == ids[0]
+    assert chunk_ids([{"text": "a", "metadata": {"type": "treatment"}}])[0] != ids[0]
+
+
+def test_diff_reports_added_removed_and_unchanged_chunks():
+    old = _snapshot(_chunks("a", "b", "c"))
+    new = _snapshot(_chunks("a", "c", "d"))
+
+    result = old.diff(new)
+
+    assert result["added"] == [int(chunk_ids(_chunks("d"))[0])]
+    assert result["removed"] == [int(old.ids[1])]
+    assert result["unchanged"] == 2
+
+
+def test_updated_index_swaps_vectors_by_id_and_leaves_the_original_alone():
+    rng = np.random.default_rng(0)
+    old_ids = np.array([11, 22, 33], dtype='int64')
+    index = build_vector_index(rng.random((3, 8), dtype='float32'), kind='flat', ids=old_ids)
+    new_vector = rng.random((1, 8), dtype='float32')
+
+    updated = updated_index(index, np.array([22], dtype='int64'), new_vector, np.array([44], dtype='int64'))
+
+    assert index.ntotal == 3
+    assert updated.ntotal == 3
+    _, ids = search(updated, new_vector, k=3)
+    assert ids[0] == 44
+    assert 22 not in ids.tolist()
@@ -0,0 +1,40 @@
+import pytest
+
+from rag.keyword_matcher import build_matcher
+
+KNOWLEDGE_BASE = {
+    "clinic_info": {
+        "branches": [{"name": "NeoImplant - DHA"}, {"name": "NeoImplant - Clifton"}],
+        "team": [{"name": "Dr. Ahmed Raza"}],
+    },
+    "treatments": {"crowns": {"title": "Dental Crowns (Tooth Crowning)"}},
+}
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    return build_matcher(KNOWLEDGE_BASE)
+
+
+@pytest.mark.parametrize("message", ["bookkeeping", "ebook", "dhabi", "rebooking"])
+def test_keywords_only_match_whole_words(matcher, message):
+    result = matcher.match(message)
+    assert not result.has('booking_intent')
+    assert not result.has('branch')
+
+
+def test_plurals_match_the_singular_keyword(matcher):
+    result = matcher.match("Show my appointments and my gums")
+    assert result.has('appointment_query')
+    assert result.has('booking_intent')
+    assert result.first('treatment') == 'Gum Treatment'
+
+
+def test_entities_come_from_the_knowledge_base(matcher):
+    result = matcher.match("Book a crowning at Clifton with Dr Ahmed... actually DHA")
+    assert result.first('treatment') == 'Dental Crown'
+    assert result.first('dentist') == 'Dr. Ahmed Raza'
+    # The last branch mentioned wins when the patient changes their mind
+    assert result.first('branch') == 'NeoImplant - Clifton'
+    assert result.last('branch') == 'NeoImplant - DHA'
+    assert result.has('treatment_skip')
@@ -0,0 +1,124 @@
+import asyncio
+import time
+
+import groq
+import httpx
+import pytest
+
+from rag.llm_gateway import CircuitBreaker, CircuitOpenError, LLMGateway
+
+MESSAGES = [{"role": "user", "content": "When are you open?"}]
+REQUEST = httpx.Request("POST", "https://api.groq.com/openai/v1/chat/completions")
+
+
+def _bad_request():
+    return groq.BadRequestError("bad request", response=httpx.Response(400, request=REQUEST), body=None)
+
+
+def _gateway(error=None, threshold=2):
+    gateway = LLMGateway(api_key="test", max_retries=0, hedge=False,
+                         breaker=CircuitBreaker(failure_threshold=threshold, reset_seconds=0.05))
+
+    async def attempt(messages, params, hedge):
+        if error is not None:
+            raise error
+        return "We open at 9"
+
+    async def open_stream(messages, params):
+        raise error
+
+    gateway._hedged_attempt = attempt
+    gateway._open_stream = open_stream
+    return gateway
+
+
+def _call(gateway):
+    return asyncio.run(gateway.acomplete(MESSAGES))
+
+
+async def _drain(gateway):
+    return [token async for token in gateway.astream(MESSAGES)]
+
+
+def test_breaker_opens_after_consecutive_failures_and_probes_after_cool_down():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    # One probe at a time
+    assert not breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+
+
+def test_released_probe_goes_to_the_next_caller():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+
+    breaker.release_probe()
+
+    assert breaker.allow()
+
+
+def test_provider_outages_open_the_breaker():
+    gateway = _gateway(groq.APIConnectionError(request=REQUEST))
+    for _ in range(2):
+        with pytest.raises(groq.APIConnectionError):
+            _call(gateway)
+
+    with pytest.raises(CircuitOpenError):
+        _call(gateway)
+    assert gateway.counters["rejected"] == 1
+
+
+def test_deadline_timeouts_count_against_the_provider():
+    gateway = _gateway(threshold=1)
+
+    async def slow(messages, params, hedge):
+        await asyncio.sleep(1)
+
+    gateway._hedged_attempt = slow
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(gateway.acomplete(MESSAGES, deadline=0.01))
+    assert gateway.breaker.state == "open"
+
+
+def test_bad_requests_do_not_touch_the_breaker():
+    gateway = _gateway(_bad_request())
+    for _ in range(5):
+        with pytest.raises(groq.BadRequestError):
+            _call(gateway)
+        with pytest.raises(groq.BadRequestError):
+            asyncio.run(_drain(gateway))
+
+    assert gateway.breaker.state == "closed"
+    assert gateway.breaker.failures == 0
+    assert gateway.counters["failures"] == 10
+
+
+def test_bad_request_on_a_probe_releases_it():
+    gateway = _gateway(_bad_request(), threshold=1)
+    gateway.breaker.record_failure()
+    time.sleep(0.06)
+
+    with pytest.raises(groq.BadRequestError):
+        _call(gateway)
+
+    # Not stuck half-open: the next call gets to probe
+    gateway._hedged_attempt = _gateway()._hedged_attempt
+    assert _call(gateway) == "We open at 9"
+    assert gateway.breaker.state == "closed"
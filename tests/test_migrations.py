@@ -0,0 +1,44 @@
+from datetime import date, time
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from utils.db import Appointment
+from utils.migrations import MIGRATIONS, run_migrations
+
+SLOT = dict(branch="NeoImplant - DHA", dentist="Dr. Ahmed Raza", treatment_type="Consultation",
+            appointment_date=date(2030, 1, 7), appointment_time=time(10, 0))
+
+
+def test_unique_index_rejects_a_second_scheduled_booking_of_a_slot(session_factory):
+    session = session_factory()
+    session.add(Appointment(user_id=1, **SLOT))
+    session.add(Appointment(user_id=2, status="cancelled", **SLOT))
+    session.commit()
+
+    session.add(Appointment(user_id=3, **SLOT))
+    with pytest.raises(IntegrityError):
+        session.commit()
+
+
+def test_migrations_apply_once(engine):
+    assert run_migrations(engine) == [migration_id for migration_id, _ in MIGRATIONS]
+    assert run_migrations(engine) == []
+
+
+def test_double_bookings_defer_the_unique_index_but_not_later_migrations(engine, session_factory):
+    with engine.begin() as connection:
+        connection.execute(text("DROP INDEX uq_appointments_dentist_scheduled_slot"))
+    session = session_factory()
+    session.add_all([Appointment(user_id=1, **SLOT), Appointment(user_id=2, **SLOT)])
+    session.commit()
+
+    applied = run_migrations(engine)
+
+    assert "0002_unique_scheduled_slot" not in applied
+    assert "0003_outbox_claim_token" in applied
+
+    session.query(Appointment).filter(Appointment.user_id == 2).update({Appointment.status: "cancelled"})
+    session.commit()
+    assert run_migrations(engine) == ["0002_unique_scheduled_slot"]
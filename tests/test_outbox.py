@@ -0,0 +1,103 @@
+from datetime import timedelta
+
+import pytest
+
+from utils.db import EmailOutbox, get_karachi_time
+from utils.outbox import OutboxWorker, enqueue_email
+
+
+class FakeSMTP:
+    def __init__(self, error=None):
+        self.error = error
+        self.sent = []
+
+    def send(self, to_email, subject, body_html):
+        if self.error:
+            raise self.error
+        self.sent.append(to_email)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def queued(session_factory):
+    session = session_factory()
+    entry = enqueue_email(session, "patient@example.com", "Appointment confirmed", "<p>See you</p>")
+    session.commit()
+    entry_id = entry.id
+    session.close()
+    return entry_id
+
+
+def _worker(session_factory, smtp):
+    worker = OutboxWorker(session_factory, {})
+    worker.smtp = smtp
+    return worker
+
+
+def _row(session_factory, entry_id):
+    session = session_factory()
+    try:
+        return session.get(EmailOutbox, entry_id)
+    finally:
+        session.close()
+
+
+def _expire_lease(session_factory, entry_id):
+    session = session_factory()
+    session.get(EmailOutbox, entry_id).next_attempt_at = get_karachi_time() - timedelta(seconds=1)
+    session.commit()
+    session.close()
+
+
+def test_drain_sends_each_email_once(session_factory, queued):
+    smtp = FakeSMTP()
+    worker = _worker(session_factory, smtp)
+
+    assert worker.drain_once() == 1
+    assert worker.drain_once() == 0
+    assert smtp.sent == ["patient@example.com"]
+    row = _row(session_factory, queued)
+    assert row.status == "sent"
+    assert row.claim_token is None
+
+
+def test_failed_send_is_retried_later(session_factory, queued):
+    worker = _worker(session_factory, FakeSMTP(error=OSError("connection refused")))
+
+    worker.drain_once()
+
+    row = _row(session_factory, queued)
+    assert row.status == "pending"
+    assert row.attempts == 1
+    assert row.last_error == "connection refused"
+    # Backed off, so an immediate second pass claims nothing
+    assert worker.drain_once() == 0
+
+
+def test_a_leased_row_is_not_claimed_twice(session_factory, queued):
+    first = _worker(session_factory, FakeSMTP())
+    claimed, _ = first._claim_batch()
+    assert [entry['id'] for entry in claimed] == [queued]
+
+    second = _worker(session_factory, FakeSMTP())
+    claimed_again, _ = second._claim_batch()
+    assert claimed_again == []
+
+
+def test_stale_worker_cannot_overwrite_a_re_leased_row(session_factory, queued):
+    stale = _worker(session_factory, FakeSMTP())
+    stale_claim, stale_token = stale._claim_batch()
+    _expire_lease(session_factory, queued)
+    current = _worker(session_factory, FakeSMTP())
+    current_claim, current_token = current._claim_batch()
+    assert current_claim and current_token != stale_token
+
+    stale._record_results({queued: OSError("timed out")}, stale_token)
+    row = _row(session_factory, queued)
+    assert row.status == "sending"
+    assert row.attempts == 0
+
+    current._record_results({queued: None}, current_token)
+    assert _row(session_factory, queued).status == "sent"
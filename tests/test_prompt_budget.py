@@ -0,0 +1,34 @@
+from rag.prompt_budget import PromptBudget
+
+
+def _words(text):
+    return len(text.split())
+
+
+def _history(count, words=6):
+    return [{"id": i, "role": "user", "message": " ".join(["word"] * words)} for i in range(count)]
+
+
+def test_newest_messages_that_fit_are_kept():
+    # Each message costs 6 words + 4 overhead
+    budget = PromptBudget(history=35, counter=_words)
+
+    kept, evicted = budget.split_history(_history(5))
+
+    assert [m["id"] for m in kept] == [2, 3, 4]
+    assert [m["id"] for m in evicted] == [0, 1]
+
+
+def test_message_cap_and_smaller_limits_evict_more():
+    budget = PromptBudget(history=1000, max_history_messages=4, counter=_words)
+    history = _history(6)
+
+    assert len(budget.split_history(history)[0]) == 4
+    assert len(budget.split_history(history, max_messages=2)[0]) == 2
+    assert len(budget.split_history(history, limit=25)[0]) == 2
+
+
+def test_truncate_cuts_at_a_word_boundary():
+    budget = PromptBudget(counter=_words)
+    assert budget.truncate("one two three four", 2) == "one two"
+    assert budget.truncate("one two", 5) == "one two"
@@ -0,0 +1,36 @@
+import numpy as np
+
+from rag.index_store import DEFAULT_CACHE_DIR, IndexStore
+from rag.query_table import DEFAULT_TABLE_DIR, QueryEmbeddingTable, build_table, table_dir
+
+
+class FakeBackend:
+    name = "fake"
+    model_name = "org/Model-1"
+
+    def encode(self, texts):
+        return np.arange(len(texts) * 4, dtype='float32').reshape(len(texts), 4)
+
+
+def test_built_table_answers_exact_and_near_exact_queries(tmp_path):
+    path = table_dir(FakeBackend.name, FakeBackend.model_name, root=tmp_path)
+    assert build_table(FakeBackend(), ["Hello!", "hello", "Book an appointment"], path) == 2
+
+    table = QueryEmbeddingTable.load(path)
+    np.testing.assert_array_equal(table.lookup("HELLO"), FakeBackend().encode(["a"]))
+    assert table.lookup("please book appointment") is not None
+    assert table.lookup("do you do braces") is None
+    assert table.stats()["exact_hits"] == 1
+    assert table.stats()["near_hits"] == 1
+    assert table.stats()["lookups"] == 3
+
+
+def test_table_survives_index_cache_prune(tmp_path):
+    assert DEFAULT_CACHE_DIR not in DEFAULT_TABLE_DIR.parents
+
+    cache_dir = tmp_path / "index_cache"
+    path = table_dir(FakeBackend.name, FakeBackend.model_name, root=cache_dir / "query_table")
+    build_table(FakeBackend(), ["hi"], path)
+    IndexStore(str(cache_dir)).prune("0" * 32)
+
+    assert QueryEmbeddingTable.load(path) is not None
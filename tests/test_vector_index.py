@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from rag.vector_index import build_vector_index, choose_index_kind, index_kind_of, search
+
+
+def test_scores_are_cosine_similarities_whatever_the_vector_length():
+    embeddings = np.array([[1, 0], [0, 1], [10, 10]], dtype='float32')
+    index = build_vector_index(embeddings, kind='flat')
+
+    scores, ids = search(index, np.array([[3, 3]], dtype='float32'), k=3)
+
+    assert ids[0] == 2
+    assert scores[0] == pytest.approx(1.0)
+    assert scores[1] == pytest.approx(np.sqrt(0.5))
+
+
+def test_auto_kind_grows_with_the_knowledge_base():
+    assert choose_index_kind(10) == 'flat'
+    assert index_kind_of(build_vector_index(np.eye(4, dtype='float32'), ids=np.arange(4))) == 'flat'
+    with pytest.raises(ValueError):
+        build_vector_index(np.eye(4, dtype='float32'), kind='annoy')
+
+
+def test_allowed_ids_limit_the_search():
+    rng = np.random.default_rng(1)
+    embeddings = rng.random((20, 8), dtype='float32')
+    index = build_vector_index(embeddings, kind='hnsw', ids=np.arange(100, 120))
+
+    _, ids = search(index, embeddings[:1], k=5, allowed_ids=np.array([105, 107]))
+
+    assert set(ids[ids >= 0].tolist()) == {105, 107}
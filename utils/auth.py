@@ -7,7 +7,8 @@ import bcrypt
 import jwt
 from datetime import datetime, timedelta
 from utils.db import get_session, User, get_karachi_time, KARACHI_TZ
-from utils.helpers import generate_verification_code, send_verification_email
+from utils.helpers import generate_verification_code, build_verification_email, smtp_configured
+from utils.outbox import enqueue_email, notify_outbox
 
 def init_session_state():
     """Initialize session state variables"""
@@ -64,14 +65,18 @@ def signup_user(email: str, password: str) -> dict:
         )
         
         session.add(new_user)
-        session.commit()
-        
-        # Send email
-        email_sent = send_verification_email(email, code)
         
-        if not email_sent:
+        if not smtp_configured():
+            # The outbox could never deliver it; report it the way a failed send was reported
+            session.commit()
             return {"success": True, "message": "User created but email failed to send", "code": code}
         
+        # Queue email in the same transaction as the user row
+        subject, body = build_verification_email(code)
+        enqueue_email(session, email, subject, body)
+        session.commit()
+        notify_outbox()
+        
         return {"success": True, "message": "Verification code sent to email"}
         
     except Exception as e:
@@ -0,0 +1,182 @@
+"""
+Appointment availability module
+In-memory occupancy index (date -> branch -> dentist -> booked hours) built
+from scheduled appointments and the branch opening hours in data.json
+"""
+import json
+import time as time_module
+import threading
+from pathlib import Path
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import streamlit as st
+
+from utils.db import get_session, Appointment, get_karachi_time
+
+KNOWLEDGE_BASE_PATH = Path(__file__).parent.parent / "rag" / "data.json"
+
+# Appointments are one hour long and start on the hour
+SLOT_HOURS = 1
+# Rows booked by other processes are picked up on the next reload
+RELOAD_SECONDS = 900
+MAX_SEARCH_DAYS = 30
+
+def parse_branch_hours(knowledge_base: dict) -> Dict[str, Dict[int, Optional[Tuple[int, int]]]]:
+    """{branch: {weekday: (first_hour, closing_hour) or None when closed}}"""
+    weekdays = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+    branch_hours = {}
+    for branch in knowledge_base.get('clinic_info', {}).get('branches', []):
+        hours = {}
+        for weekday_no, weekday in enumerate(weekdays):
+            value = branch.get('hours', {}).get(weekday, "Closed")
+            if value == "Closed":
+                hours[weekday_no] = None
+            else:
+                start, end = value.split('-')
+                hours[weekday_no] = (int(start.split(':')[0]), int(end.split(':')[0]))
+        branch_hours[branch['name']] = hours
+    return branch_hours
+
+class AvailabilityIndex:
+    """Which dentist is booked at which branch and hour, kept current in memory"""
+
+    def __init__(self, knowledge_base: dict):
+        self.branch_hours = parse_branch_hours(knowledge_base)
+        self.dentists = [member['name'] for member in knowledge_base.get('clinic_info', {}).get('team', [])]
+        self._occupied: Dict[date, Dict[str, Dict[str, set]]] = {}
+        self._lock = threading.Lock()
+        self._loaded_at = None
+
+    def update_knowledge_base(self, knowledge_base: dict):
+        """Pick up edited branch hours and team after a knowledge base reload"""
+        branch_hours = parse_branch_hours(knowledge_base)
+        dentists = [member['name'] for member in knowledge_base.get('clinic_info', {}).get('team', [])]
+        with self._lock:
+            self.branch_hours = branch_hours
+            self.dentists = dentists
+
+    def load(self, session=None):
+        """Rebuild the index from scheduled appointments from today onwards"""
+        owns_session = session is None
+        if owns_session:
+            session = get_session()
+        try:
+            rows = session.query(
+                Appointment.appointment_date, Appointment.appointment_time,
+                Appointment.branch, Appointment.dentist
+            ).filter(
+                Appointment.appointment_date >= get_karachi_time().date(),
+                Appointment.status == 'scheduled'
+            ).all()
+        finally:
+            if owns_session:
+                session.close()
+
+        occupied = defaultdict(lambda: defaultdict(lambda: defaultdict(set)))
+        for appt_date, appt_time, branch, dentist in rows:
+            occupied[appt_date][branch][dentist].add(appt_time.hour)
+
+        with self._lock:
+            self._occupied = occupied
+            self._loaded_at = time_module.monotonic()
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or time_module.monotonic() - self._loaded_at > RELOAD_SECONDS:
+            self.load()
+
+    def book(self, branch: str, dentist: str, appt_date: date, appt_time: time):
+        """Record a committed appointment"""
+        with self._lock:
+            self._occupied.setdefault(appt_date, {}).setdefault(branch, {}).setdefault(dentist, set()).add(appt_time.hour)
+
+    def release(self, branch: str, dentist: str, appt_date: date, appt_time: time):
+        """Forget a cancelled appointment"""
+        with self._lock:
+            self._occupied.get(appt_date, {}).get(branch, {}).get(dentist, set()).discard(appt_time.hour)
+
+    def _is_open(self, branch: str, appt_date: date, hour: int) -> bool:
+        hours = self.branch_hours.get(branch, {}).get(appt_date.weekday())
+        return hours is not None and hours[0] <= hour and hour + SLOT_HOURS <= hours[1]
+
+    def _dentist_busy(self, dentist: str, appt_date: date, hour: int) -> bool:
+        # A dentist can only be in one branch at a time
+        return any(hour in dentists.get(dentist, ()) for dentists in self._occupied.get(appt_date, {}).values())
+
+    def is_free(self, branch: str, dentist: str, appt_date: date, appt_time: time) -> bool:
+        self._ensure_loaded()
+        if appt_time.minute != 0 or not self._is_open(branch, appt_date, appt_time.hour):
+            return False
+        with self._lock:
+            return not self._dentist_busy(dentist, appt_date, appt_time.hour)
+
+    def next_free_slots(self, count: int = 3, after: Optional[datetime] = None,
+                        branch: Optional[str] = None, dentist: Optional[str] = None,
+                        max_days: int = MAX_SEARCH_DAYS) -> List[dict]:
+        """The first `count` free slots after a moment, optionally for one branch or dentist"""
+        self._ensure_loaded()
+        now = get_karachi_time().replace(tzinfo=None)
+        after = max(after or now, now)
+        branches = [branch] if branch else list(self.branch_hours)
+        dentists = [dentist] if dentist else self.dentists
+
+        slots = []
+        with self._lock:
+            for day_offset in range(max_days):
+                day = after.date() + timedelta(days=day_offset)
+                for hour in range(24):
+                    if day == after.date() and hour <= after.hour:
+                        continue
+                    for branch_name in branches:
+                        if not self._is_open(branch_name, day, hour):
+                            continue
+                        for dentist_name in dentists:
+                            if not self._dentist_busy(dentist_name, day, hour):
+                                slots.append({
+                                    'date': day.strftime('%Y-%m-%d'),
+                                    'time': f"{hour:02d}:00",
+                                    'branch': branch_name,
+                                    'dentist': dentist_name
+                                })
+                                if len(slots) >= count:
+                                    return slots
+        return slots
+
+def format_slots(slots: List[dict]) -> str:
+    """Bullet list of slots for a chat reply"""
+    lines = []
+    for slot in slots:
+        day = datetime.strptime(slot['date'], '%Y-%m-%d').strftime('%A %d %b')
+        lines.append(f"- {day} at {slot['time']}, {slot['branch']} with {slot['dentist']}")
+    return "\n".join(lines)
+
+@st.cache_resource
+def get_availability_index() -> AvailabilityIndex:
+    """Process-wide availability index (loaded from the database on first use)"""
+    with open(KNOWLEDGE_BASE_PATH, 'r', encoding='utf-8') as f:
+        knowledge_base = json.load(f)
+    return AvailabilityIndex(knowledge_base)
+
+def cancel_appointment(user_id: int, appointment_id: int) -> dict:
+    """Cancel one of the user's scheduled appointments and free its slot"""
+    session = get_session()
+    try:
+        appointment = session.query(Appointment).filter(
+            Appointment.id == appointment_id,
+            Appointment.user_id == user_id,
+            Appointment.status == 'scheduled'
+        ).first()
+        if not appointment:
+            return {"success": False, "error": "Appointment not found"}
+
+        appointment.status = 'cancelled'
+        slot = (appointment.branch, appointment.dentist, appointment.appointment_date, appointment.appointment_time)
+        session.commit()
+        get_availability_index().release(*slot)
+        return {"success": True}
+    except Exception as e:
+        session.rollback()
+        return {"success": False, "error": str(e)}
+    finally:
+        session.close()
@@ -4,28 +4,74 @@ Handles chat message processing, appointment booking, and name extraction
 """
 import streamlit as st
 import re
+import threading
 from datetime import datetime, date, time, timedelta
-from typing import List, Dict, Optional, Tuple
-import traceback
+from typing import Optional, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 
 from utils.db import (
-    get_session, ChatSession, ChatMessage, User, Appointment,
-    get_karachi_time, get_user_profile_dict
+    get_session, ChatSession, ChatMessage, ChatSummary, User, Appointment, BookingState,
+    get_karachi_time, get_user_profile_dict, invalidate_user_profile
 )
-from utils.helpers import send_appointment_confirmation
+from utils.helpers import build_appointment_confirmation
+from utils.date_extraction import extract_latest_datetime
+from utils.outbox import enqueue_email, notify_outbox
+from utils.availability import get_availability_index, format_slots
 from rag.rag_chatbot import RAGChatbot
+from rag.llm_gateway import LLMGateway
+from rag.embedding_backends import create_embedding_backend
+from rag.keyword_matcher import MatchResult, get_matcher, IGNORE_NAME_WORDS
+from rag.tracing import get_tracer, configure_tracing
+
+# Session titles and history summaries are generated and saved off the request path
+_background_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-background")
+
+# Unsummarized messages read per turn; the prompt budget decides how many are sent
+HISTORY_FETCH_LIMIT = 40
+
+# Messages folded into the summary per LLM call; a longer backlog is caught up over later turns
+SUMMARY_FETCH_LIMIT = 60
+
+# Sessions with a summary update running; a session gets at most one at a time
+_summaries_in_flight = set()
+_summaries_lock = threading.Lock()
 
 @st.cache_resource
 def get_rag_chatbot():
-    """Initialize and cache RAG chatbot"""
-    import os
+    """Initialize and cache RAG chatbot (dense index is loaded by utils.warmup)"""
     from pathlib import Path
     
     BASE_DIR = Path(__file__).parent.parent
     knowledge_base_path = BASE_DIR / "rag" / "data.json"
     groq_api_key = st.secrets['GROQ_API_KEY']
-    
-    return RAGChatbot(str(knowledge_base_path), groq_api_key)
+    # Optional GROQ_BASE_URL points the gateway at another OpenAI-compatible endpoint
+    llm = LLMGateway(
+        api_key=groq_api_key,
+        base_url=st.secrets.get('GROQ_BASE_URL'),
+        deadline_seconds=float(st.secrets.get('GROQ_DEADLINE_SECONDS', 20))
+    )
+    # EMBEDDING_BACKEND: torch (default), onnx or onnx-int8; EMBEDDING_MODEL_DIR is an
+    # optional local copy of the model files for hosts without hub access
+    embedding_backend = create_embedding_backend(
+        st.secrets.get('EMBEDDING_BACKEND', 'torch'),
+        model_dir=st.secrets.get('EMBEDDING_MODEL_DIR')
+    )
+    
+    return RAGChatbot(
+        str(knowledge_base_path), groq_api_key, load_dense=False, llm=llm,
+        embedding_backend=embedding_backend
+    )
+
+@st.cache_resource
+def init_tracing():
+    """Process-wide tracer: in-memory stage stats, plus JSONL and OpenTelemetry export when configured"""
+    return configure_tracing(
+        st.secrets.get('TRACE_JSONL_PATH'),
+        otel=bool(st.secrets.get('TRACE_OTEL', False)),
+        enabled=bool(st.secrets.get('TRACING_ENABLED', True))
+    )
 
 def extract_name_from_message(message: str) -> Optional[str]:
     """Extract name from user message"""
@@ -34,10 +80,6 @@ def extract_name_from_message(message: str) -> Optional[str]:
     if len(msg_lower) < 2:
         return None
     
-    ignore_words = ['hi', 'hello', 'hey', 'yes', 'no', 'okay', 'ok', 'sure', 'thanks', 'thank',
-                    'please', 'good', 'fine', 'great', 'nice', 'morning', 'evening', 'afternoon',
-                    'book', 'appointment', 'help', 'need', 'want', 'can', 'could', 'would', 'my']
-    
     patterns = [
         r"(?:my name is|i'?m|i am|call me|this is|it'?s)\s+([a-z][a-z\s]{1,30})",
         r"^([a-z][a-z]{1,20})$"
@@ -50,222 +92,83 @@ def extract_name_from_message(message: str) -> Optional[str]:
             name_parts = name.split()
             if len(name_parts) > 0:
                 clean_name = ' '.join(name_parts[:2])
-                if clean_name.lower() not in ignore_words and len(clean_name) >= 2:
+                if clean_name.lower() not in IGNORE_NAME_WORDS and len(clean_name) >= 2:
                     return ' '.join(word.capitalize() for word in clean_name.split())
     
     return None
 
-def parse_natural_date(text: str) -> Optional[str]:
-    """Parse natural language date - FIXED VERSION"""
-    text_lower = text.lower().strip()
-    today = datetime.now().date()
-    current_year = today.year
-    
-    # Handle relative dates
-    if 'today' in text_lower:
-        return today.strftime('%Y-%m-%d')
-    if 'tomorrow' in text_lower:
-        return (today + timedelta(days=1)).strftime('%Y-%m-%d')
-    if 'day after tomorrow' in text_lower:
-        return (today + timedelta(days=2)).strftime('%Y-%m-%d')
-    
-    # Month names mapping
-    months = {
-        'jan': 1, 'january': 1, 'feb': 2, 'february': 2, 'mar': 3, 'march': 3,
-        'apr': 4, 'april': 4, 'may': 5, 'jun': 6, 'june': 6,
-        'jul': 7, 'july': 7, 'aug': 8, 'august': 8, 'sep': 9, 'sept': 9, 'september': 9,
-        'oct': 10, 'october': 10, 'nov': 11, 'november': 11, 'dec': 12, 'december': 12
-    }
-    
-    # Parse month and day combinations
-    for month_name, month_num in months.items():
-        # Pattern: "27 october" or "27th october"
-        pattern1 = rf'\b(\d{{1,2}})(?:st|nd|rd|th)?\s+{month_name}\b'
-        match1 = re.search(pattern1, text_lower)
-        if match1:
-            day = int(match1.group(1))
-            try:
-                parsed_date = datetime(current_year, month_num, day).date()
-                # If date is in the past, assume next year
-                if parsed_date < today:
-                    parsed_date = datetime(current_year + 1, month_num, day).date()
-                return parsed_date.strftime('%Y-%m-%d')
-            except ValueError:
-                continue
-        
-        # Pattern: "october 27" or "october 27th"
-        pattern2 = rf'\b{month_name}\s+(\d{{1,2}})(?:st|nd|rd|th)?\b'
-        match2 = re.search(pattern2, text_lower)
-        if match2:
-            day = int(match2.group(1))
-            try:
-                parsed_date = datetime(current_year, month_num, day).date()
-                # If date is in the past, assume next year
-                if parsed_date < today:
-                    parsed_date = datetime(current_year + 1, month_num, day).date()
-                return parsed_date.strftime('%Y-%m-%d')
-            except ValueError:
-                continue
-    
-    # Weekday parsing
-    weekdays = {
-        'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3,
-        'friday': 4, 'saturday': 5, 'sunday': 6,
-        'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6
-    }
-    
-    for day_name, day_num in weekdays.items():
-        if f'next {day_name}' in text_lower or f'this {day_name}' in text_lower:
-            days_ahead = day_num - today.weekday()
-            if days_ahead <= 0:
-                days_ahead += 7
-            target_date = today + timedelta(days=days_ahead)
-            return target_date.strftime('%Y-%m-%d')
-    
-    # Standard date formats
-    pattern_standard = r'\b(\d{4})-(\d{2})-(\d{2})\b'
-    match_standard = re.search(pattern_standard, text)
-    if match_standard:
-        return match_standard.group(0)
-    
-    pattern_slash = r'\b(\d{1,2})[/-](\d{1,2})[/-](\d{4})\b'
-    match_slash = re.search(pattern_slash, text)
-    if match_slash:
-        day, month, year = match_slash.groups()
-        try:
-            parsed_date = datetime(int(year), int(month), int(day)).date()
-            return parsed_date.strftime('%Y-%m-%d')
-        except ValueError:
-            pass
-    
-    return None
+BOOKING_SLOTS = ['date', 'time', 'branch', 'dentist', 'treatment']
 
-def parse_natural_time(text: str) -> Optional[str]:
-    """Parse natural language time"""
-    text_lower = text.lower().strip()
-    
-    pattern_ampm = r'\b(\d{1,2})\s*(am|pm)\b'
-    match_ampm = re.search(pattern_ampm, text_lower)
-    if match_ampm:
-        hour = int(match_ampm.group(1))
-        period = match_ampm.group(2)
-        if period == 'pm' and hour != 12:
-            hour += 12
-        elif period == 'am' and hour == 12:
-            hour = 0
-        return f"{hour:02d}:00"
-    
-    pattern_time_ampm = r'\b(\d{1,2}):(\d{2})\s*(am|pm)\b'
-    match_time_ampm = re.search(pattern_time_ampm, text_lower)
-    if match_time_ampm:
-        hour = int(match_time_ampm.group(1))
-        minute = int(match_time_ampm.group(2))
-        period = match_time_ampm.group(3)
-        if period == 'pm' and hour != 12:
-            hour += 12
-        elif period == 'am' and hour == 12:
-            hour = 0
-        return f"{hour:02d}:{minute:02d}"
-    
-    pattern_24h = r'\b(\d{1,2}):(\d{2})\b'
-    match_24h = re.search(pattern_24h, text)
-    if match_24h:
-        hour = int(match_24h.group(1))
-        minute = int(match_24h.group(2))
-        if 0 <= hour <= 23 and 0 <= minute <= 59:
-            return f"{hour:02d}:{minute:02d}"
-    
-    return None
+def _is_free_text_treatment(user_msg: str, hits: MatchResult) -> bool:
+    """A descriptive message with no other booking details, e.g. 'my tooth hurts when I chew'"""
+    user_lower = user_msg.lower()
+    return (len(user_msg) > 8 and
+            not hits.has('treatment_skip') and
+            not re.search(r'\d{1,2}:\d{2}', user_msg) and
+            not re.search(r'\d{1,2}\s*(am|pm)', user_lower) and
+            not re.search(r'\b(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)', user_lower))
 
-def parse_booking_data(message: str, chat_history: List) -> dict:
-    """Extract booking information from message and chat history"""
-    booking_data = {}
-    
-    all_messages = []
-    for msg in chat_history[-15:]:
-        all_messages.append(msg.message)
-    all_messages.append(message)
-    
-    full_context = ' '.join(all_messages)
-    full_context_lower = full_context.lower()
-    
-    date_str, time_str = extract_datetime_from_conversation(message, chat_history)
+def update_booking_state(slots: dict, message: str, hits: Optional[MatchResult] = None) -> dict:
+    """Return a copy of the booking slots with only the slots this user message mentions updated"""
+    updated = dict(slots)
+    if hits is None:
+        hits = get_matcher().match(message)
     
+    date_str, time_str = extract_latest_datetime([message])
     if date_str:
-        booking_data['date'] = date_str
-    
+        updated['date'] = date_str
     if time_str:
-        booking_data['time'] = time_str
-    
-    if 'dha' in full_context_lower:
-        booking_data['branch'] = 'NeoImplant - DHA'
-    elif 'clifton' in full_context_lower:
-        booking_data['branch'] = 'NeoImplant - Clifton'
-    
-    if 'fatima' in full_context_lower:
-        booking_data['dentist'] = 'Dr. Fatima Khan'
-    elif 'ahmed' in full_context_lower or 'raza' in full_context_lower:
-        booking_data['dentist'] = 'Dr. Ahmed Raza'
-    
-    treatment_keywords = {
-        'crown': 'Dental Crown',
-        'crowning': 'Dental Crown',
-        'scaling': 'Scaling and Polishing',
-        'cleaning': 'Scaling and Polishing',
-        'filling': 'Dental Filling',
-        'implant': 'Dental Implant',
-        'root canal': 'Root Canal Treatment',
-        'extraction': 'Tooth Extraction',
-        'consultation': 'Consultation',
-        'checkup': 'General Checkup',
-        'check-up': 'General Checkup',
-        'discussion': 'Discussion and Diagnosis',
-        'diagnosis': 'Discussion and Diagnosis',
-        'exam': 'Dental Examination',
-        'bleeding gums': 'Gum Treatment',
-        'gum': 'Gum Treatment'
-    }
+        updated['time'] = time_str
     
-    for keyword, treatment in treatment_keywords.items():
-        if keyword in full_context_lower:
-            booking_data['treatment'] = treatment
-            break
-    
-    if 'treatment' not in booking_data:
-        for msg in reversed(chat_history[-10:]):
-            if msg.role == 'user':
-                user_msg = msg.message.strip()
-                user_lower = user_msg.lower()
-                
-                skip_keywords = ['yes', 'no', 'ok', 'okay', 'sure', 'dha', 'clifton', 
-                               'fatima', 'ahmed', 'raza', 'confirm', 'correct', 'book',
-                               'tomorrow', 'today', 'am', 'pm']
-                
-                if (len(user_msg) > 8 and 
-                    not any(skip in user_lower for skip in skip_keywords) and
-                    not re.search(r'\d{1,2}:\d{2}', user_msg) and
-                    not re.search(r'\d{1,2}\s*(am|pm)', user_msg.lower()) and
-                    not re.search(r'\b(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)', user_lower)):
-                    booking_data['treatment'] = user_msg
-                    break
+    # The last branch/dentist mentioned wins ("DHA... actually Clifton")
+    if hits.has('branch'):
+        updated['branch'] = hits.last('branch')
     
-    return booking_data
-
-def extract_datetime_from_conversation(text: str, chat_history: List) -> Tuple[Optional[str], Optional[str]]:
-    """Extract date and time from full conversation"""
-    all_text = text
-    if chat_history:
-        recent = [msg.message for msg in chat_history[-10:]]
-        all_text = ' '.join(recent) + ' ' + text
+    if hits.has('dentist'):
+        updated['dentist'] = hits.last('dentist')
     
-    date_str = parse_natural_date(all_text)
-    time_str = parse_natural_time(all_text)
+    if hits.has('treatment'):
+        updated['treatment'] = hits.first('treatment')
+    elif _is_free_text_treatment(message.strip(), hits):
+        updated['treatment_hint'] = message.strip()
     
-    return date_str, time_str
+    return updated
 
-def check_appointment_conflict(user_id: int, appt_date: date, appt_time: time) -> bool:
-    """Check if appointment slot is already booked"""
-    session = get_session()
+def booking_data_from_state(slots: dict) -> dict:
+    """Booking fields ready for validation; a free-text hint stands in for an unknown treatment"""
+    booking_data = {field: slots[field] for field in BOOKING_SLOTS if slots.get(field)}
+    if 'treatment' not in booking_data and slots.get('treatment_hint'):
+        booking_data['treatment'] = slots['treatment_hint']
+    return booking_data
+
+def _get_booking_state(session, chat_session: ChatSession, is_new_session: bool) -> BookingState:
+    """Load the session's booking state, backfilling it from history for older sessions"""
+    state = chat_session.booking_state if not is_new_session else None
+    if state is not None:
+        return state
+    
+    slots = {}
+    if not is_new_session:
+        # no_autoflush keeps this turn's pending message out of the backfill;
+        # the caller applies it to the slots afterwards
+        with session.no_autoflush:
+            recent_user_messages = session.query(ChatMessage).filter(
+                ChatMessage.session_id == chat_session.id,
+                ChatMessage.role == 'user'
+            ).order_by(ChatMessage.timestamp.desc()).limit(15).all()
+        for msg in reversed(recent_user_messages):
+            slots = update_booking_state(slots, msg.message)
+    
+    state = BookingState(session_id=chat_session.id, slots=slots)
+    session.add(state)
+    chat_session.booking_state = state
+    return state
+
+def check_appointment_conflict(user_id: int, appt_date: date, appt_time: time, session=None) -> bool:
+    """Check if appointment slot is already booked (reuses the caller's session if given)"""
+    owns_session = session is None
+    if owns_session:
+        session = get_session()
     try:
         existing = session.query(Appointment).filter(
             Appointment.user_id == user_id,
@@ -275,28 +178,37 @@ def check_appointment_conflict(user_id: int, appt_date: date, appt_time: time) -
         ).first()
         return existing is not None
     finally:
-        session.close()
+        if owns_session:
+            session.close()
+
+def _slot_taken_response(availability, booking_data: dict, appt_date: date, appt_time: time) -> str:
+    """Reply for an unavailable slot, offering the next free ones instead"""
+    free_slots = availability.next_free_slots(
+        count=3,
+        after=datetime.combine(appt_date, appt_time) - timedelta(hours=1),
+        branch=booking_data['branch'],
+        dentist=booking_data['dentist']
+    )
+    response = f"{booking_data['dentist']} is not available at {booking_data['branch']} on {booking_data['date']} at {booking_data['time']}."
+    if free_slots:
+        return response + f" The next free slots are:\n\n{format_slots(free_slots)}\n\nWhich one would you like?"
+    return response + " Please call us at +92 300 1234567 to find a time."
 
-def check_appointment_query(message: str) -> bool:
+def check_appointment_query(message: str, hits: Optional[MatchResult] = None) -> bool:
     """Check if user is asking about existing appointments"""
-    message_lower = message.lower()
+    if hits is None:
+        hits = get_matcher().match(message)
     
-    booking_words = ['book', 'schedule', 'reserve', 'make appointment', 'want appointment']
-    if any(word in message_lower for word in booking_words):
+    if hits.has('booking_verb'):
         return False
     
-    query_keywords = [
-        'my appointment', 'my appointments', 'show my appointment',
-        'when is my appointment', 'check my appointment',
-        'view my appointment', 'do i have appointment',
-        'any upcoming appointment', 'what appointment do i have'
-    ]
-    
-    return any(keyword in message_lower for keyword in query_keywords)
+    return hits.has('appointment_query')
 
-def get_user_appointments_info(user_id: int) -> str:
-    """Get formatted string of user's upcoming appointments"""
-    session = get_session()
+def get_user_appointments_info(user_id: int, session=None) -> str:
+    """Get formatted string of user's upcoming appointments (reuses the caller's session if given)"""
+    owns_session = session is None
+    if owns_session:
+        session = get_session()
     try:
         today = date.today()
         appointments = session.query(Appointment).filter(
@@ -322,126 +234,161 @@ def get_user_appointments_info(user_id: int) -> str:
             if idx < len(appointments):
                 response += "\n---\n\n"
         
-        response += "\nIf you need to reschedule or cancel any appointment, please let me know!"
+        response += "\nTo cancel an appointment, use Cancel appointment under Upcoming Appointments in the sidebar."
         
         return response
     finally:
-        session.close()
+        if owns_session:
+            session.close()
 
-def handle_chat_message(user_id: int, message: str, session_id: Optional[int] = None) -> dict:
+def _prepare_chat_turn(session, chatbot, user_id: int, message: str, session_id: Optional[int]) -> Optional[dict]:
     """
-    Handle chat message: save to DB, get bot response, handle appointments
-    FIXED: Avoid validation loop by checking if booking is ready before validating
+    Run everything up to the bot reply: session, name, user message, booking.
+    All writes share the caller's session and are only flushed; the caller commits
+    once. Returns None if the chat session does not exist. Otherwise returns a dict
+    with either a ready "bot_response" or an "llm_request" for the chatbot to answer,
+    plus "queued_email" when an outbox email was added to the transaction,
+    "renamed_user_id" when the turn set the patient's name and
+    "title_future" when a new session's title is still being generated.
     """
-    session = get_session()
-    chatbot = get_rag_chatbot()
+    title_future = None
+    tracer = get_tracer()
     
-    try:
-        # Create or get chat session
+    # Create or get chat session
+    with tracer.span("chat.session_lookup", new_session=not session_id):
         if session_id:
-            chat_session = session.query(ChatSession).filter(
+            chat_session = session.query(ChatSession).options(
+                joinedload(ChatSession.booking_state),
+                joinedload(ChatSession.summary)
+            ).filter(
                 ChatSession.id == session_id,
                 ChatSession.user_id == user_id
             ).first()
             
             if not chat_session:
-                return {"success": False, "error": "Chat session not found"}
+                return None
         else:
-            session_title = chatbot.generate_session_title(message)
+            # Heuristic title now; the LLM title is generated alongside the answer
+            # and written by a background task once the turn commits
+            session_title = chatbot.heuristic_session_title(message)
+            title_future = _background_executor.submit(chatbot.generate_session_title, message)
             chat_session = ChatSession(
                 user_id=user_id,
                 title=session_title,
                 created_at=get_karachi_time()
             )
             session.add(chat_session)
-            session.commit()
-            session.refresh(chat_session)
-        
-        current_time = get_karachi_time()
-        
-        # Check for name extraction
-        user_obj = session.query(User).filter(User.id == user_id).first()
-        if not user_obj.full_name or user_obj.full_name.strip() == '':
+            session.flush()
+    
+    current_time = get_karachi_time()
+    
+    # Get user profile (one joined query, or the per-user cache)
+    with tracer.span("chat.profile_load"):
+        user_profile = get_user_profile_dict(user_id, session=session)
+    
+    # Check for name extraction
+    renamed_user_id = None
+    if not user_profile.get('full_name') or user_profile['full_name'].strip() == '':
+        with tracer.span("chat.name_extraction") as span:
             extracted_name = extract_name_from_message(message)
+            span.set(found=extracted_name is not None)
             if extracted_name:
+                user_obj = session.get(User, user_id)
                 user_obj.full_name = extracted_name
-                session.commit()
-        
-        # Save user message
-        user_message = ChatMessage(
-            session_id=chat_session.id,
-            role="user",
-            message=message,
-            timestamp=current_time
-        )
-        session.add(user_message)
-        session.commit()
-        
-        # Get recent messages for context
-        recent_messages = session.query(ChatMessage).filter(
-            ChatMessage.session_id == chat_session.id,
-            ChatMessage.id != user_message.id
-        ).order_by(ChatMessage.timestamp.desc()).limit(20).all()
+                user_profile['full_name'] = extracted_name
+                # The cached profile is dropped after commit, so a concurrent read cannot re-cache the old name
+                renamed_user_id = user_id
+    
+    # Save user message (inserted together with the bot message on commit)
+    user_message = ChatMessage(
+        session_id=chat_session.id,
+        role="user",
+        message=message,
+        timestamp=current_time
+    )
+    session.add(user_message)
+    
+    bot_response = None
+    queued_email = False
+    booked_slot = None
+    
+    # One scan of the message for every intent and entity keyword
+    with tracer.span("chat.intent_match"):
+        hits = get_matcher().match(message)
+    
+    # Check if asking about appointments
+    if check_appointment_query(message, hits):
+        with tracer.span("chat.appointments_query"):
+            bot_response = get_user_appointments_info(user_id, session=session)
+    else:
+        # Update the session's booking slots from this message only
+        with tracer.span("chat.booking_parse") as span:
+            booking_state = _get_booking_state(session, chat_session, is_new_session=not session_id)
+            slots = update_booking_state(booking_state.slots or {}, message, hits)
+            if slots != booking_state.slots:
+                booking_state.slots = slots
+            booking_data = booking_data_from_state(slots)
+            span.set(fields=len(booking_data))
+        has_booking_data = len(booking_data) >= 2
         
-        chat_history = [{"role": msg.role, "message": msg.message} for msg in reversed(recent_messages)]
+        has_booking_keyword = hits.has('booking_confirm')
         
-        # Get user profile
-        user_profile = get_user_profile_dict(user_id)
+        is_booking_request = has_booking_keyword or has_booking_data
         
-        # Check if asking about appointments
-        if check_appointment_query(message):
-            bot_response = get_user_appointments_info(user_id)
-        else:
-            # Check for booking data
-            booking_data = parse_booking_data(message, list(reversed(recent_messages)))
-            has_booking_data = len(booking_data) >= 2
-            
-            booking_keywords = ['book', 'confirm', 'schedule', 'appointment', 'yes', 'correct', 'all correct', 
-                               'proceed', 'go ahead', 'thats right', "that's right", 'perfect']
-            message_lower = message.lower().strip()
-            has_booking_keyword = any(keyword in message_lower for keyword in booking_keywords)
+        # FIXED: Only validate if ALL required fields are present
+        # (otherwise the chatbot asks for the missing ones naturally)
+        if is_booking_request:
+            required_fields = ['date', 'time', 'branch', 'dentist', 'treatment']
+            missing_fields = [field for field in required_fields if field not in booking_data]
             
-            is_booking_request = has_booking_keyword or has_booking_data
-            
-            # FIXED: Only validate if ALL required fields are present
-            if is_booking_request:
-                required_fields = ['date', 'time', 'branch', 'dentist', 'treatment']
-                missing_fields = [field for field in required_fields if field not in booking_data]
-                
-                if not missing_fields:
-                    # All fields present - NOW validate
-                    try:
-                        appt_date = datetime.strptime(booking_data['date'], '%Y-%m-%d').date()
-                        appt_time = datetime.strptime(booking_data['time'], '%H:%M').time()
-                        
-                        chatbot_instance = get_rag_chatbot()
-                        date_valid, date_msg = chatbot_instance.validate_appointment_date(booking_data['date'])
-                        time_valid, time_msg = chatbot_instance.validate_appointment_time(booking_data['time'], booking_data['date'])
+            if not missing_fields:
+                # All fields present - NOW validate
+                availability = get_availability_index()
+                try:
+                    appt_date = datetime.strptime(booking_data['date'], '%Y-%m-%d').date()
+                    appt_time = datetime.strptime(booking_data['time'], '%H:%M').time()
+                    
+                    date_valid, date_msg = chatbot.validate_appointment_date(booking_data['date'])
+                    time_valid, time_msg = chatbot.validate_appointment_time(booking_data['time'], booking_data['date'], booking_data['branch'])
+                    
+                    if not date_valid:
+                        bot_response = date_msg
+                    elif not time_valid:
+                        bot_response = time_msg
+                    elif check_appointment_conflict(user_id, appt_date, appt_time, session=session):
+                        bot_response = "You already have an appointment at this time. Please choose a different slot."
+                    elif not availability.is_free(booking_data['branch'], booking_data['dentist'], appt_date, appt_time):
+                        bot_response = _slot_taken_response(availability, booking_data, appt_date, appt_time)
+                    else:
+                        # Create appointment
+                        appointment = Appointment(
+                            user_id=user_id,
+                            branch=booking_data['branch'],
+                            dentist=booking_data['dentist'],
+                            treatment_type=booking_data['treatment'],
+                            appointment_date=appt_date,
+                            appointment_time=appt_time,
+                            status='scheduled',
+                            created_at=current_time
+                        )
+                        slot = (booking_data['branch'], booking_data['dentist'], appt_date, appt_time)
+                        try:
+                            # The unique slot index rejects a slot someone else booked since
+                            # the availability check; the savepoint keeps the rest of the turn
+                            with session.begin_nested():
+                                session.add(appointment)
+                        except IntegrityError:
+                            availability.book(*slot)
+                            bot_response = _slot_taken_response(availability, booking_data, appt_date, appt_time)
                         
-                        if not date_valid:
-                            bot_response = date_msg
-                        elif not time_valid:
-                            bot_response = time_msg
-                        elif check_appointment_conflict(user_id, appt_date, appt_time):
-                            bot_response = "You already have an appointment at this time. Please choose a different slot."
-                        else:
-                            # Create appointment
-                            appointment = Appointment(
-                                user_id=user_id,
-                                branch=booking_data['branch'],
-                                dentist=booking_data['dentist'],
-                                treatment_type=booking_data['treatment'],
-                                appointment_date=appt_date,
-                                appointment_time=appt_time,
-                                status='scheduled',
-                                created_at=current_time
-                            )
-                            session.add(appointment)
-                            session.commit()
-                            session.refresh(appointment)
+                        if bot_response is None:
+                            booked_slot = slot
                             
-                            # Send confirmation email
-                            user_name = user_obj.full_name or "Patient"
+                            # Start the next booking in this chat from a clean slate
+                            booking_state.slots = {}
+                            
+                            # Confirmation email goes out only if the appointment commits
+                            user_name = user_profile.get('full_name') or "Patient"
                             appointment_details = {
                                 'date': booking_data['date'],
                                 'time': booking_data['time'],
@@ -450,11 +397,14 @@ def handle_chat_message(user_id: int, message: str, session_id: Optional[int] =
                                 'treatment': booking_data['treatment']
                             }
                             
-                            send_appointment_confirmation(user_obj.email, user_name, appointment_details)
+                            with tracer.span("chat.email_enqueue"):
+                                subject, body = build_appointment_confirmation(user_name, appointment_details)
+                                enqueue_email(session, user_profile['email'], subject, body)
+                            queued_email = True
                             
                             bot_response = f"""Perfect! Your appointment is confirmed.
 
-Dear {user_name}, a confirmation email has been sent to {user_obj.email}.
+Dear {user_name}, a confirmation email has been sent to {user_profile['email']}.
 
 Date: {booking_data['date']}
 Time: {booking_data['time']}
@@ -463,47 +413,347 @@ Dentist: {booking_data['dentist']}
 Treatment: {booking_data['treatment']}
 
 Please arrive 10 minutes early. See you soon!"""
-                            
-                    except Exception as e:
-                        bot_response = f"There was an issue creating your appointment: {str(e)}. Please contact us at +92 300 1234567."
-                else:
-                    # Missing fields - let chatbot ask for them naturally
-                    bot_response = chatbot.generate_response(
-                        user_message=message,
-                        chat_history=chat_history,
-                        user_profile=user_profile
-                    )
-            else:
-                # Regular conversation
-                bot_response = chatbot.generate_response(
-                    user_message=message,
-                    chat_history=chat_history,
-                    user_profile=user_profile
-                )
-        
-        # Save bot message
-        bot_message = ChatMessage(
-            session_id=chat_session.id,
-            role="bot",
-            message=bot_response,
-            timestamp=current_time
-        )
-        session.add(bot_message)
-        
-        if hasattr(chat_session, 'updated_at'):
-            chat_session.updated_at = current_time
+                        
+                except Exception as e:
+                    bot_response = f"There was an issue creating your appointment: {str(e)}. Please contact us at +92 300 1234567."
+    
+    # History is only needed when the LLM answers; booking-only turns skip the query
+    llm_request = None
+    summary_update = None
+    if bot_response is None:
+        recent_messages = []
+        summary = chat_session.summary if session_id else None
+        if session_id:
+            # Only messages the rolling summary does not cover yet; no_autoflush
+            # keeps this turn's pending message out of the history
+            with tracer.span("chat.history_query"), session.no_autoflush:
+                query = session.query(ChatMessage).filter(ChatMessage.session_id == chat_session.id)
+                if summary:
+                    query = query.filter(ChatMessage.id > summary.through_message_id)
+                recent_messages = query.order_by(
+                    ChatMessage.timestamp.desc(), ChatMessage.id.desc()
+                ).limit(HISTORY_FETCH_LIMIT).all()
         
-        session.commit()
+        history = [{"id": msg.id, "role": msg.role, "message": msg.message} for msg in reversed(recent_messages)]
+        kept, to_summarize = chatbot.plan_history(history)
+        if to_summarize:
+            # The summary is built from the cursor onwards, so messages older than
+            # the fetch window are covered too
+            summary_update = {
+                "previous_summary": summary.summary if summary else "",
+                "previous_through_id": summary.through_message_id if summary else None,
+                "up_to_id": to_summarize[-1]['id']
+            }
         
-        return {
-            "success": True,
-            "session_id": chat_session.id,
-            "bot_response": bot_response,
-            "timestamp": current_time.isoformat()
+        llm_request = {
+            "user_message": message,
+            "chat_history": kept,
+            "user_profile": user_profile,
+            "history_summary": summary.summary if summary else None
         }
-        
+    
+    return {
+        "chat_session": chat_session,
+        "session_title": chat_session.title,
+        "current_time": current_time,
+        "bot_response": bot_response,
+        "llm_request": llm_request,
+        "queued_email": queued_email,
+        "booked_slot": booked_slot,
+        "renamed_user_id": renamed_user_id,
+        "title_future": title_future,
+        "summary_update": summary_update
+    }
+
+def _save_generated_title(chat_session_id: int, heuristic_title: str, title_future: Future):
+    """Replace the heuristic title with the generated one, unless the title changed meanwhile"""
+    try:
+        title = title_future.result()
+    except Exception as e:
+        print(f"[CHAT ERROR] Title generation failed: {e}")
+        return
+    if not title or title == heuristic_title:
+        return
+    
+    session = get_session()
+    try:
+        session.query(ChatSession).filter(
+            ChatSession.id == chat_session_id,
+            ChatSession.title == heuristic_title
+        ).update({ChatSession.title: title}, synchronize_session=False)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        print(f"[CHAT ERROR] Failed to save session title: {e}")
+    finally:
+        session.close()
+
+def _load_unsummarized_messages(chat_session_id: int, update: dict) -> list:
+    """Messages after the summary cursor up to the update's last evicted one, oldest first"""
+    session = get_session()
+    try:
+        query = session.query(ChatMessage).filter(
+            ChatMessage.session_id == chat_session_id,
+            ChatMessage.id <= update['up_to_id']
+        )
+        if update['previous_through_id'] is not None:
+            query = query.filter(ChatMessage.id > update['previous_through_id'])
+        messages = query.order_by(ChatMessage.id).limit(SUMMARY_FETCH_LIMIT).all()
+        return [{"id": msg.id, "role": msg.role, "message": msg.message} for msg in messages]
+    finally:
+        session.close()
+
+def _update_session_summary(chatbot, chat_session_id: int, update: dict):
+    """Fold evicted messages into the session summary unless another update got there first"""
+    try:
+        messages = _load_unsummarized_messages(chat_session_id, update)
+        if not messages:
+            return
+        new_summary = chatbot.summarize_history(update['previous_summary'], messages)
+        if new_summary:
+            _save_session_summary(chat_session_id, update, new_summary, messages[-1]['id'])
+    except Exception as e:
+        print(f"[CHAT ERROR] History summary failed: {e}")
+    finally:
+        with _summaries_lock:
+            _summaries_in_flight.discard(chat_session_id)
+
+def _save_session_summary(chat_session_id: int, update: dict, new_summary: str, through_id: int):
+    session = get_session()
+    try:
+        row = session.get(ChatSummary, chat_session_id)
+        current_through_id = row.through_message_id if row else None
+        if current_through_id != update['previous_through_id']:
+            return
+        if row is None:
+            row = ChatSummary(session_id=chat_session_id)
+            session.add(row)
+        row.summary = new_summary
+        row.through_message_id = through_id
+        session.commit()
     except Exception as e:
+        session.rollback()
+        print(f"[CHAT ERROR] Failed to save history summary: {e}")
+    finally:
+        session.close()
+
+def _after_commit(turn: dict, chat_session_id: int, chatbot):
+    """Side effects that must only happen once the turn is committed"""
+    if turn['renamed_user_id'] is not None:
+        invalidate_user_profile(turn['renamed_user_id'])
+    if turn['summary_update']:
+        with _summaries_lock:
+            # A turn arriving while the last batch is still being summarized would repeat the call
+            start_summary = chat_session_id not in _summaries_in_flight
+            _summaries_in_flight.add(chat_session_id)
+        if start_summary:
+            _background_executor.submit(_update_session_summary, chatbot, chat_session_id, turn['summary_update'])
+    if turn['title_future'] is not None:
+        heuristic_title = turn['session_title']
+        turn['title_future'].add_done_callback(
+            lambda future: _background_executor.submit(_save_generated_title, chat_session_id, heuristic_title, future)
+        )
+    if turn['booked_slot']:
+        get_availability_index().book(*turn['booked_slot'])
+    if turn['queued_email']:
+        notify_outbox()
+
+def _save_bot_message(session, chat_session: ChatSession, bot_response: str, current_time: datetime):
+    """Persist the bot reply, touch the session and commit the turn"""
+    bot_message = ChatMessage(
+        session_id=chat_session.id,
+        role="bot",
+        message=bot_response,
+        timestamp=current_time
+    )
+    session.add(bot_message)
+    
+    if hasattr(chat_session, 'updated_at'):
+        chat_session.updated_at = current_time
+    
+    with get_tracer().span("chat.commit"):
+        session.commit()
+
+def handle_chat_message(user_id: int, message: str, session_id: Optional[int] = None) -> dict:
+    """
+    Handle chat message: save to DB, get bot response, handle appointments
+    FIXED: Avoid validation loop by checking if booking is ready before validating
+    """
+    session = get_session()
+    chatbot = get_rag_chatbot()
+    
+    with get_tracer().span("chat.turn", stream=False) as turn_span:
+        try:
+            turn = _prepare_chat_turn(session, chatbot, user_id, message, session_id)
+            if turn is None:
+                turn_span.set(found=False)
+                return {"success": False, "error": "Chat session not found"}
+            
+            chat_session = turn['chat_session']
+            chat_session_id = chat_session.id
+            session_title = turn['session_title']
+            current_time = turn['current_time']
+            bot_response = turn['bot_response']
+            turn_span.set(llm=bot_response is None)
+            if bot_response is None:
+                bot_response = chatbot.generate_response(**turn['llm_request'])
+            
+            _save_bot_message(session, chat_session, bot_response, current_time)
+            _after_commit(turn, chat_session_id, chatbot)
+            
+            return {
+                "success": True,
+                "session_id": chat_session_id,
+                "session_title": session_title,
+                "title_pending": turn['title_future'] is not None,
+                "bot_response": bot_response,
+                "timestamp": current_time.isoformat()
+            }
+            
+        except Exception as e:
+            turn_span.record_error(e)
+            session.rollback()
+            return {"success": False, "error": str(e)}
+        finally:
+            session.close()
+
+def _stream_and_persist(chatbot, chat_session_id: int, turn: dict, turn_span=None) -> Iterator[str]:
+    """
+    Yield the bot reply and save it once the stream is finished or closed.
+    This is the streamed turn's second transaction (see handle_chat_message_stream)
+    """
+    tracer = get_tracer()
+    parts = []
+    error = None
+    try:
+        if turn['bot_response'] is not None:
+            parts.append(turn['bot_response'])
+            yield turn['bot_response']
+        else:
+            tokens = chatbot.generate_response_stream(**turn['llm_request'])
+            while True:
+                # The turn span is current only while the chatbot runs, not across yields
+                with tracer.activate(turn_span):
+                    token = next(tokens, None)
+                if token is None:
+                    break
+                parts.append(token)
+                yield token
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        bot_response = ''.join(parts).strip()
+        with tracer.activate(turn_span):
+            if bot_response:
+                session = get_session()
+                try:
+                    chat_session = session.query(ChatSession).filter(ChatSession.id == chat_session_id).first()
+                    if chat_session:
+                        _save_bot_message(session, chat_session, bot_response, turn['current_time'])
+                except Exception as e:
+                    error = error or e
+                    session.rollback()
+                    print(f"[CHAT ERROR] Failed to save streamed reply: {e}")
+                finally:
+                    session.close()
+        if turn_span is not None:
+            tracer.end_span(turn_span, error)
+
+def _drain_reply(tokens: Iterator[str]):
+    """Run a reply stream nobody is reading to its end, so its cleanup saves the reply"""
+    try:
+        for _ in tokens:
+            pass
+    except Exception as e:
+        print(f"[CHAT ERROR] Unread streamed reply failed: {e}")
+
+class ReplyStream:
+    """
+    Token iterator over a streamed reply that always finishes its turn. A generator
+    closed before its first step never runs its finally, so if this is closed or
+    garbage-collected unstarted (a rerun before st.write_stream begins), the reply
+    is generated and saved in the background instead and the turn span still ends
+    """
+
+    def __init__(self, tokens: Iterator[str]):
+        self._tokens = tokens
+        self._started = False
+        self._finished = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        self._started = True
+        try:
+            return next(self._tokens)
+        except StopIteration:
+            self._finished = True
+            raise
+
+    def close(self):
+        if self._finished:
+            return
+        self._finished = True
+        if self._started:
+            # Runs the generator's finally: saves what was streamed so far
+            self._tokens.close()
+        else:
+            _background_executor.submit(_drain_reply, self._tokens)
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+def handle_chat_message_stream(user_id: int, message: str, session_id: Optional[int] = None) -> dict:
+    """
+    Streaming variant of handle_chat_message.
+    Returns {"success", "session_id", "session_title", "title_pending", "timestamp", "stream"} where "stream" is a
+    ReplyStream suitable for st.write_stream; the bot message is persisted once it
+    is exhausted or closed, even if it was never read.
+    
+    Unlike handle_chat_message this commits twice on purpose: the user's turn
+    (session, name, message, booking, outbox email) in one transaction before
+    streaming, the bot message in a second one after. A single transaction would
+    keep a pooled connection and the booking row locks for the whole LLM stream,
+    which the caller drives at the reader's pace and may abandon at any point.
+    """
+    session = get_session()
+    chatbot = get_rag_chatbot()
+    tracer = get_tracer()
+    # Ended by _stream_and_persist, so the turn's duration includes the streamed reply
+    turn_span = tracer.start_span("chat.turn", stream=True)
+    
+    try:
+        with tracer.activate(turn_span):
+            turn = _prepare_chat_turn(session, chatbot, user_id, message, session_id)
+            if turn is None:
+                turn_span.set(found=False)
+                tracer.end_span(turn_span)
+                return {"success": False, "error": "Chat session not found"}
+            chat_session_id = turn['chat_session'].id
+            session_title = turn['session_title']
+            turn_span.set(llm=turn['bot_response'] is None)
+            # First of the two commits: nothing stays open while the reply streams
+            with tracer.span("chat.commit", user_turn=True):
+                session.commit()
+    except Exception as e:
+        tracer.end_span(turn_span, e)
         session.rollback()
         return {"success": False, "error": str(e)}
     finally:
-        session.close()
\ No newline at end of file
+        session.close()
+    
+    _after_commit(turn, chat_session_id, chatbot)
+    
+    return {
+        "success": True,
+        "session_id": chat_session_id,
+        "session_title": session_title,
+        "title_pending": turn['title_future'] is not None,
+        "stream": ReplyStream(_stream_and_persist(chatbot, chat_session_id, turn, turn_span)),
+        "timestamp": turn['current_time'].isoformat()
+    }
@@ -0,0 +1,70 @@
+"""
+Date/time extraction benchmark
+Checks extract_latest_datetime against a corpus of real booking phrasing and
+times it over a typical 10-message history
+
+Usage: python -m utils.date_benchmark [--iterations 2000]
+"""
+import argparse
+from datetime import date
+
+from rag.bench_harness import latency_summary, time_calls
+from utils.date_extraction import extract_latest_datetime
+
+# Monday, so weekday arithmetic in the corpus is easy to check by hand
+CORPUS_TODAY = date(2025, 10, 20)
+
+# (conversation oldest-first, expected date, expected time)
+CORPUS = [
+    (["book appointment 23 Oct 11 AM Dr Fatima DHA for cleaning"], "2025-10-23", "11:00"),
+    (["Can I come tomorrow at 3pm?"], "2025-10-21", "15:00"),
+    (["day after tomorrow 10 am"], "2025-10-22", "10:00"),
+    (["I want october 27th", "actually make it 29 october at 2:30 pm"], "2025-10-29", "14:30"),
+    (["next friday 4pm"], "2025-10-24", "16:00"),
+    (["this monday works"], "2025-10-27", None),
+    (["Friday at 5pm?"], "2025-10-24", "17:00"),
+    (["2025-11-05 14:00"], "2025-11-05", "14:00"),
+    (["05/11/2025 at 9am"], "2025-11-05", "09:00"),
+    (["15 jan please"], "2026-01-15", None),
+    (["10:30 am please"], None, "10:30"),
+    (["tomorrow", "no wait, today at 12 pm"], "2025-10-20", "12:00"),
+    (["12 am"], None, "00:00"),
+    (["September 3rd at 11:00"], "2026-09-03", "11:00"),
+    (["My number is +92 300 1234567"], None, None),
+    (["see you on the 5th of december at 1 pm"], "2025-12-05", "13:00"),
+    (["May I book a cleaning?"], None, None),
+    (["Is Dr Ahmed free on Saturday?", "Got it, Saturday at 11 AM with Dr. Ahmed.", "make it 12pm instead"],
+     "2025-10-25", "12:00"),
+    (["25 October 10am", "Sorry, I meant 26 October"], "2025-10-26", "10:00"),
+    (["Dec 1st at 9:15am"], "2025-12-01", "09:15"),
+]
+
+
+def check_corpus() -> list:
+    failures = []
+    for messages, expected_date, expected_time in CORPUS:
+        got = extract_latest_datetime(messages, CORPUS_TODAY)
+        if got != (expected_date, expected_time):
+            failures.append((messages, (expected_date, expected_time), got))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark date/time extraction")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    failures = check_corpus()
+    print(f"correctness: {len(CORPUS) - len(failures)}/{len(CORPUS)}")
+    for messages, expected, got in failures:
+        print(f"  {messages!r}: expected {expected}, got {got}")
+
+    # Ten-message history, the window the booking parser looks at
+    history = [messages[-1] for messages, _, _ in CORPUS[:10]]
+    _, latencies = time_calls(lambda _: extract_latest_datetime(history, CORPUS_TODAY), range(args.iterations))
+    summary = latency_summary(latencies)
+    print(f"10-message scan: mean {summary['mean_ms'] * 1000:.1f} us, p95 {summary['p95_ms'] * 1000:.1f} us per call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Date and time extraction module
+One precompiled pattern per kind scans each message once and reports every
+mention with its position, so callers can pick the most recent one
+"""
+import re
+from datetime import date, timedelta
+from typing import List, NamedTuple, Optional, Tuple
+
+MONTHS = {
+    'jan': 1, 'january': 1, 'feb': 2, 'february': 2, 'mar': 3, 'march': 3,
+    'apr': 4, 'april': 4, 'may': 5, 'jun': 6, 'june': 6,
+    'jul': 7, 'july': 7, 'aug': 8, 'august': 8, 'sep': 9, 'sept': 9, 'september': 9,
+    'oct': 10, 'october': 10, 'nov': 11, 'november': 11, 'dec': 12, 'december': 12
+}
+
+WEEKDAYS = {
+    'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3,
+    'friday': 4, 'saturday': 5, 'sunday': 6,
+    'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6
+}
+
+RELATIVE_DAYS = {'today': 0, 'tomorrow': 1, 'day after tomorrow': 2}
+
+# Bare weekdays are only recognised by full name; short forms like "sat" or
+# "wed" are too ambiguous without "next"/"this" in front
+FULL_WEEKDAYS = [name for name in WEEKDAYS if len(name) > 3]
+
+def _alternation(words) -> str:
+    # Longest first so "september" wins over "sep" and "day after tomorrow" over "tomorrow"
+    return '|'.join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+
+_MONTH = _alternation(MONTHS)
+_WEEKDAY = _alternation(WEEKDAYS)
+
+DATE_PATTERN = re.compile(
+    rf'\b(?P<relative>{_alternation(RELATIVE_DAYS)})\b'
+    rf'|\b(?P<dm_day>\d{{1,2}})(?:st|nd|rd|th)?\s+(?:of\s+)?(?P<dm_month>{_MONTH})\b'
+    rf'|\b(?P<md_month>{_MONTH})\s+(?P<md_day>\d{{1,2}})(?:st|nd|rd|th)?\b'
+    rf'|\b(?P<wd_mod>next|this)\s+(?P<weekday>{_WEEKDAY})\b'
+    rf'|\b(?P<bare_weekday>{_alternation(FULL_WEEKDAYS)})\b'
+    r'|\b(?P<iso_y>\d{4})-(?P<iso_m>\d{2})-(?P<iso_d>\d{2})\b'
+    r'|\b(?P<dmy_d>\d{1,2})[/-](?P<dmy_m>\d{1,2})[/-](?P<dmy_y>\d{4})\b',
+    re.IGNORECASE
+)
+
+TIME_PATTERN = re.compile(
+    r'\b(?P<hm_h>\d{1,2}):(?P<hm_m>\d{2})\s*(?P<hm_p>am|pm)\b'
+    r'|\b(?P<h_h>\d{1,2})\s*(?P<h_p>am|pm)\b'
+    r'|\b(?P<h24_h>\d{1,2}):(?P<h24_m>\d{2})\b',
+    re.IGNORECASE
+)
+
+class Mention(NamedTuple):
+    kind: str            # 'date' or 'time'
+    value: str           # YYYY-MM-DD or HH:MM
+    message_index: int   # position of the message in the conversation (higher = newer)
+    start: int           # character offset inside the message
+    text: str            # matched text
+
+def _resolve_day_month(day: int, month: int, today: date) -> Optional[date]:
+    try:
+        parsed = date(today.year, month, day)
+        # A date already past this year means next year
+        if parsed < today:
+            parsed = date(today.year + 1, month, day)
+        return parsed
+    except ValueError:
+        return None
+
+def _resolve_date(match: re.Match, today: date) -> Optional[date]:
+    group = match.group
+    if group('relative'):
+        return today + timedelta(days=RELATIVE_DAYS[group('relative').lower()])
+    if group('dm_day'):
+        return _resolve_day_month(int(group('dm_day')), MONTHS[group('dm_month').lower()], today)
+    if group('md_month'):
+        return _resolve_day_month(int(group('md_day')), MONTHS[group('md_month').lower()], today)
+    weekday = group('weekday') or group('bare_weekday')
+    if weekday:
+        days_ahead = WEEKDAYS[weekday.lower()] - today.weekday()
+        if days_ahead <= 0:
+            days_ahead += 7
+        return today + timedelta(days=days_ahead)
+    try:
+        if group('iso_y'):
+            return date(int(group('iso_y')), int(group('iso_m')), int(group('iso_d')))
+        if group('dmy_y'):
+            return date(int(group('dmy_y')), int(group('dmy_m')), int(group('dmy_d')))
+    except ValueError:
+        return None
+    return None
+
+def _date_value(match: re.Match, today: date) -> Optional[str]:
+    resolved = _resolve_date(match, today)
+    return resolved.isoformat() if resolved else None
+
+def _resolve_time(match: re.Match) -> Optional[str]:
+    group = match.group
+    if group('hm_h'):
+        hour, minute, period = int(group('hm_h')), int(group('hm_m')), group('hm_p').lower()
+    elif group('h_h'):
+        hour, minute, period = int(group('h_h')), 0, group('h_p').lower()
+    else:
+        hour, minute, period = int(group('h24_h')), int(group('h24_m')), None
+
+    if period:
+        if not 1 <= hour <= 12:
+            return None
+        if period == 'pm' and hour != 12:
+            hour += 12
+        elif period == 'am' and hour == 12:
+            hour = 0
+    if 0 <= hour <= 23 and 0 <= minute <= 59:
+        return f"{hour:02d}:{minute:02d}"
+    return None
+
+def extract_mentions(messages: List[str], today: Optional[date] = None) -> List[Mention]:
+    """Return every date and time mention across messages (oldest first)"""
+    today = today or date.today()
+    mentions = []
+    for message_index, text in enumerate(messages):
+        for match in DATE_PATTERN.finditer(text):
+            resolved = _date_value(match, today)
+            if resolved:
+                mentions.append(Mention('date', resolved, message_index, match.start(), match.group(0)))
+        for match in TIME_PATTERN.finditer(text):
+            resolved = _resolve_time(match)
+            if resolved:
+                mentions.append(Mention('time', resolved, message_index, match.start(), match.group(0)))
+    return mentions
+
+def latest_mention(mentions: List[Mention], kind: str) -> Optional[Mention]:
+    candidates = [m for m in mentions if m.kind == kind]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda m: (m.message_index, m.start))
+
+def _last_in_message(pattern: re.Pattern, resolve, text: str) -> Optional[str]:
+    for match in reversed(list(pattern.finditer(text))):
+        resolved = resolve(match)
+        if resolved:
+            return resolved
+    return None
+
+def extract_latest_datetime(messages: List[str], today: Optional[date] = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Most recent date and time mentioned in a conversation (oldest message first).
+    Scans newest to oldest and stops once both are found, so the usual case
+    only touches the last message or two.
+    """
+    today = today or date.today()
+    date_str, time_str = None, None
+    for text in reversed(messages):
+        if date_str is None:
+            date_str = _last_in_message(DATE_PATTERN, lambda match: _date_value(match, today), text)
+        if time_str is None:
+            time_str = _last_in_message(TIME_PATTERN, _resolve_time, text)
+        if date_str and time_str:
+            break
+    return date_str, time_str
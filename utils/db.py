@@ -3,10 +3,15 @@ Database connection and operations module
 Handles all database interactions using SQLAlchemy
 """
 import streamlit as st
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Date, Time
+import time
+import copy
+import threading
+from sqlalchemy import create_engine, event, Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Date, Time, JSON, Index, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, joinedload
+from sqlalchemy.pool import QueuePool
 from datetime import datetime
+from typing import Optional
 import pytz
 
 KARACHI_TZ = pytz.timezone('Asia/Karachi')
@@ -73,6 +78,13 @@ class ChatSession(Base):
     
     user = relationship("User", back_populates="chat_sessions")
     messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan")
+    booking_state = relationship("BookingState", back_populates="session", uselist=False, cascade="all, delete-orphan")
+    summary = relationship("ChatSummary", back_populates="session", uselist=False, cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # Sidebar: a user's sessions newest first
+        Index("ix_chat_sessions_user_created", "user_id", "created_at"),
+    )
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
@@ -84,6 +96,33 @@ class ChatMessage(Base):
     timestamp = Column(DateTime(timezone=True), default=get_karachi_time)
     
     session = relationship("ChatSession", back_populates="messages")
+    
+    __table_args__ = (
+        # Chat history: a session's messages in order
+        Index("ix_chat_messages_session_timestamp", "session_id", "timestamp"),
+    )
+
+class BookingState(Base):
+    """Booking slots collected so far in a chat session, updated one message at a time"""
+    __tablename__ = "booking_states"
+    
+    session_id = Column(Integer, ForeignKey("chat_sessions.id"), primary_key=True)
+    slots = Column(JSON, nullable=False, default=dict)
+    updated_at = Column(DateTime(timezone=True), default=get_karachi_time, onupdate=get_karachi_time)
+    
+    session = relationship("ChatSession", back_populates="booking_state")
+
+class ChatSummary(Base):
+    """Rolling summary of the messages of a session that no longer fit the prompt"""
+    __tablename__ = "chat_summaries"
+    
+    session_id = Column(Integer, ForeignKey("chat_sessions.id"), primary_key=True)
+    summary = Column(Text, nullable=False, default="")
+    # Messages up to and including this id are covered by the summary
+    through_message_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), default=get_karachi_time, onupdate=get_karachi_time)
+    
+    session = relationship("ChatSession", back_populates="summary")
 
 class Appointment(Base):
     __tablename__ = "appointments"
@@ -99,51 +138,193 @@ class Appointment(Base):
     created_at = Column(DateTime(timezone=True), default=get_karachi_time)
     
     user = relationship("User", back_populates="appointments")
+    
+    __table_args__ = (
+        # Per-user conflict check and upcoming appointments
+        Index("ix_appointments_user_slot", "user_id", "appointment_date", "appointment_time", "status"),
+        # A dentist can hold only one scheduled appointment per slot; concurrent
+        # bookings of the same slot fail at insert instead of double-booking
+        Index(
+            "uq_appointments_dentist_scheduled_slot",
+            "dentist", "appointment_date", "appointment_time",
+            unique=True,
+            postgresql_where=text("status = 'scheduled'"),
+            sqlite_where=text("status = 'scheduled'")
+        ),
+    )
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    to_email = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body_html = Column(Text, nullable=False)
+    status = Column(String, default="pending", index=True)
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), default=get_karachi_time)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), default=get_karachi_time)
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+    # Set by the worker that leased a "sending" row; results are only recorded under it
+    claim_token = Column(String, nullable=True)
+    
+    __table_args__ = (
+        # Outbox worker: due pending rows
+        Index("ix_email_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
 
 # -----------------------------
 # DATABASE CONNECTION
 # -----------------------------
 
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait for a connection"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+    
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+
+def _pool_setting(db, key: str, default: int) -> int:
+    return int(db.get(key, default))
+
 @st.cache_resource
 def get_engine():
-    """Create database engine from Streamlit secrets"""
+    """
+    Create database engine from Streamlit secrets
+    Optional [database] keys: POOL_SIZE, MAX_OVERFLOW, POOL_RECYCLE, POOL_TIMEOUT, POOL_PRE_PING
+    """
     db = st.secrets["database"]
     db_url = f"postgresql://{db['DB_USER']}:{db['DB_PASS']}@{db['DB_HOST']}:{db['DB_PORT']}/{db['DB_NAME']}"
-    return create_engine(db_url, pool_pre_ping=True)
+    engine = create_engine(
+        db_url,
+        poolclass=InstrumentedQueuePool,
+        pool_size=_pool_setting(db, 'POOL_SIZE', 5),
+        max_overflow=_pool_setting(db, 'MAX_OVERFLOW', 10),
+        # Recycle before typical server/proxy idle timeouts instead of pinging on every checkout
+        pool_recycle=_pool_setting(db, 'POOL_RECYCLE', 1800),
+        pool_timeout=_pool_setting(db, 'POOL_TIMEOUT', 30),
+        pool_pre_ping=str(db.get('POOL_PRE_PING', False)).lower() in ('1', 'true', 'yes'),
+        pool_use_lifo=True,
+        # TCP keepalives surface dead connections without an extra round trip
+        connect_args={
+            "keepalives": 1,
+            "keepalives_idle": 30,
+            "keepalives_interval": 10,
+            "keepalives_count": 3,
+        },
+    )
+    
+    @event.listens_for(engine, "handle_error")
+    def _on_disconnect(context):
+        # SQLAlchemy invalidates the whole pool on a disconnect; log it so it is visible
+        if context.is_disconnect:
+            print(f"[DB] Connection lost, pool invalidated: {context.original_exception}")
+    
+    return engine
+
+@st.cache_resource
+def get_session_factory():
+    """Module-wide sessionmaker bound to the pooled engine"""
+    return sessionmaker(bind=get_engine())
 
 def get_session():
     """Get database session"""
-    engine = get_engine()
-    Session = sessionmaker(bind=engine)
-    return Session()
+    return get_session_factory()()
+
+def get_pool_stats() -> dict:
+    """Connection pool usage, for sizing POOL_SIZE/MAX_OVERFLOW per replica"""
+    pool = get_engine().pool
+    stats = {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+    }
+    if isinstance(pool, InstrumentedQueuePool):
+        with pool._stats_lock:
+            stats.update({
+                "checkouts": pool.checkouts,
+                "timeouts": pool.timeouts,
+                "mean_wait_ms": (pool.total_wait / pool.checkouts * 1000) if pool.checkouts else 0.0,
+                "max_wait_ms": pool.max_wait * 1000,
+            })
+    return stats
+
+_database_ready = False
+_database_lock = threading.Lock()
 
 def init_database():
-    """Initialize database tables"""
-    engine = get_engine()
-    Base.metadata.create_all(engine)
+    """Initialize database tables and apply pending schema migrations, once per process"""
+    global _database_ready
+    from utils.migrations import run_migrations
+    
+    if _database_ready:
+        return
+    with _database_lock:
+        if _database_ready:
+            return
+        engine = get_engine()
+        Base.metadata.create_all(engine)
+        run_migrations(engine)
+        _database_ready = True
 
 # -----------------------------
 # UTILITY FUNCTIONS
 # -----------------------------
 
-def check_profile_complete(user_id: int) -> bool:
-    session = get_session()
-    try:
-        profile = session.query(UserProfile).filter(UserProfile.user_id == user_id).first()
-        clinical = session.query(UserClinicalInfo).filter(UserClinicalInfo.user_id == user_id).first()
-        return profile is not None and clinical is not None
-    finally:
-        session.close()
+# Per-process cache of profile dicts, keyed by user id. Writers of User,
+# UserProfile or UserClinicalInfo must call invalidate_user_profile(); the TTL
+# bounds staleness from writes made by other replicas.
+PROFILE_CACHE_TTL_SECONDS = 300
+_profile_cache = {}
+_profile_cache_lock = threading.Lock()
+
+def invalidate_user_profile(user_id: int):
+    """Drop the cached profile for a user after any profile or name change"""
+    with _profile_cache_lock:
+        _profile_cache.pop(user_id, None)
 
-def get_user_profile_dict(user_id: int) -> dict:
-    session = get_session()
+def _load_profile_entry(user_id: int, session=None) -> Optional[dict]:
+    """Load user, profile and clinical info in one joined query (cached)"""
+    now = time.monotonic()
+    with _profile_cache_lock:
+        entry = _profile_cache.get(user_id)
+        if entry and now - entry["loaded_at"] < PROFILE_CACHE_TTL_SECONDS:
+            return entry
+    
+    owns_session = session is None
+    if owns_session:
+        session = get_session()
     try:
-        user = session.query(User).filter(User.id == user_id).first()
+        user = session.query(User).options(
+            joinedload(User.profile),
+            joinedload(User.clinical_info)
+        ).filter(User.id == user_id).first()
         if not user:
-            return {}
+            return None
         
-        profile = session.query(UserProfile).filter(UserProfile.user_id == user_id).first()
-        clinical = session.query(UserClinicalInfo).filter(UserClinicalInfo.user_id == user_id).first()
+        profile = user.profile
+        clinical = user.clinical_info
         
         profile_data = {
             "phone_number": profile.phone_number if profile else None,
@@ -160,12 +341,30 @@ def get_user_profile_dict(user_id: int) -> dict:
             "last_dental_visit": str(clinical.last_dental_visit) if clinical and clinical.last_dental_visit else None,
         }
         
-        return {
-            "id": user.id,
-            "email": user.email,
-            "full_name": user.full_name,
-            "profile": profile_data,
-            "clinical_info": clinical_data,
+        entry = {
+            "data": {
+                "id": user.id,
+                "email": user.email,
+                "full_name": user.full_name,
+                "profile": profile_data,
+                "clinical_info": clinical_data,
+            },
+            "profile_complete": profile is not None and clinical is not None,
+            "loaded_at": now,
         }
+        with _profile_cache_lock:
+            _profile_cache[user_id] = entry
+        return entry
     finally:
-        session.close()
+        if owns_session:
+            session.close()
+
+def check_profile_complete(user_id: int) -> bool:
+    entry = _load_profile_entry(user_id)
+    return entry is not None and entry["profile_complete"]
+
+def get_user_profile_dict(user_id: int, session=None) -> dict:
+    entry = _load_profile_entry(user_id, session=session)
+    if entry is None:
+        return {}
+    return copy.deepcopy(entry["data"])
@@ -0,0 +1,120 @@
+"""
+Chat turn database benchmark
+Counts SQL statements, transactions and round trips for one handle_chat_message turn
+
+Usage: python -m utils.db_benchmark [--db-url sqlite://] [--turns 5]
+"""
+import time
+import argparse
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from utils.db import Base, User, UserProfile, UserClinicalInfo, get_karachi_time
+
+
+@contextmanager
+def track_statements(engine):
+    """Count statements, BEGINs and COMMITs issued on an engine"""
+    stats = {"statements": 0, "begins": 0, "commits": 0, "rollbacks": 0}
+
+    def on_execute(*_):
+        stats["statements"] += 1
+
+    def on_begin(*_):
+        stats["begins"] += 1
+
+    def on_commit(*_):
+        stats["commits"] += 1
+
+    def on_rollback(*_):
+        stats["rollbacks"] += 1
+
+    listeners = [
+        ("before_cursor_execute", on_execute),
+        ("begin", on_begin),
+        ("commit", on_commit),
+        ("rollback", on_rollback),
+    ]
+    for name, fn in listeners:
+        event.listen(engine, name, fn)
+    try:
+        yield stats
+    finally:
+        for name, fn in listeners:
+            event.remove(engine, name, fn)
+    # Each statement, BEGIN and COMMIT is one client/server round trip on psycopg2
+    stats["round_trips"] = stats["statements"] + stats["begins"] + stats["commits"] + stats["rollbacks"]
+
+
+class _StaticChatbot:
+    """Stands in for RAGChatbot so only database work is measured"""
+
+    def generate_session_title(self, message):
+        return "Benchmark Chat"
+
+    def heuristic_session_title(self, message):
+        return "Benchmark"
+
+    def plan_history(self, messages):
+        return messages, []
+
+    def generate_response(self, **_):
+        return "Benchmark reply"
+
+    def validate_appointment_date(self, date_str):
+        return True, "Valid date"
+
+    def validate_appointment_time(self, time_str, date_str, branch):
+        return True, "Valid time"
+
+
+def _seed_user(Session) -> int:
+    session = Session()
+    try:
+        user = User(email="bench@example.com", password_hash="x", full_name="Bench", is_verified=True,
+                    created_at=get_karachi_time())
+        session.add(user)
+        session.flush()
+        session.add(UserProfile(user_id=user.id, phone_number="0300"))
+        session.add(UserClinicalInfo(user_id=user.id, allergies="None"))
+        session.commit()
+        return user.id
+    finally:
+        session.close()
+
+
+def main():
+    from utils.chatbot import _prepare_chat_turn, _save_bot_message
+
+    parser = argparse.ArgumentParser(description="Count DB round trips per chat turn")
+    parser.add_argument("--db-url", default="sqlite://")
+    parser.add_argument("--turns", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = create_engine(args.db_url)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    user_id = _seed_user(Session)
+    chatbot = _StaticChatbot()
+
+    messages = ["What are your clinic hours?"] + ["Tell me about implants"] * (args.turns - 1)
+    session_id = None
+    for turn_no, message in enumerate(messages, 1):
+        session = Session()
+        start = time.perf_counter()
+        with track_statements(engine) as stats:
+            try:
+                turn = _prepare_chat_turn(session, chatbot, user_id, message, session_id)
+                session_id = turn["chat_session"].id
+                reply = turn["bot_response"] or chatbot.generate_response(**turn["llm_request"])
+                _save_bot_message(session, turn["chat_session"], reply, turn["current_time"])
+            finally:
+                session.close()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"turn {turn_no}: {stats['statements']} statements, {stats['commits']} commits, "
+              f"~{stats['round_trips']} round trips, {elapsed_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Query plan check for the hot chat and appointment queries
+Seeds a throwaway database, applies the migrations and asserts with EXPLAIN
+that each hot query is served by its composite index
+
+Usage: python -m utils.explain_check [--db-url sqlite://] [--users 50]
+Exits non-zero if any query falls back to a table scan
+"""
+import sys
+import random
+import argparse
+from datetime import date, time, timedelta
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from utils.db import Base, User, ChatSession, ChatMessage, Appointment, get_karachi_time
+from utils.migrations import run_migrations
+
+# (label, SQL, params, index expected in the plan)
+HOT_QUERIES = [
+    ("chat history",
+     "SELECT id, role, message FROM chat_messages WHERE session_id = :session_id ORDER BY timestamp",
+     {"session_id": 7}, "ix_chat_messages_session_timestamp"),
+    ("sidebar sessions",
+     "SELECT id, title FROM chat_sessions WHERE user_id = :user_id ORDER BY created_at DESC",
+     {"user_id": 3}, "ix_chat_sessions_user_created"),
+    ("user appointment conflict",
+     "SELECT id FROM appointments WHERE user_id = :user_id AND appointment_date = :appt_date "
+     "AND appointment_time = :appt_time AND status = 'scheduled'",
+     {"user_id": 3, "appt_date": "2030-01-07", "appt_time": "10:00:00"}, "ix_appointments_user_slot"),
+    ("dentist slot",
+     "SELECT id FROM appointments WHERE dentist = :dentist AND appointment_date = :appt_date "
+     "AND appointment_time = :appt_time AND status = 'scheduled'",
+     {"dentist": "Dr. Fatima Khan", "appt_date": "2030-01-07", "appt_time": "10:00:00"},
+     "uq_appointments_dentist_scheduled_slot"),
+]
+
+
+def seed(Session, users: int):
+    """Users with several chat sessions, message histories and appointments"""
+    rng = random.Random(0)
+    session = Session()
+    try:
+        now = get_karachi_time()
+        for user_no in range(users):
+            user = User(email=f"user{user_no}@example.com", password_hash="x", is_verified=True, created_at=now)
+            session.add(user)
+            session.flush()
+            for session_no in range(10):
+                chat = ChatSession(user_id=user.id, title=f"Chat {session_no}",
+                                   created_at=now - timedelta(days=session_no), updated_at=now)
+                session.add(chat)
+                session.flush()
+                session.add_all([
+                    ChatMessage(session_id=chat.id, role="user" if i % 2 == 0 else "bot",
+                                message="Tell me about implants", timestamp=now + timedelta(seconds=i))
+                    for i in range(20)
+                ])
+            for appt_no in range(5):
+                session.add(Appointment(
+                    user_id=user.id,
+                    branch="NeoImplant - DHA",
+                    dentist=rng.choice(["Dr. Fatima Khan", "Dr. Ahmed Raza"]),
+                    treatment_type="Consultation",
+                    appointment_date=date(2030, 1, 1) + timedelta(days=user_no * 5 + appt_no),
+                    appointment_time=time(9 + rng.randrange(8), 0),
+                    status=rng.choice(["scheduled", "scheduled", "cancelled"])
+                ))
+            session.commit()
+    finally:
+        session.close()
+
+
+def query_plan(connection, sql: str, params: dict) -> str:
+    if connection.dialect.name == "postgresql":
+        rows = connection.execute(text("EXPLAIN " + sql), params).fetchall()
+        return "\n".join(row[0] for row in rows)
+    rows = connection.execute(text("EXPLAIN QUERY PLAN " + sql), params).fetchall()
+    return "\n".join(str(row[-1]) for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Assert hot queries use their indexes")
+    parser.add_argument("--db-url", default="sqlite://")
+    parser.add_argument("--users", type=int, default=50)
+    args = parser.parse_args()
+
+    engine = create_engine(args.db_url)
+    Base.metadata.create_all(engine)
+    run_migrations(engine)
+    seed(sessionmaker(bind=engine), args.users)
+
+    failures = 0
+    with engine.connect() as connection:
+        if connection.dialect.name == "postgresql":
+            connection.execute(text("ANALYZE"))
+            # Seeded tables are small enough that a seq scan is cheaper; the check
+            # is whether the index can serve the query, not the planner's cost call
+            connection.execute(text("SET enable_seqscan = off"))
+        for label, sql, params, expected_index in HOT_QUERIES:
+            plan = query_plan(connection, sql, params)
+            ok = expected_index in plan
+            failures += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {label}: expected {expected_index}")
+            if not ok:
+                print("     " + plan.replace("\n", "\n     "))
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,15 +13,43 @@ def generate_verification_code(length=6) -> str:
     """Generate random verification code"""
     return ''.join(random.choices(string.digits, k=length))
 
-def send_verification_email(to_email: str, code: str) -> bool:
-    """Send verification email"""
-    try:
-        message = MIMEMultipart()
-        message["From"] = st.secrets['SMTP_FROM']
-        message["To"] = to_email
-        message["Subject"] = "Dental Care - Email Verification"
-        
-        body = f"""
+def get_smtp_settings() -> dict:
+    """SMTP settings from Streamlit secrets (SMTP_STARTTLS defaults to on)"""
+    return {
+        "host": st.secrets['SMTP_HOST'],
+        "port": int(st.secrets['SMTP_PORT']),
+        "user": st.secrets.get('SMTP_USER'),
+        "password": st.secrets.get('SMTP_PASSWORD'),
+        "from_addr": st.secrets['SMTP_FROM'],
+        "starttls": str(st.secrets.get('SMTP_STARTTLS', True)).lower() in ('1', 'true', 'yes'),
+    }
+
+def smtp_configured() -> bool:
+    """True when the secrets the outbox worker needs to send mail are present"""
+    return all(st.secrets.get(key) for key in ('SMTP_HOST', 'SMTP_PORT', 'SMTP_FROM'))
+
+def build_message(from_addr: str, to_email: str, subject: str, html_body: str) -> MIMEMultipart:
+    message = MIMEMultipart()
+    message["From"] = from_addr
+    message["To"] = to_email
+    message["Subject"] = subject
+    message.attach(MIMEText(html_body, "html"))
+    return message
+
+def open_smtp_connection(settings: dict) -> smtplib.SMTP:
+    """Connect, optionally STARTTLS, and log in"""
+    server = smtplib.SMTP(settings['host'], settings['port'], timeout=30)
+    if settings.get('starttls', True):
+        server.starttls()
+    if settings.get('user'):
+        server.login(settings['user'], settings['password'])
+    return server
+
+def build_verification_email(code: str) -> tuple:
+    """Build verification email: returns (subject, html_body)"""
+    subject = "Dental Care - Email Verification"
+    
+    body = f"""
         <html>
         <body style="font-family: Arial, sans-serif; padding: 20px;">
             <h2 style="color: #5B9FED;">Welcome to Dental Care</h2>
@@ -32,29 +60,14 @@ def send_verification_email(to_email: str, code: str) -> bool:
         </body>
         </html>
         """
-        
-        message.attach(MIMEText(body, "html"))
-        
-        server = smtplib.SMTP(st.secrets['SMTP_HOST'], int(st.secrets['SMTP_PORT']))
-        server.starttls()
-        server.login(st.secrets['SMTP_USER'], st.secrets['SMTP_PASSWORD'])
-        server.send_message(message)
-        server.quit()
-        
-        return True
-    except Exception as e:
-        print(f"Error sending email: {e}")
-        return False
+    
+    return subject, body
 
-def send_appointment_confirmation(to_email: str, user_name: str, appointment_details: dict) -> bool:
-    """Send appointment confirmation email"""
-    try:
-        message = MIMEMultipart()
-        message["From"] = st.secrets['SMTP_FROM']
-        message["To"] = to_email
-        message["Subject"] = "Appointment Confirmation - NeoImplant Dental Studio"
-        
-        body = f"""
+def build_appointment_confirmation(user_name: str, appointment_details: dict) -> tuple:
+    """Build appointment confirmation email: returns (subject, html_body)"""
+    subject = "Appointment Confirmation - NeoImplant Dental Studio"
+    
+    body = f"""
         <html>
         <body style="font-family: Arial, sans-serif; padding: 20px; background-color: #f4f4f4;">
             <div style="max-width: 600px; margin: 0 auto; background-color: white; padding: 30px; border-radius: 10px;">
@@ -99,16 +112,5 @@ def send_appointment_confirmation(to_email: str, user_name: str, appointment_det
         </body>
         </html>
         """
-        
-        message.attach(MIMEText(body, "html"))
-        
-        server = smtplib.SMTP(st.secrets['SMTP_HOST'], int(st.secrets['SMTP_PORT']))
-        server.starttls()
-        server.login(st.secrets['SMTP_USER'], st.secrets['SMTP_PASSWORD'])
-        server.send_message(message)
-        server.quit()
-        
-        return True
-    except Exception as e:
-        print(f"Error sending appointment email: {e}")
-        return False
\ No newline at end of file
+    
+    return subject, body
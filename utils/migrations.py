@@ -0,0 +1,113 @@
+"""
+Schema migrations module
+create_all only creates missing tables, so indexes and constraints added to
+existing tables are applied here, once, in order
+"""
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from utils.db import Appointment, ChatMessage, ChatSession, EmailOutbox
+
+# Kept off Base.metadata so the tables' own create_all stays unaware of it
+_migration_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations", _migration_metadata,
+    Column("id", String, primary_key=True),
+    Column("applied_at", DateTime, nullable=False)
+)
+
+# Any constant works; it only has to be the same for every replica
+MIGRATION_LOCK_ID = 7305112
+
+def _create_model_index(model, name: str) -> Callable[[Connection], None]:
+    """Create an index declared in a model's __table_args__ if it is missing"""
+    def apply(connection: Connection):
+        index = next(ix for ix in model.__table__.indexes if ix.name == name)
+        index.create(bind=connection, checkfirst=True)
+    return apply
+
+class MigrationDeferred(Exception):
+    """A migration that cannot apply to the current data yet; it is retried on the next start"""
+
+def _add_model_column(model, name: str) -> Callable[[Connection], None]:
+    """Add a column declared on a model to its existing table if it is missing"""
+    def apply(connection: Connection):
+        table = model.__table__
+        if name in {column['name'] for column in inspect(connection).get_columns(table.name)}:
+            return
+        column_type = table.c[name].type.compile(dialect=connection.dialect)
+        connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {name} {column_type}"))
+    return apply
+
+def _check_no_double_bookings(connection: Connection):
+    """The unique slot index cannot be built while duplicates exist; defer it until they are resolved"""
+    duplicates = connection.execute(text(
+        "SELECT dentist, appointment_date, appointment_time, COUNT(*) FROM appointments "
+        "WHERE status = 'scheduled' "
+        "GROUP BY dentist, appointment_date, appointment_time HAVING COUNT(*) > 1"
+    )).fetchall()
+    if duplicates:
+        slots = ", ".join(f"{row[0]} {row[1]} {row[2]}" for row in duplicates[:5])
+        raise MigrationDeferred(
+            f"{len(duplicates)} double-booked slot(s) must be resolved first: {slots}"
+        )
+
+# (id, steps) in the order they are applied; never edit or reorder applied entries
+MIGRATIONS: List[Tuple[str, List[Callable[[Connection], None]]]] = [
+    ("0001_hot_query_indexes", [
+        _create_model_index(ChatMessage, "ix_chat_messages_session_timestamp"),
+        _create_model_index(ChatSession, "ix_chat_sessions_user_created"),
+        _create_model_index(Appointment, "ix_appointments_user_slot"),
+        _create_model_index(EmailOutbox, "ix_email_outbox_status_next_attempt"),
+    ]),
+    ("0002_unique_scheduled_slot", [
+        _check_no_double_bookings,
+        _create_model_index(Appointment, "uq_appointments_dentist_scheduled_slot"),
+    ]),
+    ("0003_outbox_claim_token", [
+        _add_model_column(EmailOutbox, "claim_token"),
+    ]),
+]
+
+def _lock_migrations(connection: Connection):
+    """Hold the migration lock until the connection's transaction ends (Postgres only)"""
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+
+def run_migrations(engine: Engine) -> List[str]:
+    """
+    Apply pending migrations, each in its own transaction; returns the ids applied.
+    A deferred migration is rolled back, logged and retried on the next start;
+    later ones still apply, so existing data never stops the app from loading.
+    Only data checks defer, and nothing after them depends on their indexes
+    """
+    with engine.begin() as connection:
+        # Replicas starting together would otherwise race to create the table
+        _lock_migrations(connection)
+        _migration_metadata.create_all(connection)
+        applied = {row.id for row in connection.execute(schema_migrations.select())}
+    applied_now = []
+    for migration_id, steps in MIGRATIONS:
+        if migration_id in applied:
+            continue
+        try:
+            with engine.begin() as connection:
+                # Replicas starting together apply each migration once
+                _lock_migrations(connection)
+                already_applied = connection.execute(
+                    schema_migrations.select().where(schema_migrations.c.id == migration_id)
+                ).first()
+                if already_applied:
+                    continue
+                for step in steps:
+                    step(connection)
+                connection.execute(schema_migrations.insert().values(id=migration_id, applied_at=datetime.utcnow()))
+        except MigrationDeferred as e:
+            print(f"[DB] Migration {migration_id} deferred: {e}")
+            continue
+        applied_now.append(migration_id)
+        print(f"[DB] Applied migration {migration_id}")
+    return applied_now
@@ -0,0 +1,244 @@
+"""
+Email outbox module
+Emails are written to the email_outbox table in the caller's transaction and
+delivered by a background worker over one persistent SMTP connection.
+The worker claims a batch in a short transaction, sends with no transaction
+open, then records the results, so a slow SMTP server never holds row locks
+or a pooled connection.
+"""
+import time
+import random
+import uuid
+import smtplib
+import threading
+from datetime import timedelta
+from typing import Callable, Optional, Union
+
+from utils.db import EmailOutbox, get_karachi_time
+from utils.helpers import build_message, open_smtp_connection
+from rag.tracing import get_tracer
+
+MAX_ATTEMPTS = 6
+BASE_BACKOFF_SECONDS = 30
+MAX_BACKOFF_SECONDS = 3600
+BATCH_SIZE = 20
+# A claimed row is "sending" until its lease (next_attempt_at) runs out; after that
+# another worker may take it over, e.g. when the claiming process died mid-batch.
+# Longer than a batch of sends at the 30 s SMTP timeout.
+LEASE_SECONDS = 900
+
+def enqueue_email(session, to_email: str, subject: str, body_html: str) -> EmailOutbox:
+    """Add an email to the outbox; it is sent only if the caller's transaction commits"""
+    entry = EmailOutbox(
+        to_email=to_email,
+        subject=subject,
+        body_html=body_html,
+        status="pending",
+        attempts=0,
+        next_attempt_at=get_karachi_time(),
+        created_at=get_karachi_time()
+    )
+    session.add(entry)
+    return entry
+
+def backoff_delay(attempts: int) -> float:
+    """Exponential backoff with jitter, in seconds"""
+    delay = min(BASE_BACKOFF_SECONDS * (2 ** (attempts - 1)), MAX_BACKOFF_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+class PersistentSMTP:
+    """
+    Keeps one SMTP connection open across sends and reconnects when it drops.
+    settings may be a callable, read on first use, so a deployment without SMTP
+    secrets only fails when it actually sends mail
+    """
+
+    def __init__(self, settings: Union[dict, Callable[[], dict]], idle_check_seconds: float = 60):
+        self._settings = settings
+        self.idle_check_seconds = idle_check_seconds
+        self._server = None
+        self._last_used = 0.0
+
+    @property
+    def settings(self) -> dict:
+        if callable(self._settings):
+            self._settings = self._settings()
+        return self._settings
+
+    def _connection(self) -> smtplib.SMTP:
+        if self._server is not None and time.monotonic() - self._last_used > self.idle_check_seconds:
+            # Servers drop idle clients; check before reusing
+            try:
+                if self._server.noop()[0] != 250:
+                    self.close()
+            except smtplib.SMTPException:
+                self.close()
+        if self._server is None:
+            self._server = open_smtp_connection(self.settings)
+        return self._server
+
+    def send(self, to_email: str, subject: str, body_html: str):
+        message = build_message(self.settings['from_addr'], to_email, subject, body_html)
+        try:
+            self._connection().send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            # One reconnect attempt for a connection the server closed under us
+            self.close()
+            self._connection().send_message(message)
+        self._last_used = time.monotonic()
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+            self._server = None
+
+class OutboxWorker:
+    """Background thread that drains pending outbox rows"""
+
+    def __init__(self, session_factory: Callable, smtp_settings: Union[dict, Callable[[], dict]],
+                 poll_seconds: float = 5.0):
+        self.session_factory = session_factory
+        self.smtp = PersistentSMTP(smtp_settings)
+        self.poll_seconds = poll_seconds
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="email-outbox", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.smtp.close()
+
+    def notify(self):
+        """Wake the worker right away instead of waiting for the next poll"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                sent = self.drain_once()
+            except Exception as e:
+                print(f"[OUTBOX ERROR] {e}")
+                sent = 0
+            if sent < BATCH_SIZE:
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+
+    def drain_once(self) -> int:
+        """Send one batch of due emails; returns how many rows were processed"""
+        claimed, token = self._claim_batch()
+        if not claimed:
+            return 0
+
+        results = {}
+        for entry in claimed:
+            try:
+                with get_tracer().span("email.send", attempt=entry['attempts'] + 1):
+                    self.smtp.send(entry['to_email'], entry['subject'], entry['body_html'])
+                results[entry['id']] = None
+            except Exception as e:
+                self.smtp.close()
+                results[entry['id']] = e
+
+        self._record_results(results, token)
+        return len(claimed)
+
+    def _claim_batch(self) -> tuple:
+        """
+        Lease due rows to this worker and commit, releasing the row locks before any
+        send. Returns (rows, claim token); every claim writes a fresh token
+        """
+        session = self.session_factory()
+        try:
+            now = get_karachi_time()
+            token = uuid.uuid4().hex
+            entries = session.query(EmailOutbox).filter(
+                EmailOutbox.status.in_(("pending", "sending")),
+                EmailOutbox.next_attempt_at <= now
+            ).order_by(EmailOutbox.id).limit(BATCH_SIZE).with_for_update(skip_locked=True).all()
+
+            claimed = []
+            for entry in entries:
+                entry.status = "sending"
+                entry.next_attempt_at = now + timedelta(seconds=LEASE_SECONDS)
+                entry.claim_token = token
+                claimed.append({
+                    "id": entry.id,
+                    "to_email": entry.to_email,
+                    "subject": entry.subject,
+                    "body_html": entry.body_html,
+                    "attempts": entry.attempts or 0
+                })
+            session.commit()
+            return claimed, token
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def _record_results(self, results: dict, token: str):
+        """
+        Mark claimed rows sent, or schedule a retry. Only rows still carrying this
+        claim's token are updated; a row another worker re-leased after this lease
+        expired belongs to that worker now
+        """
+        session = self.session_factory()
+        try:
+            entries = session.query(EmailOutbox).filter(
+                EmailOutbox.id.in_(list(results)),
+                EmailOutbox.status == "sending",
+                EmailOutbox.claim_token == token
+            ).with_for_update().all()
+            for entry in entries:
+                error = results[entry.id]
+                entry.claim_token = None
+                if error is None:
+                    entry.status = "sent"
+                    entry.sent_at = get_karachi_time()
+                    entry.last_error = None
+                    continue
+                entry.attempts = (entry.attempts or 0) + 1
+                entry.last_error = str(error)
+                if entry.attempts >= MAX_ATTEMPTS:
+                    entry.status = "failed"
+                else:
+                    entry.status = "pending"
+                    entry.next_attempt_at = get_karachi_time() + timedelta(seconds=backoff_delay(entry.attempts))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+_worker_lock = threading.Lock()
+_worker: Optional[OutboxWorker] = None
+
+def start_outbox_worker():
+    """Start the process-wide outbox worker (idempotent)"""
+    global _worker
+    from utils.db import get_session
+    from utils.helpers import get_smtp_settings
+
+    with _worker_lock:
+        if _worker is None:
+            # Settings are read on the first send, not at boot
+            _worker = OutboxWorker(get_session, get_smtp_settings)
+        _worker.start()
+
+def notify_outbox():
+    """Call after committing outbox rows so they go out without waiting for a poll"""
+    if _worker is not None:
+        _worker.notify()
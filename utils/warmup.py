@@ -0,0 +1,73 @@
+"""
+Background warm-up module
+Loads the embedding model and dense index off the request path at app boot
+"""
+import threading
+
+_warmup_lock = threading.Lock()
+_warmup_thread = None
+_warmup_state = {"status": "idle", "error": None}
+_kb_watcher = None
+
+def _run_warmup(chatbot):
+    try:
+        chatbot.load_dense_index()
+        _warmup_state["status"] = "ready"
+        _warmup_state["error"] = None
+    except Exception as e:
+        print(f"[WARMUP ERROR] {e}")
+        _warmup_state["status"] = "failed"
+        _warmup_state["error"] = str(e)
+
+def start_warmup():
+    """Start loading the dense index in a background thread (idempotent)"""
+    global _warmup_thread
+    from utils.chatbot import get_rag_chatbot
+    
+    with _warmup_lock:
+        if _warmup_state["status"] in ("loading", "ready"):
+            return
+        
+        # Cheap: builds the Groq client and keyword index only
+        chatbot = get_rag_chatbot()
+        _warmup_state["status"] = "loading"
+        _warmup_thread = threading.Thread(
+            target=_run_warmup,
+            args=(chatbot,),
+            name="rag-warmup",
+            daemon=True
+        )
+        _warmup_thread.start()
+        start_kb_watcher(chatbot)
+
+def start_kb_watcher(chatbot):
+    """Reload rag/data.json into the running chatbot when it is edited (idempotent)"""
+    global _kb_watcher
+    import streamlit as st
+    from rag.kb_reload import KnowledgeBaseWatcher
+    from rag.keyword_matcher import set_matcher
+    from utils.availability import get_availability_index
+    
+    if _kb_watcher is not None or not st.secrets.get('KB_HOT_RELOAD', True):
+        return
+    try:
+        # Resolved here: the watcher's callbacks run on a watchdog thread
+        availability = get_availability_index()
+        _kb_watcher = KnowledgeBaseWatcher(
+            chatbot,
+            chatbot.knowledge_base_path,
+            listeners=[
+                lambda kb: set_matcher(chatbot.matcher),
+                availability.update_knowledge_base
+            ]
+        ).start()
+    except Exception as e:
+        print(f"[KB WATCHER ERROR] {e}")
+
+def get_warmup_status() -> str:
+    """Return one of: idle, loading, ready, failed"""
+    return _warmup_state["status"]
+
+def is_chatbot_ready() -> bool:
+    """True once dense retrieval is available"""
+    return _warmup_state["status"] == "ready"